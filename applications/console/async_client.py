@@ -0,0 +1,198 @@
+import asyncio
+import functools
+import logging
+import time
+import httpx
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from client_rag import LLMClient
+from config import API_URL, WEAVIATE_URL, MODEL_NAME, MAX_TOKENS, TEMPERATURE, TOP_P, TOP_K, GROUP_CHUNKS_BY_PARENT, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, ASYNC_MAX_CONCURRENCY
+from streaming import aiter_completion_stream, chunk_text
+from weaviate_store import WeaviateClient
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+class AsyncWeaviateClient:
+    """
+    Async retrieval with the same behaviour as WeaviateClient.
+
+    query_documents and query_classes run WeaviateClient's implementations on a pool of
+    `max_concurrency` threads. The async client therefore gets the same hybrid search, MMR,
+    chunk grouping, federated retrieval and retrieval cache, and many conversations can
+    still retrieve concurrently from one event loop.
+    """
+
+    def __init__(self, url: str = WEAVIATE_URL, max_concurrency: int = ASYNC_MAX_CONCURRENCY, store: Optional[WeaviateClient] = None):
+        self.store = store or WeaviateClient(url)
+        # Lets LLMClient register its response cache for invalidation on writes.
+        self.change_listeners = self.store.change_listeners
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="async-retrieval")
+
+    async def _run(self, func, *args, **kwargs):
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def query_documents(self, query: str, class_name: str, top_k: int = 3, **kwargs) -> List[Dict]:
+        """See WeaviateClient.query_documents."""
+        return await self._run(self.store.query_documents, query, class_name, top_k, **kwargs)
+
+    async def query_classes(self, query: str, class_names: List[str], top_k: int = 3, **kwargs) -> List[Dict]:
+        """See WeaviateClient.query_classes."""
+        return await self._run(self.store.query_classes, query, class_names, top_k, **kwargs)
+
+    async def aclose(self):
+        self._executor.shutdown(wait=False)
+
+
+class AsyncLLMClient:
+    """
+    Asyncio counterpart of LLMClient.
+
+    Prompt building, the response cache and answer extraction come from a synchronous
+    LLMClient (`llm_client`) over the same store; only retrieval and generation are awaited,
+    through AsyncWeaviateClient and an httpx.AsyncClient kept separate from it. At most
+    `max_concurrency` requests are in flight at once so one front-end process can keep
+    vLLM's continuous batching busy without overloading it.
+    """
+
+    def __init__(self, weaviate_client: Optional[AsyncWeaviateClient], api_url=API_URL, model_name=MODEL_NAME, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, top_p=TOP_P, max_concurrency: int = ASYNC_MAX_CONCURRENCY, **kwargs):
+        self.weaviate_client = weaviate_client
+        # Extra keyword arguments (history_policy, token_counter, ...) are passed on to LLMClient.
+        self.llm_client = LLMClient(
+            weaviate_client.store if weaviate_client is not None else None,
+            api_url=api_url, model_name=model_name, max_tokens=max_tokens, temperature=temperature, top_p=top_p, **kwargs,
+        )
+        self.api_url = api_url
+        self.http_client = httpx.AsyncClient(
+            timeout=_timeout(),
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.last_answer = None
+        self.last_stream_stats = None
+
+    @property
+    def response_cache(self):
+        return self.llm_client.response_cache
+
+    def extract_answer(self, text: str) -> str:
+        return self.llm_client.extract_answer(text)
+
+    async def prepare_prompt(self, query, class_name="", history=None, enable_rag=False):
+        docs = []
+        references = []
+        if enable_rag:
+            try:
+                if isinstance(class_name, (list, tuple)):
+                    docs = await self.weaviate_client.query_classes(query, list(class_name), top_k=TOP_K, group_by_parent=GROUP_CHUNKS_BY_PARENT)
+                else:
+                    docs = await self.weaviate_client.query_documents(query, class_name, top_k=TOP_K, group_by_parent=GROUP_CHUNKS_BY_PARENT)
+            except Exception as e:
+                print(f"Warning: Failed to fetch documents: {e}")
+            for d in docs:
+                if d["title"] not in references:
+                    references.append(d["title"])
+            logging.info(f"{docs}")
+        # Token counting and history summarization make blocking HTTP calls.
+        prompt = await asyncio.to_thread(self.llm_client.build_prompt, query, history or [], docs)
+        return prompt, references, docs
+
+    async def generate_response(self, query, class_name="", history=None, enable_rag=False, session_id=None):
+        prompt, references, docs = await self.prepare_prompt(query, class_name, history, enable_rag)
+        key = self.llm_client.cache_key(prompt, docs)
+        if key:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return cached
+
+        data = self.llm_client.completion_payload(prompt)
+        async with self.semaphore:
+            response = await self.http_client.post(self.api_url, json=data, headers=self.llm_client.session_headers(session_id))
+        response.raise_for_status()
+        answer = response.json()["choices"][0]["text"]
+
+        if references:
+            answer += f"\nReferences: {str(references)}\n"
+        if key:
+            self.response_cache.set(key, answer, class_name)
+        return answer
+
+    async def stream_response(self, query, class_name="", history=None, enable_rag=False, session_id=None):
+        """Async generator version of LLMClient.stream_response, including the response cache; returns stats via `last_stream_stats`."""
+        prompt, references, docs = await self.prepare_prompt(query, class_name, history, enable_rag)
+        start = time.perf_counter()
+
+        key = self.llm_client.cache_key(prompt, docs)
+        if key:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                yield cached
+                elapsed = time.perf_counter() - start
+                self.last_stream_stats = {"ttft": elapsed, "total_time": elapsed, "usage": None, "cached": True}
+                self.last_answer = self.extract_answer(cached)
+                return
+
+        data = self.llm_client.completion_payload(prompt, stream=True)
+        ttft = None
+        usage = None
+        text = ""
+        async with self.semaphore:
+            async with self.http_client.stream("POST", self.api_url, json=data, headers=self.llm_client.session_headers(session_id)) as response:
+                response.raise_for_status()
+                async for chunk in aiter_completion_stream(response):
+                    usage = chunk.get("usage") or usage
+                    delta = chunk_text(chunk)
+                    if not delta:
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    text += delta
+                    yield delta
+
+        if references:
+            suffix = f"\nReferences: {str(references)}\n"
+            text += suffix
+            yield suffix
+
+        if key:
+            self.response_cache.set(key, text, class_name)
+        self.last_stream_stats = {"ttft": ttft, "total_time": time.perf_counter() - start, "usage": usage, "cached": False}
+        self.last_answer = self.extract_answer(text)
+
+    async def generate_many(self, queries: List[str], class_name="", histories: Optional[List[list]] = None, enable_rag=False) -> List[str]:
+        """Answer independent conversations concurrently; results are in input order."""
+        histories = histories or [None] * len(queries)
+        return await asyncio.gather(*[
+            self.generate_response(q, class_name=class_name, history=h, enable_rag=enable_rag)
+            for q, h in zip(queries, histories)
+        ])
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+async def _demo(questions: List[str], class_name: str):
+    weaviate_client = AsyncWeaviateClient()
+    llm_client = AsyncLLMClient(weaviate_client)
+    try:
+        start = time.perf_counter()
+        answers = await llm_client.generate_many(questions, class_name=class_name, enable_rag=True)
+        for q, a in zip(questions, answers):
+            print(f"You: {q}\nAssistant: {llm_client.extract_answer(a)}\n")
+        print(f"Answered {len(questions)} question(s) in {time.perf_counter() - start:.2f}s")
+    finally:
+        await llm_client.aclose()
+        await weaviate_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo(
+        ["What is data poisoning?", "What is model poisoning?", "Summarize the distribution deck."],
+        class_name="Test_pdf_txt",
+    ))
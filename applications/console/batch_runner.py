@@ -0,0 +1,271 @@
+"""
+Run a JSONL file of requests through the OpenAI-compatible completions endpoint.
+
+Each input line is a JSON object. The question is taken from "prompt", "query", "body" or
+"title" (in that order) and the id from "id" or "request_id" (default: the line number).
+"max_tokens", "temperature" and "top_p" override the defaults per item. With --rag (or
+--class-name) each item's prompt is built with retrieval from its "class_name" (a name or a
+list of names), falling back to --class-name.
+
+Up to --concurrency requests are in flight at once. Results are appended to the output in
+input order as soon as every earlier item has finished. Ids of completed items are appended
+to `<output>.ckpt`, so rerunning the same command after an interruption skips them. Failed
+items are written with an "error" field and are retried on the next run; a run that retries
+failures compacts the output when it ends, keeping the latest row per id in input order.
+
+    python batch_runner.py --input eval.jsonl --output results.jsonl --concurrency 32
+    python batch_runner.py --input eval.jsonl --output results.jsonl --class-name Test_pdf_txt
+"""
+import argparse
+import collections
+import json
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+from client_rag import LLMClient
+from config import (
+    API_URL, WEAVIATE_URL, MODEL_NAME, MAX_TOKENS, TEMPERATURE, TOP_P, VECTOR_STORE,
+    BATCH_INFERENCE_CONCURRENCY, BATCH_INFERENCE_RETRIES, BATCH_INFERENCE_REORDER_WINDOW,
+)
+from http_client import get_http_client
+from load_balancer import get_load_balancer
+from local_store import LocalVectorStore
+from tracing import tracer
+from weaviate_store import WeaviateClient
+
+QUESTION_FIELDS = ("prompt", "query", "body", "title")
+ID_FIELDS = ("id", "request_id")
+OVERRIDE_FIELDS = ("max_tokens", "temperature", "top_p")
+
+
+def read_requests(path: str) -> Iterator[Tuple[str, Dict]]:
+    """Yield (id, record) for each non-empty line, reading the file lazily."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            item_id = next((record[k] for k in ID_FIELDS if record.get(k) is not None), line_number)
+            yield str(item_id), record
+
+
+def load_results(path: str) -> Dict[str, Dict]:
+    """
+    Rows of a results file by id, the last row per id winning.
+
+    A line cut short by an interruption is removed from the file.
+    """
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, "rb+") as f:
+        valid_end = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            valid_end += len(line)
+            result = json.loads(line)
+            results[str(result["id"])] = result
+        f.truncate(valid_end)
+    return results
+
+
+def compact_results(input_path: str, output_path: str):
+    """
+    Rewrite the output with one row per id, the latest one, in input order.
+
+    Rows for ids no longer in the input are kept at the end.
+    """
+    results = load_results(output_path)
+    tmp = f"{output_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for item_id, _ in read_requests(input_path):
+            result = results.pop(item_id, None)
+            if result is not None:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        for result in results.values():
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    os.replace(tmp, output_path)
+
+
+class BatchRunner:
+    """
+    Bounded-concurrency batch inference with in-order, incremental and resumable output.
+
+    `concurrency` requests run at once; up to `reorder_window` submitted items may wait for
+    an earlier, slower item before it is written, which bounds memory on large inputs.
+    """
+
+    def __init__(
+        self,
+        llm_client: LLMClient,
+        concurrency: int = BATCH_INFERENCE_CONCURRENCY,
+        retries: int = BATCH_INFERENCE_RETRIES,
+        reorder_window: int = BATCH_INFERENCE_REORDER_WINDOW,
+        class_name=None,
+        enable_rag: bool = False,
+        progress_every: int = 100,
+    ):
+        self.llm_client = llm_client
+        self.concurrency = concurrency
+        self.retries = retries
+        self.reorder_window = max(reorder_window, concurrency)
+        self.class_name = class_name
+        self.enable_rag = enable_rag
+        self.progress_every = progress_every
+
+    def run_item(self, item_id: str, record: Dict) -> Dict:
+        question = next((record[k] for k in QUESTION_FIELDS if record.get(k)), None)
+        if question is None:
+            return {"id": item_id, "error": f"No question field ({', '.join(QUESTION_FIELDS)}) found."}
+        class_name = record.get("class_name") or self.class_name
+
+        start = time.perf_counter()
+        error = None
+        for attempt in range(self.retries + 1):
+            try:
+                with tracer.span("batch.item", item_id=item_id):
+                    prompt, references, _ = self.llm_client.prepare_prompt(question, class_name or "", enable_rag=self.enable_rag and bool(class_name))
+                    data = self.llm_client.completion_payload(prompt)
+                    data.update({k: record[k] for k in OVERRIDE_FIELDS if k in record})
+                    response = self.llm_client.http_client.post(self.llm_client.api_url, json=data)
+                    response.raise_for_status()
+                    result = response.json()
+                usage = result.get("usage") or {}
+                tracer.observe_usage(usage, self.llm_client.model_name)
+                choice = result["choices"][0]
+                return {
+                    "id": item_id,
+                    "output": choice["text"],
+                    "finish_reason": choice.get("finish_reason"),
+                    "references": references,
+                    "usage": usage,
+                    "latency": time.perf_counter() - start,
+                }
+            except Exception as e:
+                error = str(e)
+                if attempt < self.retries:
+                    time.sleep(min(2 ** attempt, 10))
+        return {"id": item_id, "error": error}
+
+    def run(self, input_path: str, output_path: str, checkpoint_path: Optional[str] = None) -> Dict:
+        """Process every item of `input_path` not completed yet; returns a summary with tokens/sec."""
+        checkpoint_path = checkpoint_path or f"{output_path}.ckpt"
+        if os.path.dirname(output_path):
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        previous = load_results(output_path)
+        # Successful rows count even if their id missed the checkpoint when the run stopped.
+        completed = {item_id for item_id, result in previous.items() if "error" not in result}
+        # Retried items get a second row out of input order, so runs that retry failures (or follow
+        # one that stopped before compacting) compact the output at the end.
+        compact = len(completed) < len(previous)
+        if previous and not compact:
+            with open(output_path, "rb") as f:
+                compact = sum(1 for _ in f) > len(previous)
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                completed.update(line.strip() for line in f if line.strip())
+        if completed:
+            print(f"Resuming: {len(completed)} item(s) already completed.")
+
+        summary = {"completed": 0, "failed": 0, "skipped": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        items = read_requests(input_path)
+        start = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-inference")
+        try:
+            with open(output_path, "a", encoding="utf-8") as out, open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+                queue = collections.deque()  # futures in input order
+                exhausted = False
+                while queue or not exhausted:
+                    while not exhausted and len(queue) < self.reorder_window:
+                        item = next(items, None)
+                        if item is None:
+                            exhausted = True
+                        elif item[0] in completed:
+                            summary["skipped"] += 1
+                        else:
+                            queue.append(pool.submit(self.run_item, *item))
+                    if not queue:
+                        break
+
+                    result = queue.popleft().result()
+                    # The result line is flushed before its id is checkpointed; resuming reads both.
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    out.flush()
+                    if "error" in result:
+                        summary["failed"] += 1
+                        print(f"Item {result['id']} failed: {result['error']}")
+                        continue
+                    checkpoint.write(result["id"] + "\n")
+                    checkpoint.flush()
+                    summary["completed"] += 1
+                    summary["prompt_tokens"] += result["usage"].get("prompt_tokens", 0)
+                    summary["completion_tokens"] += result["usage"].get("completion_tokens", 0)
+                    if self.progress_every and summary["completed"] % self.progress_every == 0:
+                        elapsed = time.perf_counter() - start
+                        print(f"{summary['completed']} item(s) done, {summary['completion_tokens'] / elapsed:.1f} tokens/s.")
+        finally:
+            pool.shutdown(cancel_futures=True)
+            if compact:
+                compact_results(input_path, output_path)
+
+        elapsed = time.perf_counter() - start
+        summary.update({
+            "wall_time": elapsed,
+            "requests_per_second": summary["completed"] / elapsed if elapsed else 0.0,
+            "tokens_per_second": summary["completion_tokens"] / elapsed if elapsed else 0.0,
+        })
+        print(
+            f"Finished in {elapsed:.1f}s: {summary['completed']} completed, {summary['failed']} failed, {summary['skipped']} skipped; "
+            f"{summary['completion_tokens']} completion tokens ({summary['tokens_per_second']:.1f} tokens/s, "
+            f"{summary['requests_per_second']:.2f} requests/s)."
+        )
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="JSONL file of requests")
+    parser.add_argument("--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--checkpoint", help="Completed ids (default: <output>.ckpt)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_INFERENCE_CONCURRENCY)
+    parser.add_argument("--retries", type=int, default=BATCH_INFERENCE_RETRIES)
+    parser.add_argument("--reorder-window", type=int, default=BATCH_INFERENCE_REORDER_WINDOW)
+    parser.add_argument("--api-url", help=f"Completions endpoint (default: balanced over VLLM_BACKENDS at {API_URL})")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS)
+    parser.add_argument("--temperature", type=float, default=TEMPERATURE)
+    parser.add_argument("--top-p", type=float, default=TOP_P)
+    parser.add_argument("--rag", action="store_true", help="Retrieve context for items that name a class")
+    parser.add_argument("--class-name", action="append", help="Class to retrieve from for every item; repeat for federated retrieval")
+    parser.add_argument("--weaviate-url", default=WEAVIATE_URL)
+    parser.add_argument("--progress-every", type=int, default=100)
+    args = parser.parse_args()
+
+    store = None
+    if args.rag or args.class_name:
+        store = LocalVectorStore() if VECTOR_STORE == "local" else WeaviateClient(args.weaviate_url)
+    llm_client = LLMClient(
+        store,
+        api_url=args.api_url or API_URL,
+        model_name=args.model,
+        max_tokens=args.max_tokens,
+        temperature=args.temperature,
+        top_p=args.top_p,
+        # Explicit endpoints are used as given; otherwise spread the load over all replicas.
+        http_client=get_http_client() if args.api_url else get_load_balancer(),
+        verbose=False,
+    )
+    class_name = args.class_name[0] if args.class_name and len(args.class_name) == 1 else args.class_name
+    runner = BatchRunner(
+        llm_client, concurrency=args.concurrency, retries=args.retries, reorder_window=args.reorder_window,
+        class_name=class_name, enable_rag=store is not None, progress_every=args.progress_every,
+    )
+    runner.run(args.input, args.output, args.checkpoint)
+
+
+if __name__ == "__main__":
+    main()
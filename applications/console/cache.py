@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+from config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DIR
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with an optional per-entry TTL (seconds).
+
+    `on_evict(key, value)`, if given, is called outside the lock whenever an entry leaves
+    the cache other than through clear(): evicted, expired, replaced or popped.
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None, on_evict: Optional[Callable[[Any, Any], None]] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        expired = None
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at is None or expires_at >= time.monotonic():
+                self._data.move_to_end(key)
+                return value
+            del self._data[key]
+            expired = [(key, value)]
+        self._evicted(expired)
+        return default
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        evicted = []
+        with self._lock:
+            old = self._data.pop(key, _MISSING)
+            if old is not _MISSING:
+                evicted.append((key, old[1]))
+            self._data[key] = (expires_at, value)
+            while len(self._data) > self.max_entries:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value))
+        self._evicted(evicted)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        if entry is not _MISSING:
+            self._evicted([(key, entry[1])])
+
+    def _evicted(self, entries):
+        if self.on_evict is not None:
+            for key, value in entries:
+                self.on_evict(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    """SQLite-backed key/value tier with TTL and a tag column used for group invalidation."""
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, tag TEXT, expires_at REAL, value TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_tag ON entries (tag)")
+        self.conn.commit()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            row = self.conn.execute("SELECT expires_at, value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            if row[0] is not None and row[0] < time.time():
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.conn.commit()
+                return default
+            return json.loads(row[1])
+
+    def set(self, key: str, value: Any, tag: str = ""):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (key, tag, expires_at, json.dumps(value)),
+            )
+            self.conn.commit()
+
+    def delete_tag(self, tag: str):
+        """Delete entries tagged `tag`, including multi-tags stored "|"-joined."""
+        with self._lock:
+            self.conn.execute("DELETE FROM entries WHERE tag = ? OR '|' || tag || '|' LIKE ?", (tag, f"%|{tag}|%"))
+            self.conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.commit()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of generated answers.
+
+    Keys cover the model, the final prompt, the sampling parameters and the ids of the
+    retrieved documents. Entries are tagged with the class (or classes) they were retrieved
+    from so invalidate_class can drop them when one of those classes' documents change.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: Optional[float] = RESPONSE_CACHE_TTL, cache_dir: Optional[str] = RESPONSE_CACHE_DIR):
+        self.memory = LRUCache(max_entries, ttl, on_evict=self._forget)
+        self.disk = DiskCache(os.path.join(cache_dir, "responses.sqlite"), ttl) if cache_dir else None
+        self._class_keys = {}  # class -> keys in the memory tier, pruned as entries leave it
+        # Reentrant: the memory tier calls _forget from inside _remember.
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, prompt: str, params: Dict, doc_ids: Iterable[str] = ()) -> str:
+        payload = json.dumps(
+            {"model": model, "prompt": prompt, "params": params, "doc_ids": sorted(doc_ids)},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self._remember(key, entry)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry[1] if entry is not None else None
+
+    def set(self, key: str, value: str, class_name: Union[str, Iterable[str]] = ""):
+        names = [class_name] if isinstance(class_name, str) else sorted(class_name)
+        entry = ["|".join(name.lower() for name in names), value]
+        self._remember(key, entry)
+        if self.disk is not None:
+            self.disk.set(key, entry, tag=entry[0])
+
+    def _remember(self, key: str, entry):
+        with self._lock:
+            self.memory.set(key, entry)
+            for tag in entry[0].split("|"):
+                self._class_keys.setdefault(tag, set()).add(key)
+
+    def _forget(self, key: str, entry):
+        # Called by the memory tier for every entry that leaves it.
+        with self._lock:
+            for tag in entry[0].split("|"):
+                keys = self._class_keys.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._class_keys[tag]
+
+    def invalidate_class(self, class_name: str):
+        tag = class_name.lower()
+        with self._lock:
+            keys = self._class_keys.pop(tag, set())
+        for key in keys:
+            self.memory.pop(key)
+        if self.disk is not None:
+            self.disk.delete_tag(tag)
+
+    def clear(self):
+        self.memory.clear()
+        with self._lock:
+            self._class_keys.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.memory),
+            }
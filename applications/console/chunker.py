@@ -0,0 +1,176 @@
+import functools
+import re
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import CHUNK_STRATEGY, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_TOKENIZER_MODEL
+
+Span = Tuple[int, int]
+
+_WORD_RE = re.compile(r"\S+")
+_SENTENCE_RE = re.compile(r"[^.!?\n]+(?:[.!?]+|$)|\n", re.MULTILINE)
+_PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n")
+
+
+def whitespace_tokenizer(text: str) -> List[Span]:
+    """Approximate tokenizer returning (start, end) character spans of whitespace-separated words."""
+    return [m.span() for m in _WORD_RE.finditer(text)]
+
+
+def hf_tokenizer(model_name: str) -> Callable[[str], List[Span]]:
+    """
+    Build a span tokenizer from a Hugging Face tokenizer so chunk sizes match the model's token counts.
+
+    Requires `transformers` (with a fast tokenizer for offset mapping).
+    """
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    def tokenize(text: str) -> List[Span]:
+        encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        return [tuple(span) for span in encoded["offset_mapping"] if span[1] > span[0]]
+
+    return tokenize
+
+
+@functools.lru_cache(maxsize=None)
+def default_tokenizer(model_name: Optional[str] = CHUNK_TOKENIZER_MODEL) -> Callable[[str], List[Span]]:
+    """hf_tokenizer(model_name) when it can be loaded, otherwise whitespace_tokenizer. Loaded once per model."""
+    if model_name is None:
+        return whitespace_tokenizer
+    try:
+        return hf_tokenizer(model_name)
+    except Exception as e:
+        print(f"Warning: Could not load tokenizer '{model_name}' ({e}); chunk sizes are counted in words.")
+        return whitespace_tokenizer
+
+
+class Chunker:
+    """
+    Split documents from DocumentReader into overlapping passages before they are stored.
+
+    Chunk sizes are counted with `tokenizer`, by default the CHUNK_TOKENIZER_MODEL tokenizer
+    (see default_tokenizer).
+
+    Strategies:
+      fixed: windows of `chunk_size` tokens, consecutive windows share `overlap` tokens.
+      sentence / paragraph: pack whole sentences (paragraphs) up to `chunk_size` tokens,
+        repeating trailing units worth up to `overlap` tokens at the start of the next chunk.
+        Units longer than `chunk_size` fall back to fixed windows.
+    """
+
+    STRATEGIES = {"fixed", "sentence", "paragraph"}
+
+    def __init__(
+        self,
+        strategy: str = CHUNK_STRATEGY,
+        chunk_size: int = CHUNK_SIZE,
+        overlap: int = CHUNK_OVERLAP,
+        tokenizer: Optional[Callable[[str], List[Span]]] = None,
+    ):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unsupported chunking strategy: {strategy}")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive.")
+        if not 0 <= overlap < chunk_size:
+            raise ValueError("overlap must be in [0, chunk_size).")
+        self.strategy = strategy
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.tokenizer = tokenizer or default_tokenizer()
+
+    def chunk_document(self, doc: Dict) -> List[Dict]:
+        """
+        Split a {"title", "content"} document into chunk objects.
+
+        Each chunk keeps the parent's "title" and adds "chunk_index" and "offset",
+        the character offset of the chunk within the parent content.
+        """
+        text = doc["content"]
+        if self.strategy == "fixed":
+            spans = self._fixed_spans(text, 0, len(text))
+        else:
+            spans = self._unit_spans(text)
+
+        return [
+            {
+                "title": doc["title"],
+                "content": text[start:end],
+                "chunk_index": idx,
+                "offset": start,
+            }
+            for idx, (start, end) in enumerate(spans)
+        ]
+
+    def chunk_documents(self, docs: List[Dict]) -> List[Dict]:
+        chunks = []
+        for doc in docs:
+            chunks.extend(self.chunk_document(doc))
+        return chunks
+
+    def _fixed_spans(self, text: str, start: int, end: int) -> List[Span]:
+        tokens = [(s + start, e + start) for s, e in self.tokenizer(text[start:end])]
+        if not tokens:
+            return []
+
+        spans = []
+        step = self.chunk_size - self.overlap
+        for i in range(0, len(tokens), step):
+            window = tokens[i:i + self.chunk_size]
+            spans.append((window[0][0], window[-1][1]))
+            if i + self.chunk_size >= len(tokens):
+                break
+        return spans
+
+    def _units(self, text: str) -> List[Span]:
+        if self.strategy == "paragraph":
+            units, pos = [], 0
+            for m in _PARAGRAPH_SPLIT_RE.finditer(text):
+                units.append((pos, m.start()))
+                pos = m.end()
+            units.append((pos, len(text)))
+        else:
+            units = [m.span() for m in _SENTENCE_RE.finditer(text)]
+        stripped = []
+        for s, e in units:
+            unit = text[s:e]
+            if unit.strip():
+                stripped.append((s + len(unit) - len(unit.lstrip()), e - len(unit) + len(unit.rstrip())))
+        return stripped
+
+    def _unit_spans(self, text: str) -> List[Span]:
+        spans = []
+        current = []  # [(start, end, n_tokens)] of the chunk being packed
+        current_tokens = 0
+
+        def flush():
+            if current:
+                spans.append((current[0][0], current[-1][1]))
+
+        for start, end in self._units(text):
+            n_tokens = len(self.tokenizer(text[start:end]))
+            if n_tokens > self.chunk_size:
+                flush()
+                spans.extend(self._fixed_spans(text, start, end))
+                current, current_tokens = [], 0
+                continue
+
+            if current and current_tokens + n_tokens > self.chunk_size:
+                flush()
+                # Carry trailing units into the next chunk as overlap.
+                carried, carried_tokens = [], 0
+                for unit in reversed(current):
+                    if carried_tokens + unit[2] > self.overlap:
+                        break
+                    carried.insert(0, unit)
+                    carried_tokens += unit[2]
+                current, current_tokens = carried, carried_tokens
+                if current_tokens + n_tokens > self.chunk_size:
+                    current, current_tokens = [], 0
+
+            current.append((start, end, n_tokens))
+            current_tokens += n_tokens
+
+        flush()
+        return spans
@@ -1,78 +1,351 @@
+import hashlib
 import logging
 import os
-import requests
+import time
+import uuid
 
 from pathlib import Path
 
-from config import API_URL, MODEL_NAME, MAX_TOKENS, TEMPERATURE, TOP_P, TOP_K
+from cache import LRUCache, ResponseCache
+from config import (
+    API_URL, MODEL_NAME, MAX_TOKENS, TEMPERATURE, TOP_P, TOP_K, GROUP_CHUNKS_BY_PARENT, STREAM_OUTPUT,
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_SAMPLED, PROMPT_TOKEN_BUDGET, HISTORY_POLICY, SUMMARY_MAX_TOKENS,
+    PROMPT_LAYOUT, HISTORY_TRIM_BLOCK, SESSION_HEADER, VECTOR_STORE,
+)
+from chunker import Chunker
 from doc_reader import DocumentReader
+from http_client import get_http_client
+from load_balancer import get_load_balancer
+from local_store import LocalVectorStore
+from manifest import IngestManifest
+from streaming import chunk_text, iter_completion_stream
+from tokens import TokenCounter
+from tracing import tracer
 from weaviate_store import WeaviateClient
 
+ANSWER_INSTRUCTION = "Please answer concisely and directly, you may provide some explanations if suitable. Your final answer shouldn't contain any internal instructions."
+SYSTEM_INSTRUCTION = "You are a helpful assistant. Use the context documents when they are relevant to the question; ignore them otherwise."
+# Allowance for section headers and separators not counted per item.
+PROMPT_OVERHEAD_TOKENS = 32
+
+
 class LLMClient:
-    def __init__(self, weaviate_client, api_url=API_URL, model_name=MODEL_NAME, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, top_p=TOP_P):
+    def __init__(self, weaviate_client, api_url=API_URL, model_name=MODEL_NAME, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, top_p=TOP_P, http_client=None, response_cache=None, cache_sampled=RESPONSE_CACHE_SAMPLED,
+                 prompt_token_budget=PROMPT_TOKEN_BUDGET, history_policy=HISTORY_POLICY, token_counter=None, prompt_layout=PROMPT_LAYOUT, verbose=True):
         self.weaviate_client = weaviate_client
+        self.http_client = http_client or get_http_client()
+        self.response_cache = response_cache
+        if self.response_cache is None and RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache()
+        self.cache_sampled = cache_sampled
+        if self.response_cache is not None and hasattr(weaviate_client, "change_listeners"):
+            weaviate_client.change_listeners.append(self.response_cache.invalidate_class)
         self.api_url = api_url
         self.model_name = model_name
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.top_p = top_p
+        self.last_answer = None
+        self.last_stream_stats = None
+
+        if history_policy not in ("drop_oldest", "summarize"):
+            raise ValueError(f"Unsupported history policy: {history_policy}")
+        self.prompt_token_budget = prompt_token_budget
+        self.history_policy = history_policy
+        self.token_counter = token_counter or TokenCounter(model_name=model_name, api_url=api_url)
+        self._history_summaries = LRUCache(256)
+
+        if prompt_layout not in ("classic", "prefix_stable"):
+            raise ValueError(f"Unsupported prompt layout: {prompt_layout}")
+        self.prompt_layout = prompt_layout
+        # Print each final prompt (debugging aid for the console app).
+        self.verbose = verbose
+
+    @staticmethod
+    def format_doc(doc):
+        return f"{doc['title']}:\n{doc['content']}"
+
+    @staticmethod
+    def format_turn(turn):
+        user_msg, assistant_msg = turn
+        return f"User: {user_msg}\nAssistant: {assistant_msg}\n"
+
+    @staticmethod
+    def new_session_key():
+        """Stable key for one conversation; pass it to generate_response on every turn."""
+        return uuid.uuid4().hex
 
     def build_prompt(self, question, history=None, docs=None):
         history = history or []
         docs = docs or []
+        summary = None
+        if self.prompt_token_budget is not None:
+            docs, history, summary = self.fit_to_budget(question, history, docs)
+        if self.prompt_layout == "prefix_stable":
+            return self._build_prefix_stable_prompt(question, history, docs, summary)
         parts = []
 
         if docs:
-            docs_text = "\n\n".join([f"{d['title']}:\n{d['content']}" for d in docs])
+            docs_text = "\n\n".join([self.format_doc(d) for d in docs])
             parts.append(f"Context documents:\n{docs_text}")
 
+        if summary:
+            parts.append(f"Summary of earlier conversation:\n{summary}")
+
         if history:
-            history_text = ""
-            for user_msg, assistant_msg in history:
-                history_text += f"User: {user_msg}\nAssistant: {assistant_msg}\n"
+            history_text = "".join(self.format_turn(turn) for turn in history)
             parts.append(f"Chat history:\n{history_text.strip()}")
 
         parts.append(f"Answer the user question:\n{question}")
         prompt = "\n\n".join(parts)
-        prompt += "\n\nPlease answer concisely and directly, you may provide some explanations if suitable. Your final answer shouldn't contain any internal instructions."
+        prompt += f"\n\n{ANSWER_INSTRUCTION}"
 
         return prompt
 
-    def generate_response(self, query, class_name="", history=None, enable_rag=False):
+    def _build_prefix_stable_prompt(self, question, history, docs, summary):
+        return build_prefix_stable_prompt(question, history, docs, summary)
+
+    def fit_to_budget(self, question, history, docs):
+        """
+        Select the documents and history turns that fit in `prompt_token_budget`.
+
+        The question and instructions are always kept. Documents are kept in retrieval
+        order while they fit, and the remaining budget goes to the most recent history
+        turns. Older turns are dropped or, with the "summarize" policy, replaced by a
+        rolling summary of at most SUMMARY_MAX_TOKENS, reserved before documents.
+
+        Returns:
+          (docs, history, summary) where summary is None unless turns were summarized.
+        """
+        count = self.token_counter.count
+        budget = self.prompt_token_budget - PROMPT_OVERHEAD_TOKENS
+        budget -= count(f"Answer the user question:\n{question}") + count(ANSWER_INSTRUCTION)
+
+        # Room for the summary is reserved up front so documents cannot crowd it out.
+        summarize = self.history_policy == "summarize" and len(history) > 0 and budget > SUMMARY_MAX_TOKENS
+        if summarize:
+            budget -= SUMMARY_MAX_TOKENS
+
+        kept_docs = []
+        for doc in docs:
+            n = count(self.format_doc(doc))
+            if n <= budget:
+                kept_docs.append(doc)
+                budget -= n
+
+        kept_turns = []
+        for turn in reversed(history):
+            n = count(self.format_turn(turn))
+            if n > budget:
+                break
+            kept_turns.insert(0, turn)
+            budget -= n
+        if self.prompt_layout == "prefix_stable" and len(kept_turns) < len(history):
+            # Drop whole blocks of turns so the history prefix only changes every few turns.
+            start = len(history) - len(kept_turns)
+            start = -(-start // HISTORY_TRIM_BLOCK) * HISTORY_TRIM_BLOCK
+            kept_turns = history[start:]
+        dropped = history[:len(history) - len(kept_turns)]
+
+        if len(kept_docs) < len(docs) or dropped:
+            logging.info(f"Prompt budget: kept {len(kept_docs)}/{len(docs)} document(s), {len(kept_turns)}/{len(history)} turn(s).")
+
+        summary = self.summarize_history(dropped) if summarize and dropped else None
+        return kept_docs, kept_turns, summary
+
+    def summarize_history(self, turns):
+        """
+        Summarize old turns with the model, extending the summary of the longest already-summarized prefix.
+
+        Each turn is summarized once: the next call only folds the newly dropped turns into
+        the cached summary.
+        """
+        digests, digest = [], b""
+        for turn in turns:
+            digest = hashlib.sha1(digest + self.format_turn(turn).encode("utf-8")).digest()
+            digests.append(digest)
+
+        summary, start = "", 0
+        for i in range(len(turns), 0, -1):
+            cached = self._history_summaries.get(digests[i - 1])
+            if cached is not None:
+                summary, start = cached, i
+                break
+        if start == len(turns):
+            return summary
+
+        new_text = "".join(self.format_turn(turn) for turn in turns[start:])
+        prompt = (
+            "Summarize the following conversation between a user and an assistant in a few sentences. "
+            "Keep facts, names and decisions that later questions may refer to.\n\n"
+            + (f"Summary so far:\n{summary}\n\n" if summary else "")
+            + f"Conversation:\n{new_text}\nSummary:"
+        )
+        data = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "max_tokens": SUMMARY_MAX_TOKENS,
+            "temperature": 0,
+            "stream": False,
+        }
+        try:
+            response = self.http_client.post(self.api_url, json=data)
+            response.raise_for_status()
+            summary = response.json()["choices"][0]["text"].strip()
+        except Exception as e:
+            print(f"Warning: Failed to summarize history: {e}")
+            return summary or None
+
+        self._history_summaries.set(digests[-1], summary)
+        return summary
+
+    def prepare_prompt(self, query, class_name="", history=None, enable_rag=False):
+        """
+        Retrieve context and build the prompt. `class_name` may be a list of classes, which
+        are searched together with federated retrieval. Returns (prompt, references, docs).
+        """
         if history is None:
             history = []
 
         docs = []
+        references = []
         if enable_rag:
             try:
-                docs = self.weaviate_client.query_documents(query=query, class_name=class_name, top_k=TOP_K)
-                references = []
+                with tracer.span("rag.retrieval", class_name=class_name) as span:
+                    if isinstance(class_name, (list, tuple)):
+                        docs = self.weaviate_client.query_classes(query, list(class_name), top_k=TOP_K, group_by_parent=GROUP_CHUNKS_BY_PARENT)
+                    else:
+                        docs = self.weaviate_client.query_documents(query=query, class_name=class_name, top_k=TOP_K, group_by_parent=GROUP_CHUNKS_BY_PARENT)
+                    span.set(documents=len(docs))
                 for d in docs:
-                    references.append(d["title"])
+                    if d["title"] not in references:
+                        references.append(d["title"])
                 logging.info(f"{docs}")
             except Exception as e:
                 print(f"Warning: Failed to fetch documents: {e}")
 
-        prompt = self.build_prompt(query, history, docs)
-        print(f"Prompt: {prompt}")
+        with tracer.span("rag.build_prompt"):
+            prompt = self.build_prompt(query, history, docs)
+        if self.verbose:
+            print(f"Prompt: {prompt}")
+        return prompt, references, docs
+
+    def completion_payload(self, prompt, stream=False):
         data = {
-            "model": MODEL_NAME,
+            "model": self.model_name,
             "prompt": prompt,
-            "max_tokens": MAX_TOKENS,
-            "temperature": TEMPERATURE,
-            "top_p": TOP_P,
-            "stream": False,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "stream": stream,
         }
+        if stream:
+            data["stream_options"] = {"include_usage": True}
+        return data
+
+    def cache_key(self, prompt, docs):
+        """Response cache key, or None when caching does not apply (no cache, or sampling without opt-in)."""
+        if self.response_cache is None or not (self.temperature == 0 or self.cache_sampled):
+            return None
+        params = {"max_tokens": self.max_tokens, "temperature": self.temperature, "top_p": self.top_p}
+        doc_ids = [(d.get("_additional") or {}).get("id") or d["title"] for d in docs]
+        return ResponseCache.make_key(self.model_name, prompt, params, doc_ids)
+
+    @staticmethod
+    def session_headers(session_id):
+        return {SESSION_HEADER: session_id} if session_id else {}
+
+    def generate_response(self, query, class_name="", history=None, enable_rag=False, session_id=None):
+        with tracer.span("rag.request", class_name=class_name, stream=False) as request_span:
+            prompt, references, docs = self.prepare_prompt(query, class_name, history, enable_rag)
+            key = self.cache_key(prompt, docs)
+            if key:
+                cached = self.response_cache.get(key)
+                if cached is not None:
+                    request_span.set(cached=True)
+                    return cached
+
+            data = self.completion_payload(prompt)
+            with tracer.span("llm.generate", model=self.model_name) as span:
+                response = self.http_client.post(self.api_url, json=data, headers=self.session_headers(session_id))
+                response.raise_for_status()
+                result = response.json()
+                usage = result.get("usage")
+                span.set(usage=usage)
+            tracer.observe_usage(usage, self.model_name)
+            answer = result["choices"][0]["text"]
+
+            if references:
+                answer += f"\nReferences: {str(references)}\n"
+            if key:
+                self.response_cache.set(key, answer, class_name)
+            return answer
+
+    def stream_response(self, query, class_name="", history=None, enable_rag=False, session_id=None):
+        """
+        Stream the answer token by token from vLLM's SSE endpoint.
+
+        Yields text deltas as they arrive, followed by the References suffix. Once the
+        generator is exhausted, `last_answer` holds the full text after extract_answer and
+        `last_stream_stats` holds time-to-first-token, total time and token usage.
+        """
+        with tracer.span("rag.request", class_name=class_name, stream=True) as request_span:
+            prompt, references, docs = self.prepare_prompt(query, class_name, history, enable_rag)
+            start = time.perf_counter()
 
-        response = requests.post(API_URL, json=data)
-        response.raise_for_status()
-        answer = response.json()["choices"][0]["text"]
+            key = self.cache_key(prompt, docs)
+            if key:
+                cached = self.response_cache.get(key)
+                if cached is not None:
+                    request_span.set(cached=True)
+                    yield cached
+                    elapsed = time.perf_counter() - start
+                    self.last_stream_stats = {"ttft": elapsed, "total_time": elapsed, "usage": None, "cached": True}
+                    self.last_answer = self.extract_answer(cached)
+                    return
 
-        if references:
-            answer += f"\nReferences: {str(references)}\n"
-        return answer
+            data = self.completion_payload(prompt, stream=True)
+            ttft = None
+            usage = None
+            text = ""
+            generate_span = tracer.span("llm.generate", model=self.model_name, stream=True)
+            with generate_span, self.http_client.post(self.api_url, json=data, stream=True, headers=self.session_headers(session_id)) as response:
+                response.raise_for_status()
+                for chunk in iter_completion_stream(response):
+                    usage = chunk.get("usage") or usage
+                    delta = chunk_text(chunk)
+                    if not delta:
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                        # vLLM does not report queueing separately; TTFT covers queue + prefill.
+                        tracer.observe("llm_time_to_first_token_seconds", ttft, self.model_name)
+                    text += delta
+                    yield delta
+                generate_span.set(usage=usage, ttft=ttft)
+            tracer.observe_usage(usage, self.model_name)
+
+            if references:
+                suffix = f"\nReferences: {str(references)}\n"
+                text += suffix
+                yield suffix
+
+            if key:
+                self.response_cache.set(key, text, class_name)
+            self.last_stream_stats = {
+                "ttft": ttft,
+                "total_time": time.perf_counter() - start,
+                "usage": usage,
+                "cached": False,
+            }
+            self.last_answer = self.extract_answer(text)
+            logging.info(f"Stream stats: {self.last_stream_stats}")
 
     def extract_answer(self, text: str) -> str:
+        with tracer.span("rag.extract_answer"):
+            return self._extract_answer(text)
+
+    def _extract_answer(self, text: str) -> str:
         # Split text by separator lines (---)
         chunks = [chunk.strip() for chunk in text.split('---')]
         
@@ -95,6 +368,30 @@ class LLMClient:
         return first_chunk
 
 
+def build_prefix_stable_prompt(question, history=None, docs=None, summary=None):
+    """
+    Prompt in the "prefix_stable" layout, shared by the console client and the Streamlit app.
+
+    Everything up to the end of the history is byte-identical to the previous turn's prompt
+    plus one appended turn, so vLLM can reuse its cached KV blocks. Only the per-turn
+    documents and question come after it.
+    """
+    parts = [f"{SYSTEM_INSTRUCTION} {ANSWER_INSTRUCTION}"]
+
+    if summary:
+        parts.append(f"Summary of earlier conversation:\n{summary}")
+
+    if history:
+        parts.append("Chat history:\n" + "".join(LLMClient.format_turn(turn) for turn in history))
+
+    if docs:
+        docs_text = "\n\n".join([LLMClient.format_doc(d) for d in docs])
+        parts.append(f"Context documents:\n{docs_text}")
+
+    parts.append(f"Answer the user question:\n{question}")
+    return "\n\n".join(parts)
+
+
 if __name__ == "__main__":
     conversation_history = []
     doc_paths = [
@@ -108,19 +405,26 @@ if __name__ == "__main__":
     class_name = "Test_pdf_txt" # weaviate will capitalize first letter
 
     # Initialize required instances
-    weaviate_client = WeaviateClient()
-    llm_client = LLMClient(weaviate_client)
+    # VECTOR_STORE = "local" runs without the Weaviate and t2v containers.
+    manifest = IngestManifest()
+    weaviate_client = LocalVectorStore() if VECTOR_STORE == "local" else WeaviateClient(manifest=manifest)
+    llm_client = LLMClient(weaviate_client, http_client=get_load_balancer())
+    session_id = llm_client.new_session_key()
     doc_reader = DocumentReader()
+    chunker = Chunker()
     
-    # Upload docs
+    # Upload docs, split into passages. Only new or modified files are re-ingested;
+    # files removed from doc_paths are deleted from the class.
     if doc_paths:
         for doc_path in doc_paths:
-            docs_to_upload.append(doc_reader.read_document(Path(doc_path)))    
+            docs_to_upload.append(doc_reader.read_document(Path(doc_path)))
 
     if docs_to_upload:
         created = weaviate_client.create_class(class_name)
-        if created:
-            weaviate_client.upload_documents(class_name, docs_to_upload)
+        if created and isinstance(weaviate_client, LocalVectorStore):
+            weaviate_client.upload_documents(class_name, chunker.chunk_documents(docs_to_upload))
+        elif created:
+            weaviate_client.sync_documents(class_name, docs_to_upload, chunker=chunker, prune=True)
 
     # Set enable_rag
     if weaviate_client.get_classes():
@@ -146,10 +450,20 @@ if __name__ == "__main__":
         if q.lower() == "exit":
             break
 
-        response = llm_client.generate_response(query=q, class_name=class_name, history=conversation_history, enable_rag=enable_rag)
-        answer = llm_client.extract_answer(response)
-        print()
-        print("Assistant:", answer)
+        if STREAM_OUTPUT:
+            print()
+            print("Assistant: ", end="", flush=True)
+            for token in llm_client.stream_response(query=q, class_name=class_name, history=conversation_history, enable_rag=enable_rag, session_id=session_id):
+                print(token, end="", flush=True)
+            print()
+            answer = llm_client.last_answer
+            if llm_client.last_stream_stats["ttft"] is not None:
+                print(f"(time to first token: {llm_client.last_stream_stats['ttft']:.2f}s)")
+        else:
+            response = llm_client.generate_response(query=q, class_name=class_name, history=conversation_history, enable_rag=enable_rag, session_id=session_id)
+            answer = llm_client.extract_answer(response)
+            print()
+            print("Assistant:", answer)
         print("*"*30)
         conversation_history.append((q, answer))
 
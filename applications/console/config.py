@@ -12,7 +12,7 @@ MODEL_NAME = "Qwen/Qwen2.5-7B-Instruct"
 # MODEL_NAME = "mistralai/Mistral-7B-Instruct-v0.3"
 
 # Embedding model name or config (if you have one)
-EMBEDDING_MODEL = "your-embedding-model-name-or-id"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
 # Number of top documents to retrieve from Weaviate
 TOP_K = 3
@@ -21,3 +21,170 @@ TOP_K = 3
 MAX_TOKENS = 600
 TEMPERATURE = 0.4
 TOP_P = 0.9
+
+# Batched ingestion into Weaviate
+BATCH_SIZE = 100
+BATCH_NUM_WORKERS = 2
+BATCH_DYNAMIC = True
+BATCH_MAX_RETRIES = 3
+
+# Chunking of documents before upload ("fixed", "sentence" or "paragraph"); sizes are in tokens
+CHUNK_STRATEGY = "sentence"
+CHUNK_SIZE = 256
+CHUNK_OVERLAP = 32
+# Hugging Face tokenizer that chunk sizes are counted in (the embedding model's, since it sees the chunks).
+# Falls back to whitespace-separated words when `transformers` or the tokenizer is unavailable; None always uses words.
+CHUNK_TOKENIZER_MODEL = EMBEDDING_MODEL
+
+# Merge retrieved chunks of the same document into one context entry
+GROUP_CHUNKS_BY_PARENT = False
+
+# PDF text extraction: worker processes (1 disables the pool), pages per worker task
+# and on-disk cache of extracted text (None disables caching)
+PDF_WORKERS = 4
+PDF_PAGES_PER_TASK = 25
+EXTRACTION_CACHE_DIR = ".cache/extraction"
+
+# Local SQLite manifest of ingested documents (content hash -> object ids) for incremental re-ingestion
+MANIFEST_PATH = ".cache/manifest.sqlite"
+
+# Stream tokens to the console as they are generated
+STREAM_OUTPUT = True
+
+# Shared HTTP client for the completions endpoint: connection pool and timeouts (seconds).
+# The read timeout bounds the wait for each chunk; the total timeout (None = unlimited) bounds the whole request.
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 32
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 120
+HTTP_TOTAL_TIMEOUT = None
+
+# Weaviate client connection pool and (connect, read) timeouts
+WEAVIATE_POOL_CONNECTIONS = 4
+WEAVIATE_POOL_MAXSIZE = 32
+WEAVIATE_TIMEOUT = (5, 60)
+
+# Async client: maximum number of in-flight requests per client
+ASYNC_MAX_CONCURRENCY = 64
+
+# Answer cache for repeated questions. Only used when temperature is 0 unless RESPONSE_CACHE_SAMPLED is set.
+# RESPONSE_CACHE_DIR enables the on-disk tier (None keeps the cache in memory only).
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 3600
+RESPONSE_CACHE_DIR = None
+RESPONSE_CACHE_SAMPLED = False
+
+# Retrieval result cache (per class, invalidated on writes) and query embedding cache.
+# Set T2V_INFERENCE_URL to the t2v-transformers container (see weaviate/docker-compose.yml) to embed
+# queries client-side, so repeated query strings skip the vectorizer.
+RETRIEVAL_CACHE_SIZE = 1024
+RETRIEVAL_CACHE_TTL = 600
+QUERY_EMBEDDING_CACHE_SIZE = 4096
+T2V_INFERENCE_URL = None
+
+# Token budget for prompt assembly. History beyond the budget is dropped ("drop_oldest")
+# or folded into a rolling summary generated by the model ("summarize").
+MAX_MODEL_LEN = 32768
+PROMPT_TOKEN_BUDGET = MAX_MODEL_LEN - MAX_TOKENS
+HISTORY_POLICY = "drop_oldest"
+SUMMARY_MAX_TOKENS = 256
+# vLLM /tokenize endpoint; None uses the one on the same server as the client's completions URL.
+TOKENIZE_URL = None
+TOKEN_COUNT_CACHE_SIZE = 8192
+# After /tokenize fails, count locally for this many seconds before trying the server again.
+TOKENIZE_RETRY_AFTER = 30
+
+# Prompt layout: "classic" (documents, history, question) or "prefix_stable" (fixed instructions,
+# append-only history, then documents and question at the tail) so vLLM's prefix cache is reused
+# across turns. In prefix_stable, history is trimmed in blocks of turns to keep the prefix stable.
+PROMPT_LAYOUT = "prefix_stable"
+HISTORY_TRIM_BLOCK = 4
+# Header carrying the conversation's session key, for sticky routing to one backend
+SESSION_HEADER = "X-Session-ID"
+
+# Per-stage tracing and metrics. Disabled by default (near-zero overhead).
+# TRACE_JSONL_PATH appends one JSON line per finished span; METRICS_PORT serves Prometheus text on /metrics.
+TRACING_ENABLED = False
+TRACE_JSONL_PATH = None
+METRICS_PORT = None
+
+# vLLM server lifecycle (VLLMServerManager).
+# VLLM_SERVER_COMMAND overrides `vllm serve`, e.g. a stub server; "{model}", "{host}" and "{port}" are substituted.
+VLLM_SERVER_COMMAND = None
+VLLM_READY_TIMEOUT = 600
+VLLM_READY_POLL_MIN = 0.05
+VLLM_READY_POLL_MAX = 0.5
+# Representative prompts sent before a model is reported ready, so the first user request does not pay warm-up.
+VLLM_WARMUP_PROMPTS = []
+VLLM_WARMUP_MAX_TOKENS = 16
+
+# Resident model pool (ModelServerPool): up to VLLM_POOL_SIZE servers on consecutive ports from VLLM_POOL_BASE_PORT.
+# VLLM_POOL_DEVICE_SETS gives each slot its CUDA_VISIBLE_DEVICES, e.g. ["0,1", "2,3"]; None shares all devices.
+VLLM_POOL_SIZE = 1
+VLLM_POOL_BASE_PORT = 8000
+VLLM_POOL_DEVICE_SETS = None
+VLLM_TENSOR_PARALLEL_SIZE = 4
+VLLM_GPU_MEMORY_UTILIZATION = 0.9
+# Per-model overrides, e.g. {"Qwen/Qwen2.5-7B-Instruct": {"tensor_parallel_size": 1, "gpu_memory_utilization": 0.4}}
+VLLM_MODEL_OPTIONS = {}
+
+# Routing across vLLM replicas (LoadBalancer). Requests keep their path; the origin is replaced by the chosen backend.
+VLLM_BACKENDS = ["http://localhost:8000"]
+# "least_outstanding" or "queue_depth" (adds waiting/running counts scraped from each backend's /metrics)
+LB_POLICY = "least_outstanding"
+LB_HEALTH_INTERVAL = 5
+LB_MAX_FAILURES = 3
+LB_EJECTION_TIME = 30
+# A session stays on its preferred backend unless that backend has this many more requests in flight than the least loaded one.
+LB_AFFINITY_SLACK = 4
+
+# Document viewer (Streamlit): documents listed per page. Content is fetched per document on demand.
+VIEWER_PAGE_SIZE = 20
+
+# Objects per request when iterating a whole class with the `after` cursor.
+ITER_PAGE_SIZE = 500
+
+# Ids per batch delete request (sent as one ContainsAny filter).
+DELETE_BATCH_SIZE = 1000
+
+# Retrieval mode: "vector" (nearText/nearVector with certainty) or "hybrid" (BM25 + vector).
+RETRIEVAL_MODE = "vector"
+# Hybrid weighting: 0 is pure BM25, 1 is pure vector. Fusion is "relativeScoreFusion" or "rankedFusion".
+HYBRID_ALPHA = 0.5
+HYBRID_FUSION = "relativeScoreFusion"
+# Maximal marginal relevance: re-rank MMR_FETCH_K candidates down to top_k. 1.0 is pure relevance.
+# None (default) disables it; e.g. 0.7 trades some relevance for more diverse context.
+MMR_LAMBDA = None
+MMR_FETCH_K = 20
+
+# Federated retrieval across classes: seconds to wait for each class, worker threads, and
+# per-class score normalization before merging ("minmax", "zscore" or "none").
+FEDERATED_TIMEOUT = 2.0
+FEDERATED_MAX_WORKERS = 8
+FEDERATED_NORMALIZATION = "minmax"
+
+# Client-side embedding (see embedder.py). None leaves vectorization to Weaviate's text2vec-transformers;
+# "sentence-transformers" or "onnx" load EMBEDDING_MODEL locally, "hashing" is a deterministic offline embedder.
+# Vectors are cached on disk by content hash in EMBEDDING_CACHE_DIR (None disables the cache).
+EMBEDDER = None
+EMBEDDING_BATCH_SIZE = 256
+EMBEDDING_DIM = 384
+EMBEDDING_CACHE_DIR = ".cache/embeddings"
+
+# In-process vector store (LocalVectorStore), a stand-in for Weaviate in development and CI.
+# Vectors are memory-mapped from LOCAL_STORE_DIR as "float32" or "float16". Classes with at least
+# LOCAL_STORE_IVF_THRESHOLD objects get an IVF index (None keeps exact brute-force search);
+# LOCAL_STORE_IVF_LISTS partitions (None = sqrt of the object count), LOCAL_STORE_IVF_NPROBE searched per query.
+VECTOR_STORE = "weaviate"
+LOCAL_STORE_DIR = ".cache/local_store"
+LOCAL_STORE_DTYPE = "float32"
+LOCAL_STORE_IVF_THRESHOLD = 50000
+LOCAL_STORE_IVF_LISTS = None
+LOCAL_STORE_IVF_NPROBE = 8
+
+# Batch inference over JSONL (batch_runner.py): requests in flight, attempts per item, and
+# how many finished items may wait for an earlier, slower one before new items stop being submitted.
+BATCH_INFERENCE_CONCURRENCY = 32
+BATCH_INFERENCE_RETRIES = 2
+BATCH_INFERENCE_REORDER_WINDOW = 256
@@ -1,10 +1,34 @@
+import hashlib
+import json
+import os
 import PyPDF2
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator, List, Optional
+
+from config import PDF_WORKERS, PDF_PAGES_PER_TASK, EXTRACTION_CACHE_DIR
+from tracing import traced
+
+# Bump when the extraction output changes so stale cache entries are ignored.
+EXTRACTION_FORMAT_VERSION = 1
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    # Runs in a worker process; each worker parses the file independently.
+    with open(file_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
 
 class DocumentReader:
-    def __init__(self):
+    def __init__(self, num_workers: int = PDF_WORKERS, pages_per_task: int = PDF_PAGES_PER_TASK, cache_dir: Optional[str] = EXTRACTION_CACHE_DIR):
         self.supported_extensions = {".pdf", ".txt"}
+        self.num_workers = num_workers
+        self.pages_per_task = pages_per_task
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.reader_version = f"pypdf2-{PyPDF2.__version__}-v{EXTRACTION_FORMAT_VERSION}"
 
+    @traced("reader.read_document")
     def read_document(self, file_path: Path) -> dict:
         ext = file_path.suffix.lower()
         if ext not in self.supported_extensions:
@@ -17,22 +41,62 @@ class DocumentReader:
         else:
             raise ValueError(f"Unsupported file extension: {ext}")
         
+    @traced("reader.read_pdf")
     def read_pdf(self, file_path) -> dict:
         try:
-            with open(file_path, "rb") as f:
-                reader = PyPDF2.PdfReader(f)
-                text = []
-                for page in reader.pages:
-                    text.append(page.extract_text() or "")
-                content = "\n".join(text)
+            cache_path = self._cache_path(file_path)
+            if cache_path and cache_path.exists():
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    content = json.load(f)["content"]
+                return {"title": file_path.name, "content": content}
+
+            content = "\n".join(self.iter_pdf_pages(file_path))
+
+            if cache_path:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = cache_path.with_suffix(".tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"reader_version": self.reader_version, "content": content}, f)
+                os.replace(tmp_path, cache_path)
             return {"title": file_path.name, "content": content}
         except Exception as e:
             raise Exception("PDF text extraction failed.", e)
 
+    def iter_pdf_pages(self, file_path) -> Iterator[str]:
+        """
+        Yield the text of each page in order.
+
+        Large PDFs are split into page ranges extracted by a process pool; ranges are
+        yielded in order as soon as they (and all earlier ranges) are done.
+        """
+        with open(file_path, "rb") as f:
+            num_pages = len(PyPDF2.PdfReader(f).pages)
+
+        if self.num_workers <= 1 or num_pages <= self.pages_per_task:
+            yield from _extract_page_range(str(file_path), 0, num_pages)
+            return
+
+        ranges = [(start, min(start + self.pages_per_task, num_pages)) for start in range(0, num_pages, self.pages_per_task)]
+        workers = min(self.num_workers, len(ranges))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_extract_page_range, str(file_path), start, end) for start, end in ranges]
+            for future in futures:
+                yield from future.result()
+
+    def _cache_path(self, file_path) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        digest.update(self.reader_version.encode("utf-8"))
+        return self.cache_dir / f"{digest.hexdigest()}.json"
+
     def read_txt(self, file_path) -> dict:
         try:
             with open(file_path, "r", encoding="utf-8") as f:
                 content = f.read()
             return {"title": file_path.name, "content": content}
         except Exception as e:
-            raise Exception("Text extraction failed.", e)
\ No newline at end of file
+            raise Exception("Text extraction failed.", e)
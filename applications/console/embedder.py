@@ -0,0 +1,190 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+from typing import Dict, List, Optional
+
+from cache import LRUCache
+from config import EMBEDDER, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_DIM, EMBEDDING_CACHE_DIR, QUERY_EMBEDDING_CACHE_SIZE
+from manifest import content_hash
+from tracing import traced
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class Embedder:
+    """
+    Turns texts into vectors on the client, so objects can be uploaded with precomputed vectors.
+
+    Subclasses implement `_embed` for one batch; `embed` splits the input into batches of
+    `batch_size`. `name` identifies the model and is part of every cache key.
+    """
+
+    name = "embedder"
+    dimension = 0
+
+    def __init__(self, batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.batch_size = batch_size
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Return a float32 array of shape (len(texts), dimension)."""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        batches = [self._embed(texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+        return np.concatenate(batches).astype(np.float32, copy=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed([text])[0].tolist()
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic bag-of-words embedder: each lowercased token is hashed to a signed bucket.
+
+    Needs no model or network, so it is meant for offline tests and benchmarks; texts
+    sharing words get a positive cosine similarity.
+    """
+
+    def __init__(self, dimension: int = EMBEDDING_DIM, batch_size: int = EMBEDDING_BATCH_SIZE):
+        super().__init__(batch_size)
+        self.dimension = dimension
+        self.name = f"hashing-{dimension}"
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _TOKEN_RE.findall(text.lower()):
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dimension
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """
+    Local sentence-transformers model. `backend="onnx"` runs it with ONNX Runtime
+    (sentence-transformers >= 3.2), which is usually faster on CPU.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, backend: str = "torch", device: Optional[str] = None, batch_size: int = EMBEDDING_BATCH_SIZE):
+        super().__init__(batch_size)
+        # Imported here so the dependency is only needed when this embedder is used.
+        from sentence_transformers import SentenceTransformer
+
+        kwargs = {"backend": backend} if backend != "torch" else {}
+        self.model = SentenceTransformer(model_name, device=device, **kwargs)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.name = f"{model_name}:{backend}"
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True)
+
+
+class EmbeddingCache:
+    """SQLite store of vectors keyed by model name and content hash, stored as float32 blobs."""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS vectors (model TEXT, hash TEXT, vector BLOB, PRIMARY KEY (model, hash))")
+        self.conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT hash, vector FROM vectors WHERE model = ? AND hash IN ({','.join('?' * len(chunk))})",
+                    [model, *chunk],
+                ).fetchall()
+                found.update((h, np.frombuffer(blob, dtype=np.float32)) for h, blob in rows)
+        return found
+
+    def set_many(self, model: str, vectors: Dict[str, np.ndarray]):
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO vectors VALUES (?, ?, ?)",
+                [(model, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in vectors.items()],
+            )
+            self.conn.commit()
+
+
+class CachedEmbedder(Embedder):
+    """
+    Wraps an embedder so each distinct text is embedded at most once.
+
+    Texts are looked up by content hash in memory, then on disk; only the misses, deduplicated,
+    are sent to the wrapped embedder in batches. Vectors are keyed by the model name too, so
+    switching models never returns stale vectors.
+    """
+
+    def __init__(self, embedder: Embedder, cache_dir: Optional[str] = EMBEDDING_CACHE_DIR, memory_size: int = QUERY_EMBEDDING_CACHE_SIZE):
+        super().__init__(embedder.batch_size)
+        self.embedder = embedder
+        self.name = embedder.name
+        self.dimension = embedder.dimension
+        self.memory = LRUCache(memory_size)
+        self.disk = EmbeddingCache(os.path.join(cache_dir, "embeddings.sqlite")) if cache_dir else None
+        self.hits = 0
+        self.misses = 0
+
+    @traced("embedder.embed")
+    def embed(self, texts: List[str]) -> np.ndarray:
+        hashes = [content_hash(text) for text in texts]
+        vectors = {}
+        for h in set(hashes):
+            vector = self.memory.get(h)
+            if vector is not None:
+                vectors[h] = vector
+        if self.disk is not None and len(vectors) < len(set(hashes)):
+            stored = self.disk.get_many(self.name, [h for h in set(hashes) if h not in vectors])
+            for h, vector in stored.items():
+                self.memory.set(h, vector)
+            vectors.update(stored)
+
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in vectors:
+                missing.setdefault(h, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            computed = dict(zip(missing, self.embedder.embed(list(missing.values()))))
+            for h, vector in computed.items():
+                self.memory.set(h, vector)
+            if self.disk is not None:
+                self.disk.set_many(self.name, computed)
+            vectors.update(computed)
+
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.stack([vectors[h] for h in hashes])
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+def get_embedder(kind: Optional[str] = EMBEDDER, cache_dir: Optional[str] = EMBEDDING_CACHE_DIR) -> Optional[Embedder]:
+    """Build the configured embedder wrapped in a CachedEmbedder, or None to let Weaviate vectorize."""
+    if kind is None:
+        return None
+    if kind == "hashing":
+        embedder = HashingEmbedder()
+    elif kind in ("sentence-transformers", "onnx"):
+        embedder = SentenceTransformerEmbedder(backend="onnx" if kind == "onnx" else "torch")
+    else:
+        raise ValueError(f"Unsupported embedder: {kind}")
+    return CachedEmbedder(embedder, cache_dir)
@@ -0,0 +1,109 @@
+import threading
+import time
+import requests
+
+from typing import Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util import Timeout
+
+from config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_TOTAL_TIMEOUT
+
+
+class HTTPClient:
+    """
+    Keep-alive session with a bounded connection pool, shared by everything that talks to
+    the OpenAI-compatible endpoint.
+
+    Connect and read timeouts are passed to each request; the read timeout bounds the wait
+    for each chunk of the response. `total_timeout` additionally bounds the time to receive
+    a complete non-streamed response: connecting and waiting for the headers share it, and
+    reading the body is abandoned once it has passed.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = HTTP_POOL_CONNECTIONS,
+        pool_maxsize: int = HTTP_POOL_MAXSIZE,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+        total_timeout: Optional[float] = HTTP_TOTAL_TIMEOUT,
+    ):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+
+    def request(self, method: str, url: str, stream: bool = False, total_timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", (self.connect_timeout, self.read_timeout))
+        total_timeout = total_timeout if total_timeout is not None else self.total_timeout
+        with self._lock:
+            self._requests += 1
+        try:
+            if stream or total_timeout is None:
+                return self.session.request(method, url, stream=stream, **kwargs)
+
+            deadline = time.monotonic() + total_timeout
+            timeout = kwargs["timeout"]
+            connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            # urllib3 caps the read timeout at what is left of `total` after connecting, so a
+            # server that sends nothing until it is done cannot hold the call for the full read timeout.
+            kwargs["timeout"] = Timeout(connect=connect, read=read, total=total_timeout)
+            response = self.session.request(method, url, stream=True, **kwargs)
+            body = []
+            for block in response.iter_content(chunk_size=16384):
+                body.append(block)
+                if time.monotonic() > deadline:
+                    response.close()
+                    raise requests.Timeout(f"Request to {url} exceeded total timeout of {total_timeout}s")
+            response._content = b"".join(body)
+            return response
+        except requests.RequestException:
+            with self._lock:
+                self._errors += 1
+            raise
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def stats(self) -> Dict:
+        """Request counters and, per host pool, connections opened, requests served and idle connections."""
+        pools = {}
+        manager = self.adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": pool.pool.qsize() if pool.pool else 0,
+            }
+        with self._lock:
+            return {"requests": self._requests, "errors": self._errors, "pools": pools}
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_http_client() -> HTTPClient:
+    """Process-wide shared client, created on first use."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HTTPClient()
+        return _default_client
@@ -0,0 +1,258 @@
+import hashlib
+import itertools
+import re
+import threading
+import time
+import weakref
+
+import requests
+
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from config import VLLM_BACKENDS, LB_POLICY, LB_HEALTH_INTERVAL, LB_MAX_FAILURES, LB_EJECTION_TIME, LB_AFFINITY_SLACK, SESSION_HEADER
+from http_client import HTTPClient, get_http_client
+
+# Gauges exported by vLLM's Prometheus endpoint, summed over their labels.
+_METRIC_RE = re.compile(r"^(vllm:num_requests_(?:running|waiting))(?:\{[^}]*\})?\s+([0-9.eE+-]+)", re.MULTILINE)
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected = False
+        self.ejected_until = 0.0
+        self.running = 0.0
+        self.waiting = 0.0
+        self.has_metrics = True
+
+    def available(self, now: float) -> bool:
+        # Once the ejection time is up, live traffic may probe the backend again.
+        return not self.ejected or now >= self.ejected_until
+
+    def eject(self, now: float, duration: float, reason: str):
+        if not self.ejected:
+            print(f"Ejected backend {self.url}: {reason}.")
+        self.ejected = True
+        self.ejected_until = now + duration
+
+    def readmit(self):
+        if self.ejected:
+            print(f"Re-admitted backend {self.url}.")
+        self.ejected = False
+        self.failures = 0
+
+    def as_dict(self) -> Dict:
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "failures": self.failures,
+            "ejected": self.ejected,
+            "running": self.running,
+            "waiting": self.waiting,
+        }
+
+
+class LoadBalancer:
+    """
+    Spread requests over several vLLM replicas; a drop-in for HTTPClient's request/post/get.
+
+    The scheme, host and port of each request URL are replaced by the chosen backend, so
+    existing `post(API_URL, ...)` calls keep working. Policies:
+      least_outstanding: fewest requests in flight from this process.
+      queue_depth: also counts running and waiting requests reported by each backend's
+        /metrics, so load from other clients is taken into account.
+    Requests carrying SESSION_HEADER prefer the same backend (keeping its prefix cache warm)
+    unless it is more than `affinity_slack` requests busier than the least loaded one.
+
+    A backend is ejected after `max_failures` consecutive connection errors or 5xx
+    responses, and re-admitted once its /health check passes after `ejection_time` seconds.
+    Connection errors are retried on another backend.
+    """
+
+    POLICIES = {"least_outstanding", "queue_depth"}
+
+    def __init__(
+        self,
+        backends: List[str] = VLLM_BACKENDS,
+        policy: str = LB_POLICY,
+        http_client: Optional[HTTPClient] = None,
+        health_interval: float = LB_HEALTH_INTERVAL,
+        max_failures: int = LB_MAX_FAILURES,
+        ejection_time: float = LB_EJECTION_TIME,
+        affinity_slack: int = LB_AFFINITY_SLACK,
+    ):
+        if not backends:
+            raise ValueError("At least one backend is required.")
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unsupported load balancing policy: {policy}")
+        self.backends = [Backend(url) for url in backends]
+        self.policy = policy
+        self.http_client = http_client or get_http_client()
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.affinity_slack = affinity_slack
+        self._lock = threading.Lock()
+        self._round_robin = itertools.count()
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        self._ensure_health_checks()
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        session_id = (kwargs.get("headers") or {}).get(SESSION_HEADER)
+
+        tried = set()
+        while True:
+            backend = self._acquire(session_id, tried)
+            tried.add(id(backend))
+            try:
+                response = self.http_client.request(method, backend.url + path, **kwargs)
+            except requests.ConnectionError:
+                self._release(backend, failed=True)
+                if len(tried) >= len(self.backends):
+                    raise
+                continue
+            except Exception:
+                self._release(backend, failed=False)
+                raise
+
+            failed = response.status_code >= 500
+            if not kwargs.get("stream"):
+                self._release(backend, failed)
+                return response
+
+            # Streamed responses stay outstanding until closed (or garbage collected).
+            release = _Once(self._release, backend, failed)
+            close = response.close
+
+            def close_and_release():
+                try:
+                    close()
+                finally:
+                    release()
+
+            response.close = close_and_release
+            weakref.finalize(response, release)
+            return response
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"policy": self.policy, "backends": [b.as_dict() for b in self.backends]}
+
+    def close(self):
+        self._stop.set()
+
+    def _load(self, backend: Backend) -> float:
+        if self.policy == "queue_depth" and backend.has_metrics:
+            # Server-side running already includes our in-flight requests once they are admitted.
+            return max(backend.outstanding, backend.running) + backend.waiting
+        return backend.outstanding
+
+    def _acquire(self, session_id: Optional[str], exclude: set) -> Backend:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if id(b) not in exclude and b.available(now)]
+            if not candidates:
+                # Everything is ejected: trying a suspect backend beats failing outright.
+                candidates = [b for b in self.backends if id(b) not in exclude] or self.backends
+            offset = next(self._round_robin)
+            rotated = candidates[offset % len(candidates):] + candidates[:offset % len(candidates)]
+            backend = min(rotated, key=self._load)
+            if session_id:
+                preferred = max(candidates, key=lambda b: hashlib.sha1(f"{session_id}|{b.url}".encode("utf-8")).digest())
+                if self._load(preferred) - self._load(backend) <= self.affinity_slack:
+                    backend = preferred
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend: Backend, failed: bool):
+        with self._lock:
+            backend.outstanding -= 1
+            if not failed:
+                backend.readmit()
+                return
+            backend.failures += 1
+            if backend.failures >= self.max_failures:
+                backend.eject(time.monotonic(), self.ejection_time, f"{backend.failures} consecutive failures")
+
+    def _ensure_health_checks(self):
+        if self._health_thread is None and self.health_interval:
+            with self._lock:
+                if self._health_thread is None:
+                    self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+                    self._health_thread.start()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            for backend in self.backends:
+                self.check_backend(backend)
+
+    def check_backend(self, backend: Backend):
+        """Probe /health (and /metrics for queue_depth), ejecting or re-admitting the backend."""
+        try:
+            healthy = self.http_client.get(f"{backend.url}/health", timeout=(1, 2)).status_code == 200
+        except requests.RequestException:
+            healthy = False
+
+        metrics = None
+        if healthy and self.policy == "queue_depth" and backend.has_metrics:
+            try:
+                response = self.http_client.get(f"{backend.url}/metrics", timeout=(1, 2))
+                if response.status_code == 404:
+                    backend.has_metrics = False
+                elif response.ok:
+                    metrics = {"vllm:num_requests_running": 0.0, "vllm:num_requests_waiting": 0.0}
+                    for name, value in _METRIC_RE.findall(response.text):
+                        metrics[name] += float(value)
+            except requests.RequestException:
+                pass
+
+        now = time.monotonic()
+        with self._lock:
+            if metrics is not None:
+                backend.running = metrics["vllm:num_requests_running"]
+                backend.waiting = metrics["vllm:num_requests_waiting"]
+            if healthy:
+                if backend.ejected and now >= backend.ejected_until:
+                    backend.readmit()
+            else:
+                backend.eject(now, self.ejection_time, "health check failed")
+
+
+class _Once:
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+        self.lock = threading.Lock()
+        self.done = False
+
+    def __call__(self):
+        with self.lock:
+            if self.done:
+                return
+            self.done = True
+        self.func(*self.args)
+
+
+_default_balancer = None
+_default_lock = threading.Lock()
+
+
+def get_load_balancer() -> LoadBalancer:
+    """Process-wide balancer over VLLM_BACKENDS, created on first use."""
+    global _default_balancer
+    with _default_lock:
+        if _default_balancer is None:
+            _default_balancer = LoadBalancer()
+        return _default_balancer
@@ -0,0 +1,432 @@
+import copy
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from typing import Dict, List, Optional
+from weaviate.util import generate_uuid5
+
+from cache import LRUCache
+from config import (
+    EMBEDDER, RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL, MMR_LAMBDA, MMR_FETCH_K, FEDERATED_NORMALIZATION,
+    LOCAL_STORE_DIR, LOCAL_STORE_DTYPE, LOCAL_STORE_IVF_THRESHOLD, LOCAL_STORE_IVF_LISTS, LOCAL_STORE_IVF_NPROBE,
+)
+from embedder import Embedder, get_embedder
+from rerank import _normalize_rows
+from tracing import traced
+from weaviate_store import WeaviateClient
+
+# Rows scored per matrix product during brute-force search, bounding temporary memory.
+_SCAN_BLOCK = 65536
+_PROPERTIES = ("title", "content", "chunk_index", "offset", "content_hash")
+
+
+class _LocalClass:
+    """
+    On-disk state of one class.
+
+    vectors.npy   unit-normalized vectors, memory-mapped; capacity grows by doubling
+    objects.jsonl one JSON object of properties per row, read only for returned hits
+    rows.jsonl    [id, title, byte offset, length] per row, the only part loaded at startup
+    deleted.txt   deleted row numbers (rows are never rewritten; re-uploads append a new row)
+    ivf_*.npy     optional IVF index over the first `indexed` rows
+    """
+
+    def __init__(self, path: str, name: str, dimension: int, dtype: str, embedder_name: str):
+        self.path = path
+        self.lock = threading.Lock()
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            if self.meta["embedder"] != embedder_name:
+                raise ValueError(f"Class '{self.meta['name']}' was embedded with '{self.meta['embedder']}', not '{embedder_name}'.")
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.meta = {"name": name, "dimension": dimension, "dtype": dtype, "embedder": embedder_name, "indexed": 0}
+            np.lib.format.open_memmap(self._file("vectors.npy"), mode="w+", dtype=dtype, shape=(1024, dimension)).flush()
+            self._write_meta()
+
+        self.ids, self.titles, self.spans = [], [], []
+        if os.path.exists(self._file("rows.jsonl")):
+            with open(self._file("rows.jsonl")) as f:
+                for line in f:
+                    obj_id, title, start, length = json.loads(line)
+                    self.ids.append(obj_id)
+                    self.titles.append(title)
+                    self.spans.append((start, length))
+        self.alive = np.ones(max(len(self.ids), 1024), dtype=bool)
+        if os.path.exists(self._file("deleted.txt")):
+            with open(self._file("deleted.txt")) as f:
+                for line in f:
+                    self.alive[int(line)] = False
+        self.id_to_row = {obj_id: row for row, obj_id in enumerate(self.ids) if self.alive[row]}
+        self.vectors = np.load(self._file("vectors.npy"), mmap_mode="r+")
+        self._load_index()
+
+    @property
+    def name(self) -> str:
+        return self.meta["name"]
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _write_meta(self):
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._file("meta.json"))
+
+    def _load_index(self):
+        self.centroids = self.ivf_order = self.ivf_offsets = None
+        if self.meta["indexed"] and os.path.exists(self._file("ivf_centroids.npy")):
+            self.centroids = np.load(self._file("ivf_centroids.npy"))
+            self.ivf_order = np.load(self._file("ivf_order.npy"), mmap_mode="r")
+            self.ivf_offsets = np.load(self._file("ivf_offsets.npy"))
+
+    def append(self, ids: List[str], objects: List[Dict], vectors: np.ndarray):
+        # Called with the lock held. Vectors are flushed before the rows that point at them are recorded.
+        start, end = self.count, self.count + len(ids)
+        if end > len(self.vectors):
+            self._grow(end)
+        self.vectors[start:end] = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+        self.vectors.flush()
+
+        rows = []
+        with open(self._file("objects.jsonl"), "ab") as f:
+            for obj_id, obj in zip(ids, objects):
+                line = (json.dumps({k: obj[k] for k in _PROPERTIES if obj.get(k) is not None}) + "\n").encode("utf-8")
+                rows.append([obj_id, obj["title"], f.tell(), len(line)])
+                f.write(line)
+        if end > len(self.alive):
+            self.alive = np.concatenate([self.alive, np.ones(len(self.vectors) - len(self.alive), dtype=bool)])
+        replaced = [self.id_to_row[obj_id] for obj_id in ids if obj_id in self.id_to_row]
+        with open(self._file("rows.jsonl"), "a") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+        for row in rows:
+            self.id_to_row[row[0]] = len(self.ids)
+            self.ids.append(row[0])
+            self.titles.append(row[1])
+            self.spans.append((row[2], row[3]))
+        self.delete_rows(replaced)
+
+    def _grow(self, needed: int):
+        capacity = len(self.vectors)
+        while capacity < needed:
+            capacity *= 2
+        tmp = self._file("vectors.npy.tmp")
+        grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=self.vectors.dtype, shape=(capacity, self.vectors.shape[1]))
+        grown[:self.count] = self.vectors[:self.count]
+        grown.flush()
+        del grown
+        self.vectors = None
+        os.replace(tmp, self._file("vectors.npy"))
+        self.vectors = np.load(self._file("vectors.npy"), mmap_mode="r+")
+
+    def delete_rows(self, rows: List[int]):
+        # Called with the lock held.
+        rows = [row for row in rows if self.alive[row]]
+        if not rows:
+            return
+        with open(self._file("deleted.txt"), "a") as f:
+            f.writelines(f"{row}\n" for row in rows)
+        for row in rows:
+            self.alive[row] = False
+            if self.id_to_row.get(self.ids[row]) == row:
+                del self.id_to_row[self.ids[row]]
+
+    def read_object(self, row: int) -> Dict:
+        start, length = self.spans[row]
+        with open(self._file("objects.jsonl"), "rb") as f:
+            f.seek(start)
+            return json.loads(f.read(length))
+
+    def search(self, query_vector: np.ndarray, k: int, nprobe: int) -> List[tuple]:
+        """Return up to `k` (row, cosine similarity) pairs, best first."""
+        count = self.count
+        if self.centroids is not None:
+            probe = np.argsort(self.centroids @ query_vector)[::-1][:nprobe]
+            rows = np.concatenate([self.ivf_order[self.ivf_offsets[i]:self.ivf_offsets[i + 1]] for i in probe] + [np.arange(self.meta["indexed"], count)])
+            rows = np.sort(rows)  # Sequential reads from the memory map.
+            rows = rows[self.alive[rows]]
+            scores = np.asarray(self.vectors[rows], dtype=np.float32) @ query_vector
+        else:
+            rows = np.arange(count)
+            scores = np.concatenate([np.asarray(self.vectors[i:min(i + _SCAN_BLOCK, count)], dtype=np.float32) @ query_vector for i in range(0, count, _SCAN_BLOCK)] or [np.zeros(0, dtype=np.float32)])
+            scores[~self.alive[:count]] = -np.inf
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def build_index(self, n_lists: int, iterations: int = 10, seed: int = 0):
+        """Cluster the live rows with k-means into `n_lists` partitions (IVF). Rows added later are scanned exactly until the next build."""
+        count = self.count
+        live = np.flatnonzero(self.alive[:count])
+        n_lists = max(1, min(n_lists, len(live)))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(live, size=min(len(live), 256 * n_lists), replace=False))
+        train = np.asarray(self.vectors[sample], dtype=np.float32)
+        centroids = train[rng.choice(len(train), size=n_lists, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(train @ centroids.T, axis=1)
+            for i in range(n_lists):
+                members = train[assign == i]
+                if len(members):
+                    centroids[i] = members.mean(axis=0)
+            centroids = _normalize_rows(centroids)
+
+        assign = np.concatenate([
+            np.argmax(np.asarray(self.vectors[live[i:i + _SCAN_BLOCK]], dtype=np.float32) @ centroids.T, axis=1)
+            for i in range(0, len(live), _SCAN_BLOCK)
+        ])
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(n_lists + 1))
+        np.save(self._file("ivf_centroids.npy"), centroids.astype(np.float32))
+        np.save(self._file("ivf_order.npy"), live[order].astype(np.int64))
+        np.save(self._file("ivf_offsets.npy"), offsets.astype(np.int64))
+        self.meta["indexed"] = count
+        self._write_meta()
+        self._load_index()
+
+
+class LocalVectorStore:
+    """
+    In-process vector store with the retrieval interface of WeaviateClient, for running
+    without the Weaviate and t2v containers.
+
+    Each class lives in its own directory under `path`: unit-normalized vectors in a
+    memory-mapped .npy array (float32 or float16) and the object properties in a JSONL
+    sidecar. Opening a class reads only ids and titles, so startup is near-instant and
+    vectors are paged in by the OS as searches touch them. Search is exact, blocked cosine
+    similarity, or an IVF index (k-means partitions, `nprobe` searched) once a class reaches
+    `ivf_threshold` objects. Objects are embedded with the client-side embedder (EMBEDDER,
+    falling back to the hashing embedder) and get the same deterministic ids as in Weaviate.
+    """
+
+    RETRIEVAL_MODES = {"vector"}
+    NORMALIZATIONS = WeaviateClient.NORMALIZATIONS
+
+    def __init__(
+        self,
+        path: str = LOCAL_STORE_DIR,
+        embedder: Optional[Embedder] = None,
+        dtype: str = LOCAL_STORE_DTYPE,
+        ivf_threshold: Optional[int] = LOCAL_STORE_IVF_THRESHOLD,
+        ivf_lists: Optional[int] = LOCAL_STORE_IVF_LISTS,
+        nprobe: int = LOCAL_STORE_IVF_NPROBE,
+    ):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.path = path
+        self.embedder = embedder or get_embedder(EMBEDDER or "hashing")
+        self.dtype = dtype
+        self.ivf_threshold = ivf_threshold
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe
+        self.vectorizer = "none"
+        self.change_listeners = []
+        self.retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+        self._classes = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        print(f"Local vector store opened at '{path}'.")
+
+    def _class(self, class_name: str, create: bool = False) -> _LocalClass:
+        key = class_name.lower()
+        with self._lock:
+            if key not in self._classes:
+                path = os.path.join(self.path, key)
+                if not create and not os.path.exists(os.path.join(path, "meta.json")):
+                    raise ValueError(f"Class '{class_name}' does not exist.")
+                self._classes[key] = _LocalClass(path, class_name, self.embedder.dimension, self.dtype, self.embedder.name)
+            return self._classes[key]
+
+    def get_classes(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.path) if os.path.exists(os.path.join(self.path, name, "meta.json")))
+
+    @traced("local.create_class")
+    def create_class(self, class_name: str):
+        if class_name.lower() in self.get_classes():
+            print(f"Class '{class_name}' already exists.")
+            return True
+        self._class(class_name, create=True)
+        print(f"Created new class '{class_name}'.")
+        return True
+
+    @traced("local.delete_class")
+    def delete_class(self, class_name: str):
+        key = class_name.lower()
+        with self._lock:
+            self._classes.pop(key, None)
+        shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+        self._notify_change(class_name)
+
+    @traced("local.get_documents")
+    def get_documents(self, class_name: str) -> List[str]:
+        cls = self._class(class_name)
+        with cls.lock:
+            return [cls.titles[row] for row in sorted(cls.id_to_row.values())]
+
+    def count_documents(self, class_name: str) -> int:
+        return len(self._class(class_name).id_to_row)
+
+    @traced("local.upload_documents")
+    def upload_documents(self, class_name: str, docs: List[Dict], skip_existing: bool = True, **kwargs) -> Dict[str, List]:
+        """
+        Embed and append documents, skipping titles that already exist.
+
+        Batch options of WeaviateClient.upload_documents are accepted and ignored. When
+        `skip_existing` is False, objects with an existing id replace the old row.
+
+        Returns:
+          A report {"uploaded": [titles], "skipped": [titles], "failed": []}.
+        """
+        cls = self._class(class_name, create=True)
+        report = {"uploaded": [], "skipped": [], "failed": []}
+        with cls.lock:
+            existing = {cls.titles[row] for row in cls.id_to_row.values()} if skip_existing else set()
+        pending = {}
+        for doc in docs:
+            if doc["title"] in existing:
+                print(f"Skipped: `{doc['title']}` already exists in `{class_name}`.")
+                report["skipped"].append(doc["title"])
+            else:
+                pending[generate_uuid5(WeaviateClient._object_key(doc), class_name)] = doc
+
+        if pending:
+            vectors = self.embedder.embed([doc["content"] for doc in pending.values()])
+            with cls.lock:
+                cls.append(list(pending), list(pending.values()), vectors)
+            report["uploaded"] = [doc["title"] for doc in pending.values()]
+            self._maybe_index(cls)
+            self._notify_change(class_name)
+            print(f"Uploaded {len(report['uploaded'])} new document(s) to '{class_name}'.")
+        if report["skipped"]:
+            print(f"Skipped {len(report['skipped'])} duplicate document(s).")
+        return report
+
+    @traced("local.delete_objects")
+    def delete_objects(self, class_name: str, ids: Optional[List[str]] = None, titles: Optional[List[str]] = None) -> Dict[str, int]:
+        """Delete objects by id and/or title. Returns {"matches", "deleted", "failed"}."""
+        cls = self._class(class_name)
+        with cls.lock:
+            rows = {cls.id_to_row[obj_id] for obj_id in ids or [] if obj_id in cls.id_to_row}
+            if titles:
+                wanted = set(titles)
+                rows.update(row for row in cls.id_to_row.values() if cls.titles[row] in wanted)
+            cls.delete_rows(sorted(rows))
+        if rows:
+            self._notify_change(class_name)
+        return {"matches": len(rows), "deleted": len(rows), "failed": 0}
+
+    def build_index(self, class_name: str, n_lists: Optional[int] = None):
+        """(Re)build the IVF index of a class."""
+        cls = self._class(class_name)
+        with cls.lock:
+            live = len(cls.id_to_row)
+            n_lists = n_lists or self.ivf_lists or max(1, int(live ** 0.5))
+            cls.build_index(n_lists)
+        print(f"Built IVF index for '{class_name}' with {n_lists} lists over {live} object(s).")
+
+    def _maybe_index(self, cls: _LocalClass):
+        # Index once the threshold is reached, and rebuild when unindexed rows reach half the indexed ones.
+        if self.ivf_threshold is None or cls.count < self.ivf_threshold:
+            return
+        indexed = cls.meta["indexed"]
+        if not indexed or cls.count - indexed >= indexed // 2:
+            self.build_index(cls.name)
+
+    def generation(self, class_name: str) -> int:
+        with self._lock:
+            return self._generations.get(class_name.lower(), 0)
+
+    def _notify_change(self, class_name: str):
+        with self._lock:
+            key = class_name.lower()
+            self._generations[key] = self._generations.get(key, 0) + 1
+        for listener in self.change_listeners:
+            listener(class_name)
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.embedder.embed_query(WeaviateClient.normalize_query(query))
+
+    @traced("local.query_documents")
+    def query_documents(
+        self,
+        query: str,
+        class_name: str,
+        top_k: int = 3,
+        group_by_parent: bool = False,
+        certainty: float = 0.6,
+        mode: str = "vector",
+        mmr_lambda: Optional[float] = MMR_LAMBDA,
+        fetch_k: int = MMR_FETCH_K,
+        **kwargs,
+    ) -> List[Dict]:
+        """
+        Retrieve the objects most similar to `query`, like WeaviateClient.query_documents.
+
+        Certainty is Weaviate's (1 + cosine) / 2. Only "vector" mode is supported; hybrid
+        arguments are accepted and ignored.
+
+        Raises:
+          ValueError: The class does not exist or `mode` is not supported.
+        """
+        if mode not in self.RETRIEVAL_MODES:
+            raise ValueError(f"Unsupported retrieval mode for the local store: {mode}")
+        use_mmr = mmr_lambda is not None and fetch_k > top_k
+        cache_key = (class_name.lower(), self.generation(class_name), WeaviateClient.normalize_query(query), certainty, top_k, group_by_parent, mmr_lambda if use_mmr else None, fetch_k if use_mmr else None)
+        cached = self.retrieval_cache.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
+        cls = self._class(class_name)
+        query_vector = _normalize_rows(np.asarray([self.embed_query(query)], dtype=np.float32))[0]
+        with cls.lock:
+            hits = cls.search(query_vector, fetch_k if use_mmr else top_k, self.nprobe)
+            docs = []
+            for row, score in hits:
+                if (1 + score) / 2 < certainty:
+                    continue
+                doc = cls.read_object(row)
+                doc["_additional"] = {"certainty": (1 + score) / 2, "distance": 1 - score, "id": cls.ids[row]}
+                if use_mmr:
+                    doc["_additional"]["vector"] = np.asarray(cls.vectors[row], dtype=np.float32)
+                docs.append(doc)
+
+        if use_mmr:
+            docs = WeaviateClient.mmr_rerank(docs, top_k, mmr_lambda, query_vector)
+        if group_by_parent and any("chunk_index" in d for d in docs):
+            docs = WeaviateClient.group_chunks(docs)
+        self.retrieval_cache.set(cache_key, copy.deepcopy(docs))
+        return docs
+
+    def query_classes(self, query: str, class_names: List[str], top_k: int = 3, normalization: str = FEDERATED_NORMALIZATION, **kwargs) -> List[Dict]:
+        """Search several classes and merge a global top-k, like WeaviateClient.query_classes (searches are in-process, so no timeout)."""
+        if normalization not in self.NORMALIZATIONS:
+            raise ValueError(f"Unsupported score normalization: {normalization}")
+        kwargs.pop("timeout", None)
+        merged = []
+        for name in class_names:
+            try:
+                docs = self.query_documents(query, name, top_k, **kwargs)
+            except Exception as e:
+                print(f"Warning: Retrieval from '{name}' failed: {e}")
+                continue
+            scores = WeaviateClient.normalize_scores([WeaviateClient.relevance(d) for d in docs], normalization)
+            for doc, score in zip(docs, scores):
+                doc["_additional"].update({"class": name, "normalized_score": score})
+                merged.append(doc)
+        merged.sort(key=lambda d: (d["_additional"]["normalized_score"], WeaviateClient.relevance(d)), reverse=True)
+        return merged[:top_k]
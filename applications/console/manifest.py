@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from typing import Dict, List, Tuple
+
+from config import MANIFEST_PATH
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """
+    Local record of what has been ingested into each class: title -> (content hash, object ids).
+
+    Lets re-ingestion decide which documents are unchanged, modified or deleted without
+    querying Weaviate. The manifest assumes it is the only writer of the classes it tracks;
+    call drop_class when a class is deleted outside of it.
+    """
+
+    def __init__(self, path: str = MANIFEST_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Shared by the Streamlit app's script threads, so access is serialized here.
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                class_name TEXT NOT NULL,
+                title TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                object_ids TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (class_name, title)
+            )
+            """
+        )
+        self.conn.commit()
+
+    def get(self, class_name: str) -> Dict[str, Tuple[str, List[str]]]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT title, content_hash, object_ids FROM documents WHERE class_name = ?",
+                (class_name.lower(),),
+            ).fetchall()
+        return {title: (digest, json.loads(ids)) for title, digest, ids in rows}
+
+    def record(self, class_name: str, title: str, digest: str, object_ids: List[str]):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+                (class_name.lower(), title, digest, json.dumps(object_ids), time.time()),
+            )
+            self.conn.commit()
+
+    def remove(self, class_name: str, title: str):
+        with self._lock:
+            self.conn.execute("DELETE FROM documents WHERE class_name = ? AND title = ?", (class_name.lower(), title))
+            self.conn.commit()
+
+    def drop_class(self, class_name: str):
+        with self._lock:
+            self.conn.execute("DELETE FROM documents WHERE class_name = ?", (class_name.lower(),))
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,54 @@
+import numpy as np
+
+from typing import List, Optional, Sequence
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def mmr_select(
+    doc_vectors: Sequence[Sequence[float]],
+    k: int,
+    lambda_mult: float = 0.7,
+    query_vector: Optional[Sequence[float]] = None,
+    relevance: Optional[Sequence[float]] = None,
+) -> List[int]:
+    """
+    Pick `k` candidates by maximal marginal relevance and return their indices in pick order.
+
+    Each step picks the candidate maximizing
+        lambda_mult * relevance - (1 - lambda_mult) * max cosine similarity to those already picked,
+    so near-duplicates of a picked candidate drop down the list. Relevance is the cosine
+    similarity to `query_vector` if given, else `relevance` (e.g. retrieval scores) min-max
+    normalized to [0, 1].
+    """
+    vectors = _normalize_rows(np.asarray(doc_vectors, dtype=np.float32))
+    n = len(vectors)
+    if n == 0 or k <= 0:
+        return []
+
+    if query_vector is not None:
+        query = np.asarray(query_vector, dtype=np.float32)
+        rel = vectors @ (query / (np.linalg.norm(query) or 1))
+    elif relevance is not None:
+        rel = np.asarray(relevance, dtype=np.float32)
+        spread = rel.max() - rel.min()
+        rel = (rel - rel.min()) / spread if spread > 0 else np.ones(n, dtype=np.float32)
+    else:
+        raise ValueError("Either query_vector or relevance is required.")
+
+    similarity = vectors @ vectors.T
+    selected = [int(np.argmax(rel))]
+    max_similarity = similarity[selected[0]].copy()
+    chosen = np.zeros(n, dtype=bool)
+    chosen[selected[0]] = True
+    for _ in range(min(k, n) - 1):
+        scores = lambda_mult * rel - (1 - lambda_mult) * max_similarity
+        scores[chosen] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        chosen[best] = True
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
@@ -0,0 +1,309 @@
+import collections
+import os
+import subprocess
+import threading
+import time
+
+import psutil
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from config import (
+    MAX_MODEL_LEN, VLLM_SERVER_COMMAND, VLLM_READY_TIMEOUT, VLLM_READY_POLL_MIN, VLLM_READY_POLL_MAX,
+    VLLM_WARMUP_PROMPTS, VLLM_WARMUP_MAX_TOKENS, VLLM_POOL_SIZE, VLLM_POOL_BASE_PORT, VLLM_POOL_DEVICE_SETS,
+    VLLM_TENSOR_PARALLEL_SIZE, VLLM_GPU_MEMORY_UTILIZATION, VLLM_MODEL_OPTIONS,
+)
+from http_client import get_http_client
+from tracing import traced, tracer
+
+
+class LogTail:
+    """Incrementally read a growing log file, keeping only the last `max_lines` lines."""
+
+    def __init__(self, path: str, max_lines: int = 50):
+        self.path = path
+        self.offset = 0
+        self.partial = ""
+        self.lines = collections.deque(maxlen=max_lines)
+
+    def poll(self):
+        try:
+            with open(self.path, "r", errors="replace") as f:
+                f.seek(self.offset)
+                data = f.read()
+                self.offset = f.tell()
+        except FileNotFoundError:
+            return
+        if not data:
+            return
+        parts = (self.partial + data).split("\n")
+        self.partial = parts.pop()
+        self.lines.extend(parts)
+
+    def tail(self) -> str:
+        self.poll()
+        return "\n".join(list(self.lines) + ([self.partial] if self.partial else []))
+
+
+class VLLMServerManager:
+    def __init__(self, port=8000, host="localhost", command: Optional[List[str]] = VLLM_SERVER_COMMAND, warmup_prompts: Optional[List[str]] = None, ready_timeout: float = VLLM_READY_TIMEOUT,
+                 devices: Optional[str] = None, tensor_parallel_size: Optional[int] = None, gpu_memory_utilization: float = VLLM_GPU_MEMORY_UTILIZATION):
+        self.port = port
+        self.host = host
+        self.devices = devices
+        # Default to one shard per device of the slot.
+        self.tensor_parallel_size = tensor_parallel_size or (len(devices.split(",")) if devices else VLLM_TENSOR_PARALLEL_SIZE)
+        self.gpu_memory_utilization = gpu_memory_utilization
+        self.command = command
+        self.warmup_prompts = VLLM_WARMUP_PROMPTS if warmup_prompts is None else warmup_prompts
+        self.ready_timeout = ready_timeout
+        self.process = None
+        self.current_model = None
+        self.time_to_ready = None
+        self.log_file = f"logs/vllm_multi_{self.port}.log"
+        self.log_tail = None
+
+        if not os.path.exists("logs"):
+            os.makedirs("logs")
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def completions_url(self) -> str:
+        return f"{self.base_url}/v1/completions"
+
+    def server_command(self, model_name, tensor_parallel_size, gpu_memory_utilization) -> List[str]:
+        if self.command:
+            values = {"model": model_name, "host": "0.0.0.0", "port": self.port, "tensor_parallel_size": tensor_parallel_size, "gpu_memory_utilization": gpu_memory_utilization}
+            return [part.format(**values) for part in self.command]
+        return [
+            "vllm", "serve", model_name,
+            "--host", "0.0.0.0",
+            "--port", str(self.port),
+            "--tensor-parallel-size", str(tensor_parallel_size),
+            "--gpu-memory-utilization", str(gpu_memory_utilization),
+            "--max-model-len", str(MAX_MODEL_LEN),
+            "--enforce-eager"
+        ]
+
+    @traced("vllm.start_server")
+    def start_server(self, model_name, tensor_parallel_size: Optional[int] = None, gpu_memory_utilization: Optional[float] = None):
+        self.stop_server()  # kill old first
+
+        start = time.perf_counter()
+        cmd = self.server_command(model_name, tensor_parallel_size or self.tensor_parallel_size, gpu_memory_utilization or self.gpu_memory_utilization)
+        env = None
+        if self.devices is not None:
+            env = dict(os.environ, CUDA_VISIBLE_DEVICES=self.devices)
+        log_f = open(self.log_file, "w")
+        self.process = subprocess.Popen(cmd, stdout=log_f, stderr=log_f, env=env)
+        log_f.close()
+        self.log_tail = LogTail(self.log_file)
+
+        try:
+            self._wait_for_ready(model_name, self.ready_timeout)
+            self.warmup(model_name)
+        except BaseException:
+            # Don't leave a server that never became ready holding its GPUs and port.
+            self.stop_server()
+            raise
+        self.current_model = model_name
+
+        self.time_to_ready = time.perf_counter() - start
+        tracer.observe("vllm_time_to_ready_seconds", self.time_to_ready, model_name, buckets=(5, 10, 30, 60, 120, 300, 600, 1200))
+        print(f"vLLM server for '{model_name}' ready in {self.time_to_ready:.1f}s.")
+
+    def _wait_for_ready(self, model_name, timeout=VLLM_READY_TIMEOUT):
+        """
+        Poll /health, then /v1/models until `model_name` is listed.
+
+        The poll interval starts at VLLM_READY_POLL_MIN and backs off to VLLM_READY_POLL_MAX.
+        The log is tailed incrementally only so failures can show the server's last output.
+        """
+        http = get_http_client()
+        deadline = time.perf_counter() + timeout
+        delay = VLLM_READY_POLL_MIN
+        while time.perf_counter() < deadline:
+            self.log_tail.poll()
+            if self.process.poll() is not None:
+                raise RuntimeError(f"vLLM server exited unexpectedly (code {self.process.returncode}). Last log lines:\n{self.log_tail.tail()}")
+            try:
+                if http.get(f"{self.base_url}/health", timeout=(1, 2)).status_code == 200:
+                    models = http.get(f"{self.base_url}/v1/models", timeout=(1, 2)).json().get("data", [])
+                    if any(m.get("id") == model_name for m in models):
+                        return
+            except Exception:
+                pass  # Not listening yet.
+            time.sleep(delay)
+            delay = min(delay * 1.5, VLLM_READY_POLL_MAX)
+        raise TimeoutError(f"vLLM server did not become ready in time. Last log lines:\n{self.log_tail.tail()}")
+
+    @traced("vllm.warmup")
+    def warmup(self, model_name):
+        """Send the warm-up prompts so graph capture and compilation happen before the first user request."""
+        http = get_http_client()
+        for prompt in self.warmup_prompts:
+            data = {"model": model_name, "prompt": prompt, "max_tokens": VLLM_WARMUP_MAX_TOKENS, "temperature": 0}
+            try:
+                http.post(f"{self.base_url}/v1/completions", json=data).raise_for_status()
+            except Exception as e:
+                print(f"Warning: Warm-up request failed: {e}")
+
+    def stop_server(self, notify_fn=None):
+        if self.process and self.process.poll() is None:
+            if notify_fn:
+                notify_fn("Stopping previous model server... Please wait.")
+            self._kill_process_tree(self.process.pid)
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                if notify_fn:
+                    notify_fn("Process did not terminate in time, force killing...")
+                self._kill_process_tree(self.process.pid)
+        self.process = None
+        self.current_model = None
+
+    def _kill_process_tree(self, pid):
+        try:
+            parent = psutil.Process(pid)
+            children = parent.children(recursive=True)
+            for p in children:
+                p.terminate()
+            gone, alive = psutil.wait_procs(children, timeout=5)
+            for p in alive:
+                p.kill()
+            parent.terminate()
+            parent.wait(5)
+        except psutil.NoSuchProcess:
+            pass
+        except Exception as e:
+            print(f"Error killing process tree: {e}")
+
+
+class ModelServerPool:
+    """
+    Keep up to `size` models resident, each served by its own VLLMServerManager slot.
+
+    Slot i listens on `base_port + i` and, when `device_sets` is given, sees only
+    `device_sets[i]` through CUDA_VISIBLE_DEVICES. get() returns the server for a model,
+    starting it in a free slot or evicting the least recently used model. preload() starts
+    a model in the background without blocking. Per-model tensor-parallel size and memory
+    fraction come from `model_options`.
+    """
+
+    def __init__(
+        self,
+        size: int = VLLM_POOL_SIZE,
+        base_port: int = VLLM_POOL_BASE_PORT,
+        device_sets: Optional[List[str]] = VLLM_POOL_DEVICE_SETS,
+        model_options: Optional[Dict[str, Dict]] = None,
+        host: str = "localhost",
+        command: Optional[List[str]] = VLLM_SERVER_COMMAND,
+        warmup_prompts: Optional[List[str]] = None,
+    ):
+        if device_sets is not None and len(device_sets) < size:
+            raise ValueError("device_sets needs one entry per pool slot.")
+        self.slots = [
+            VLLMServerManager(
+                port=base_port + i, host=host, command=command, warmup_prompts=warmup_prompts,
+                devices=device_sets[i] if device_sets else None,
+            )
+            for i in range(size)
+        ]
+        self.model_options = VLLM_MODEL_OPTIONS if model_options is None else model_options
+        self.resident = collections.OrderedDict()  # model name -> slot, least recently used first
+        self.loading = {}  # model name -> (slot, Future)
+        self.requests = collections.Counter()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=size)
+
+    def get(self, model_name: str) -> VLLMServerManager:
+        """Return the ready server for `model_name`, starting it (and evicting if needed) first."""
+        with self._lock:
+            self.requests[model_name] += 1
+        return self._schedule(model_name, evict=True).result()
+
+    def completions_url(self, model_name: str) -> str:
+        return self.get(model_name).completions_url
+
+    def preload(self, model_name: str) -> Optional[Future]:
+        """
+        Start `model_name` in the background.
+
+        Only the least recently used model is ever evicted, and never the most recently
+        used one, so preloading cannot take down the model currently in use. Returns None
+        when no slot can be freed.
+        """
+        return self._schedule(model_name, evict=False)
+
+    def preload_likely(self, candidates: Iterable[str]) -> Optional[Future]:
+        """Preload the most requested non-resident model among `candidates` into a free slot."""
+        with self._lock:
+            options = [m for m in candidates if m not in self.resident and m not in self.loading]
+            if not options or len(self.resident) + len(self.loading) >= len(self.slots):
+                return None
+            model_name = max(options, key=lambda m: self.requests[m])
+        return self.preload(model_name)
+
+    def is_resident(self, model_name: str) -> bool:
+        with self._lock:
+            return model_name in self.resident
+
+    def models(self) -> List[str]:
+        """Resident models, most recently used first."""
+        with self._lock:
+            return list(reversed(self.resident))
+
+    def _schedule(self, model_name: str, evict: bool) -> Optional[Future]:
+        with self._lock:
+            if model_name in self.resident:
+                if evict:
+                    self.resident.move_to_end(model_name)
+                future = Future()
+                future.set_result(self.resident[model_name])
+                return future
+            if model_name in self.loading:
+                return self.loading[model_name][1]
+
+            slot = self._claim_slot(evict)
+            if slot is None:
+                if evict:
+                    raise RuntimeError(f"All {len(self.slots)} model slots are busy loading.")
+                return None
+            future = self._executor.submit(self._load, slot, model_name)
+            self.loading[model_name] = (slot, future)
+            return future
+
+    def _claim_slot(self, evict: bool) -> Optional[VLLMServerManager]:
+        # Called with the lock held.
+        busy = set(map(id, self.resident.values())) | {id(slot) for slot, _ in self.loading.values()}
+        for slot in self.slots:
+            if id(slot) not in busy:
+                return slot
+        if not self.resident or (not evict and len(self.resident) < 2):
+            return None
+        model_name, slot = self.resident.popitem(last=False)
+        print(f"Evicting '{model_name}' from port {slot.port}.")
+        return slot
+
+    def _load(self, slot: VLLMServerManager, model_name: str) -> VLLMServerManager:
+        try:
+            slot.start_server(model_name, **self.model_options.get(model_name, {}))
+        except BaseException:
+            # start_server has already stopped the process.
+            with self._lock:
+                self.loading.pop(model_name, None)
+            raise
+        with self._lock:
+            self.loading.pop(model_name, None)
+            self.resident[model_name] = slot
+        return slot
+
+    def stop_all(self):
+        with self._lock:
+            self.resident.clear()
+        for slot in self.slots:
+            slot.stop_server()
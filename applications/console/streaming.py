@@ -0,0 +1,40 @@
+import json
+
+from typing import AsyncIterator, Dict, Iterator
+
+
+def iter_completion_stream(response) -> Iterator[Dict]:
+    """
+    Parse the server-sent events of a streamed OpenAI-compatible completion.
+
+    Args:
+      response: A `requests` response opened with stream=True.
+
+    Yields:
+      Each decoded JSON chunk, until the terminating `data: [DONE]` event.
+    """
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        yield json.loads(data)
+
+
+def chunk_text(chunk: Dict) -> str:
+    choices = chunk.get("choices") or []
+    if not choices:
+        return ""
+    return choices[0].get("text") or ""
+
+
+async def aiter_completion_stream(response) -> AsyncIterator[Dict]:
+    """Async counterpart of iter_completion_stream for an `httpx` streaming response."""
+    async for line in response.aiter_lines():
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        yield json.loads(data)
@@ -0,0 +1,78 @@
+import hashlib
+import math
+import time
+
+from typing import Optional
+from urllib.parse import urlsplit
+
+from cache import LRUCache
+from config import API_URL, MODEL_NAME, TOKENIZE_URL, TOKEN_COUNT_CACHE_SIZE, TOKENIZE_RETRY_AFTER
+from http_client import get_http_client
+
+
+def tokenize_url_for(api_url: str) -> str:
+    """The /tokenize endpoint of the server behind an OpenAI-compatible completions URL."""
+    parts = urlsplit(api_url)
+    return f"{parts.scheme}://{parts.netloc}/tokenize"
+
+
+class TokenCounter:
+    """
+    Count tokens the way the served model does.
+
+    Uses vLLM's /tokenize endpoint (TOKENIZE_URL, or the one on `api_url`'s server) and
+    caches counts per text. If the server cannot be reached, falls back to the model's local
+    Hugging Face tokenizer when `transformers` is installed, and otherwise to a ~4 characters
+    per token estimate. After a failure the server is left alone for `retry_after` seconds,
+    so an unreachable endpoint costs one connect timeout rather than one per text.
+    """
+
+    def __init__(self, model_name: str = MODEL_NAME, tokenize_url: Optional[str] = TOKENIZE_URL, cache_size: int = TOKEN_COUNT_CACHE_SIZE,
+                 api_url: Optional[str] = API_URL, retry_after: float = TOKENIZE_RETRY_AFTER):
+        self.model_name = model_name
+        self.tokenize_url = tokenize_url or (tokenize_url_for(api_url) if api_url else None)
+        self.cache = LRUCache(cache_size)
+        self.retry_after = retry_after
+        self._remote_down_until = 0.0
+        self._local_tokenizer = None
+        self._local_loaded = False
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        n = self.cache.get(key)
+        if n is None:
+            n = self._count_remote(text)
+            if n is None:
+                n = self._count_local(text)
+            self.cache.set(key, n)
+        return n
+
+    def _count_remote(self, text: str) -> Optional[int]:
+        if not self.tokenize_url or time.monotonic() < self._remote_down_until:
+            return None
+        try:
+            response = get_http_client().post(
+                self.tokenize_url,
+                json={"model": self.model_name, "prompt": text, "add_special_tokens": False},
+                timeout=(1, 5),
+            )
+            response.raise_for_status()
+            return response.json()["count"]
+        except Exception as e:
+            self._remote_down_until = time.monotonic() + self.retry_after
+            print(f"Warning: Token counting via {self.tokenize_url} failed ({e}); counting locally for {self.retry_after}s.")
+            return None
+
+    def _count_local(self, text: str) -> int:
+        if not self._local_loaded:
+            self._local_loaded = True
+            try:
+                from transformers import AutoTokenizer
+                self._local_tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            except Exception:
+                self._local_tokenizer = None
+        if self._local_tokenizer is not None:
+            return len(self._local_tokenizer.encode(text, add_special_tokens=False))
+        return math.ceil(len(text) / 4)
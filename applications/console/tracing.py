@@ -0,0 +1,230 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence
+
+from config import TRACING_ENABLED, TRACE_JSONL_PATH, METRICS_PORT
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = None
+        self.trace_id = None
+        self.start = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.parent = stack[-1] if stack else None
+        self.trace_id = self.parent.trace_id if self.parent else uuid.uuid4().hex
+        stack.append(self)
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        stack = self.tracer._stack()
+        # Spans held open across generator yields can exit out of order.
+        if stack and stack[-1] is self:
+            stack.pop()
+        elif self in stack:
+            stack.remove(self)
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._finish(self, duration)
+        return False
+
+
+class Tracer:
+    """
+    Spans around pipeline stages with histogram aggregation.
+
+    Finished spans are aggregated into a `stage_duration_seconds` histogram labelled by
+    span name and, optionally, appended to a JSON-lines file. Other measurements (token
+    counts, time to first token) go through observe(). When disabled, span() returns a
+    shared no-op object and observe() returns immediately.
+    """
+
+    def __init__(self, enabled: bool = TRACING_ENABLED, jsonl_path: Optional[str] = TRACE_JSONL_PATH):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._histograms = {}  # (metric, label value) -> Histogram
+        self._jsonl = None
+
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attrs)
+
+    def observe(self, metric: str, value: float, label: str = "", buckets: Sequence[float] = LATENCY_BUCKETS):
+        if not self.enabled or value is None:
+            return
+        with self._lock:
+            histogram = self._histograms.get((metric, label))
+            if histogram is None:
+                histogram = self._histograms[(metric, label)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def observe_usage(self, usage: Optional[Dict], model: str = ""):
+        """Record prompt/completion token counts from an OpenAI-style `usage` object."""
+        if not self.enabled or not usage:
+            return
+        self.observe("llm_prompt_tokens", usage.get("prompt_tokens"), model, TOKEN_BUCKETS)
+        self.observe("llm_completion_tokens", usage.get("completion_tokens"), model, TOKEN_BUCKETS)
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _finish(self, span: Span, duration: float):
+        self.observe("stage_duration_seconds", duration, span.name)
+        if self.jsonl_path:
+            record = {
+                "name": span.name,
+                "trace_id": span.trace_id,
+                "span_id": span.span_id,
+                "parent_id": span.parent.span_id if span.parent else None,
+                "start": span.wall_start,
+                "duration": duration,
+                "attrs": span.attrs,
+            }
+            line = json.dumps(record, default=str)
+            with self._lock:
+                if self._jsonl is None:
+                    if os.path.dirname(self.jsonl_path):
+                        os.makedirs(os.path.dirname(self.jsonl_path), exist_ok=True)
+                    self._jsonl = open(self.jsonl_path, "a", encoding="utf-8")
+                self._jsonl.write(line + "\n")
+                self._jsonl.flush()
+
+    def render_prometheus(self) -> str:
+        """Current histograms in the Prometheus text exposition format."""
+        label_names = {
+            "stage_duration_seconds": "stage",
+            "llm_prompt_tokens": "model",
+            "llm_completion_tokens": "model",
+            "llm_time_to_first_token_seconds": "model",
+            "vllm_time_to_ready_seconds": "model",
+        }
+        lines = []
+        with self._lock:
+            items = sorted(self._histograms.items())
+        seen = set()
+        for (metric, label), histogram in items:
+            name = f"rag_{metric}"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {name} histogram")
+            label_name = label_names.get(metric, "label")
+            base = f'{label_name}="{label}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{base},le="+Inf"}} {histogram.count}')
+            lines.append(f"{name}_sum{{{base}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{base}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict:
+        """Histogram summaries as plain data: {metric: {label: {"count", "sum", "mean"}}}."""
+        result = {}
+        with self._lock:
+            for (metric, label), histogram in self._histograms.items():
+                result.setdefault(metric, {})[label] = {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                }
+        return result
+
+    def serve_metrics(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """Serve render_prometheus() on http://host:port/metrics from a background thread."""
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = tracer.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+tracer = Tracer()
+
+
+def traced(name: str):
+    """Decorator running the function inside `tracer.span(name)`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+if tracer.enabled and METRICS_PORT:
+    tracer.serve_metrics(METRICS_PORT)
@@ -1,11 +1,60 @@
+import copy
+import json
+import re
+import threading
 import time
 import weaviate 
 
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional
+from weaviate.config import Config, ConnectionConfig
+from weaviate.exceptions import UnexpectedStatusCodeException
+from weaviate.gql.get import HybridFusion
+from weaviate.util import generate_uuid5
+
+from cache import LRUCache
+from chunker import Chunker
+from config import (
+    BATCH_SIZE, BATCH_NUM_WORKERS, BATCH_DYNAMIC, BATCH_MAX_RETRIES,
+    WEAVIATE_POOL_CONNECTIONS, WEAVIATE_POOL_MAXSIZE, WEAVIATE_TIMEOUT,
+    RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL, QUERY_EMBEDDING_CACHE_SIZE, T2V_INFERENCE_URL, ITER_PAGE_SIZE,
+    DELETE_BATCH_SIZE, RETRIEVAL_MODE, HYBRID_ALPHA, HYBRID_FUSION, MMR_LAMBDA, MMR_FETCH_K,
+    FEDERATED_TIMEOUT, FEDERATED_MAX_WORKERS, FEDERATED_NORMALIZATION,
+)
+from embedder import Embedder, get_embedder
+from http_client import get_http_client
+from manifest import IngestManifest, content_hash
+from rerank import mmr_select
+from tracing import traced
 
 class WeaviateClient:
-    def __init__(self, url: str = "http://localhost:8080"):
-        self.client = weaviate.Client(url)
+    RETRIEVAL_MODES = {"vector", "hybrid"}
+    NORMALIZATIONS = {"minmax", "zscore", "none"}
+    # replace_class_contents stages new contents in "<Class>_staging_<timestamp>".
+    STAGING_SUFFIX_RE = re.compile(r"_staging_\d+$")
+
+    def __init__(self, url: str = "http://localhost:8080", t2v_url: Optional[str] = T2V_INFERENCE_URL, embedder: Optional[Embedder] = None, manifest: Optional[IngestManifest] = None):
+        self.url = url
+        self.client = self._connect(WEAVIATE_TIMEOUT)
+        # Callables notified with a class name whenever that class's objects change.
+        self.change_listeners = []
+
+        # Retrieval results are keyed by the class's generation, bumped on every write,
+        # so a write makes all earlier results for that class unreachable.
+        self.retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+        self.query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+        self.t2v_url = t2v_url.rstrip("/") if t2v_url else None
+        # With a client-side embedder, objects are uploaded with precomputed vectors and
+        # queries use nearVector; new classes then have no server-side vectorizer.
+        self.embedder = embedder or get_embedder()
+        # Ingest manifest used by sync_documents; cleared for a class whenever the class is dropped or created fresh.
+        self.manifest = manifest
+        self._generations = {}
+        self._properties = {}
+        self._generation_lock = threading.Lock()
+        self._federation_executor = None
+        # Federated retrieval workers query through a client with a shorter read timeout (see _federation_pool).
+        self._thread_state = threading.local()
 
         while True:
             try:
@@ -16,10 +65,34 @@ class WeaviateClient:
                 pass
             time.sleep(1)
 
+    def _connect(self, timeout_config) -> weaviate.Client:
+        return weaviate.Client(
+            self.url,
+            timeout_config=timeout_config,
+            additional_config=Config(
+                connection_config=ConnectionConfig(
+                    session_pool_connections=WEAVIATE_POOL_CONNECTIONS,
+                    session_pool_maxsize=WEAVIATE_POOL_MAXSIZE,
+                )
+            ),
+        )
+
+    @classmethod
+    def is_staging_class(cls, class_name: str) -> bool:
+        """Whether `class_name` is a staging class of replace_class_contents, kept only for recovery."""
+        return bool(cls.STAGING_SUFFIX_RE.search(class_name))
+
+    @property
+    def _query_client(self) -> weaviate.Client:
+        # The client retrieval should use on this thread.
+        return getattr(self._thread_state, "client", self.client)
+
+    @traced("weaviate.get_classes")
     def get_classes(self):
         schema = self.client.schema.get()
         return [cls["class"].lower() for cls in schema.get("classes", [])]
     
+    @traced("weaviate.create_class")
     def create_class(self, class_name: str):
         if class_name.lower() in self.get_classes():
             print(f"Class '{class_name}' already exists.")
@@ -27,60 +100,670 @@ class WeaviateClient:
         try:
             self.client.schema.create_class({
                 "class": class_name,
-                "vectorizer": "text2vec-transformers",
+                "vectorizer": self.vectorizer,
                 "properties": [
                     {"name": "title", "dataType": ["string"]},
-                    {"name": "content", "dataType": ["text"]}
+                    {"name": "content", "dataType": ["text"]},
+                    {"name": "chunk_index", "dataType": ["int"]},
+                    {"name": "offset", "dataType": ["int"]},
+                    {"name": "content_hash", "dataType": ["string"]}
                 ]
             })
+            self._drop_manifest(class_name)
             print(f"Created new class '{class_name}'.")
             return True
         except Exception as e:
             raise e
     
+    @property
+    def vectorizer(self) -> str:
+        return "none" if self.embedder is not None else "text2vec-transformers"
+
+    @traced("weaviate.get_documents")
     def get_documents(self, class_name: str):
         try:
-            res = self.client.query.get(class_name, ["title"]).do()
-            objs = res.get("data", {}).get("Get", {}).get(class_name, [])
-            return [obj["title"] for obj in objs]
+            return [obj["title"] for obj in self.iter_objects(class_name, ["title"])]
         except Exception as e:
-            raise(f"Failed to fetch existing documents in '{class_name}': {e}")
-        
-    def upload_documents(self, class_name: str, docs: List[Dict]):
-        existing_docs = self.get_documents(class_name=class_name)
-        skipped, uploaded = 0, 0
+            raise RuntimeError(f"Failed to fetch existing documents in '{class_name}': {e}") from e
+
+    def iter_objects(self, class_name: str, properties: Optional[List[str]] = None, page_size: int = ITER_PAGE_SIZE, prefetch: bool = True, additional: Optional[List[str]] = None) -> Iterator[Dict]:
+        """
+        Iterate over every object of a class with Weaviate's `after` cursor.
+
+        Objects come in id order, `page_size` per request, with their id under `_additional`.
+        At most two pages are held in memory; with `prefetch` the next page is requested
+        while the current one is being consumed.
+
+        Args:
+          class_name: Class to iterate.
+          properties: Properties to return (default title).
+          page_size: Objects per request.
+          prefetch: Fetch the next page in a background thread.
+          additional: Extra `_additional` fields besides the id, e.g. ["vector"].
+        """
+        properties = properties or ["title"]
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            page = self.list_documents(class_name, page_size, properties=properties, additional=additional)
+            while page:
+                after = page[-1]["_additional"]["id"]
+                full = len(page) == page_size
+                next_page = executor.submit(self.list_documents, class_name, page_size, after, properties, additional) if executor and full else None
+                yield from page
+                if not full:
+                    return
+                page = next_page.result() if next_page else self.list_documents(class_name, page_size, after, properties, additional)
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    @traced("weaviate.count_documents")
+    def count_documents(self, class_name: str) -> int:
+        res = self.client.query.aggregate(class_name).with_meta_count().do()
+        if res.get("errors"):
+            raise RuntimeError(res["errors"])
+        groups = res.get("data", {}).get("Aggregate", {}).get(class_name) or [{}]
+        return groups[0].get("meta", {}).get("count", 0)
+
+    @traced("weaviate.list_documents")
+    def list_documents(self, class_name: str, limit: int, after: Optional[str] = None, properties: Optional[List[str]] = None, additional: Optional[List[str]] = None) -> List[Dict]:
+        """One page of objects in id order, starting after the object id `after`, with ids under `_additional`."""
+        builder = self.client.query.get(class_name, properties or ["title"]) \
+                .with_additional(["id"] + (additional or [])) \
+                .with_limit(limit)
+        if after:
+            builder = builder.with_after(after)
+        res = builder.do()
+        if res.get("errors"):
+            raise RuntimeError(res["errors"])
+        return res.get("data", {}).get("Get", {}).get(class_name) or []
+
+    @traced("weaviate.get_object")
+    def get_object(self, class_name: str, obj_id: str) -> Optional[Dict]:
+        """Properties of a single object, or None if it does not exist."""
+        obj = self.client.data_object.get_by_id(obj_id, class_name=class_name)
+        return obj["properties"] if obj else None
+
+    @traced("weaviate.export_documents")
+    def export_documents(self, class_name: str, path: str, properties: Optional[List[str]] = None) -> int:
+        """Stream a class to a JSON-lines file of {"id", **properties}. Returns the number of objects written."""
+        count = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for obj in self.iter_objects(class_name, properties or self.get_properties(class_name)):
+                record = {"id": obj.pop("_additional")["id"], **obj}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        print(f"Exported {count} object(s) from '{class_name}' to {path}.")
+        return count
+
+    @traced("weaviate.upload_documents")
+    def upload_documents(
+        self,
+        class_name: str,
+        docs: List[Dict],
+        batch_size: int = BATCH_SIZE,
+        num_workers: int = BATCH_NUM_WORKERS,
+        dynamic: bool = BATCH_DYNAMIC,
+        max_retries: int = BATCH_MAX_RETRIES,
+        skip_existing: bool = True,
+    ) -> Dict[str, List]:
+        """
+        Upload documents through Weaviate's batch API, skipping titles that already exist.
+
+        With a client-side embedder, all contents are embedded up front in large batches
+        (cached vectors are reused) and sent along with the objects.
+
+        Args:
+          class_name: Target class.
+          docs: Documents with at least a "title" and "content".
+          batch_size: Objects per batch request (initial size when dynamic).
+          num_workers: Parallel batch workers.
+          dynamic: Let the client adapt the batch size to the observed latency.
+          max_retries: Times a failed object is re-queued before it is reported as failed.
+          skip_existing: Skip documents whose title is already in the class. When False,
+            objects are upserted by their deterministic id.
+
+        Returns:
+          A report {"uploaded": [titles], "skipped": [titles], "failed": [{"title", "error"}]}.
+        """
+        # Stream the class and keep only titles we are about to upload, so memory does not grow with the class.
+        incoming = {doc["title"] for doc in docs}
+        existing_docs = {obj["title"] for obj in self.iter_objects(class_name, ["title"]) if obj["title"] in incoming} if skip_existing else set()
+        report = {"uploaded": [], "skipped": [], "failed": []}
+
+        pending = {}
         for doc in docs:
             if doc["title"] in existing_docs:
                 print(f"Skipped: `{doc['title']}` already exists in `{class_name}`.")
-                skipped += 1
+                report["skipped"].append(doc["title"])
             else:
-                try:
-                    self.client.data_object.create(doc, class_name)
-                    uploaded += 1
-                except Exception as e:
-                    raise(f"Failed to upload `{doc['title']}`: {e}")
-        
-        if uploaded:
-            print(f"Uploaded {uploaded} new document(s) to '{class_name}'.")
-        if skipped:
-            print(f"Skipped {skipped} duplicate document(s).")
+                pending[generate_uuid5(self._object_key(doc), class_name)] = doc
+
+        vectors = {}
+        if self.embedder is not None and pending:
+            vectors = dict(zip(pending, self.embedder.embed([doc["content"] for doc in pending.values()])))
+
+        attempt = 0
+        while pending:
+            errors = self._send_batch(class_name, pending, batch_size, num_workers, dynamic, vectors)
+            for obj_id, doc in pending.items():
+                if obj_id not in errors:
+                    report["uploaded"].append(doc["title"])
+
+            attempt += 1
+            if attempt > max_retries:
+                for obj_id, error in errors.items():
+                    print(f"Failed to upload `{pending[obj_id]['title']}`: {error}")
+                    report["failed"].append({"title": pending[obj_id]["title"], "error": error})
+                break
+            pending = {obj_id: pending[obj_id] for obj_id in errors}
+
+        if report["uploaded"]:
+            self._notify_change(class_name)
+            print(f"Uploaded {len(report['uploaded'])} new document(s) to '{class_name}'.")
+        if report["skipped"]:
+            print(f"Skipped {len(report['skipped'])} duplicate document(s).")
+        if report["failed"]:
+            print(f"Failed to upload {len(report['failed'])} document(s).")
         print()
+        return report
+
+    @traced("weaviate.sync_documents")
+    def sync_documents(self, class_name: str, docs: List[Dict], manifest: Optional[IngestManifest] = None, chunker: Optional[Chunker] = None, prune: bool = False) -> Dict[str, List[str]]:
+        """
+        Incrementally bring a class in line with `docs` using a content-hash manifest.
+
+        Unchanged documents are skipped, modified ones are re-uploaded under the same
+        object ids (left-over chunks are deleted) and, with `prune`, documents that are in
+        the manifest but not in `docs` are removed. Weaviate is never scanned, so the cost
+        is proportional to the number of changed documents.
+
+        Args:
+          class_name: Target class.
+          docs: The complete current set of {"title", "content"} documents.
+          manifest: Manifest tracking what was previously ingested into the class (default: the client's).
+          chunker: Optional chunker applied to new and modified documents.
+          prune: Delete documents missing from `docs`.
+
+        Returns:
+          A report {"added": [...], "updated": [...], "unchanged": [...], "deleted": [...], "failed": [...]} of titles.
+        """
+        manifest = manifest or self.manifest
+        if manifest is None:
+            raise ValueError("sync_documents needs an IngestManifest.")
+        known = manifest.get(class_name)
+        report = {"added": [], "updated": [], "unchanged": [], "deleted": [], "failed": []}
+
+        objects, changed = [], {}
+        for doc in docs:
+            digest = content_hash(doc["content"])
+            previous = known.get(doc["title"])
+            if previous and previous[0] == digest:
+                report["unchanged"].append(doc["title"])
+                continue
+
+            parts = chunker.chunk_document(doc) if chunker else [dict(doc)]
+            for part in parts:
+                part["content_hash"] = digest
+            objects.extend(parts)
+            ids = [generate_uuid5(self._object_key(part), class_name) for part in parts]
+            changed[doc["title"]] = (digest, ids, previous)
+
+        upload = self.upload_documents(class_name, objects, skip_existing=False) if objects else {"failed": []}
+        failed = {f["title"] for f in upload["failed"]}
+
+        stale = []
+        for title, (digest, ids, previous) in changed.items():
+            if title in failed:
+                report["failed"].append(title)
+                continue
+            if previous:
+                stale.extend(set(previous[1]) - set(ids))
+            manifest.record(class_name, title, digest, ids)
+            report["updated" if previous else "added"].append(title)
+
+        removed = []
+        if prune:
+            current = {doc["title"] for doc in docs}
+            for title, (_, ids) in known.items():
+                if title not in current:
+                    stale.extend(ids)
+                    removed.append(title)
+
+        if stale:
+            self.delete_objects(class_name, ids=stale)
+        for title in removed:
+            manifest.remove(class_name, title)
+            report["deleted"].append(title)
 
+        print(
+            f"Synced '{class_name}': {len(report['added'])} added, {len(report['updated'])} updated, "
+            f"{len(report['unchanged'])} unchanged, {len(report['deleted'])} deleted, {len(report['failed'])} failed."
+        )
+        return report
 
-    def query_documents(self, query: str, class_name: str, top_k: int = 3) -> List[Dict]:
+    @traced("weaviate.delete_object")
+    def delete_object(self, class_name: str, obj_id: str):
         try:
-            res = self.client.query.get(class_name, ["title", "content"]) \
-                    .with_near_text({"concepts": [query], "certainty":0.6 }) \
-                    .with_additional(["certainty"]) \
-                    .with_limit(top_k) \
-                    .do()
-            
-            docs = res.get("data", {}).get("Get", {}).get(class_name, [])
-
-            if isinstance(docs, dict):
-                docs = [docs]
-            
-            return docs
+            self.client.data_object.delete(obj_id, class_name=class_name)
+        except UnexpectedStatusCodeException as e:
+            # Already gone is fine; anything else is a real failure.
+            if e.status_code != 404:
+                raise
+        self._notify_change(class_name)
+
+    @staticmethod
+    def where_any(path: str, values: List[str]) -> Dict:
+        """`where` filter matching objects whose text property `path` equals any of `values`."""
+        return {"path": [path], "operator": "ContainsAny", "valueTextArray": list(values)}
+
+    @traced("weaviate.delete_objects")
+    def delete_objects(self, class_name: str, ids: Optional[List[str]] = None, where: Optional[Dict] = None, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Delete objects in bulk through the batch delete API.
+
+        Ids are deleted DELETE_BATCH_SIZE at a time. A `where` filter (e.g. where_any("title", titles)
+        or where_any("content_hash", hashes)) is re-applied until nothing matches, since the server
+        caps the objects deleted per request.
+
+        Args:
+          class_name: Class to delete from.
+          ids: Object ids to delete.
+          where: Weaviate `where` filter selecting the objects to delete.
+          dry_run: Only count the matching objects.
+
+        Returns:
+          {"matches": n, "deleted": n, "failed": n}
+        """
+        filters = []
+        if ids:
+            ids = list(dict.fromkeys(ids))
+            filters += [self.where_any("id", ids[i:i + DELETE_BATCH_SIZE]) for i in range(0, len(ids), DELETE_BATCH_SIZE)]
+        if where:
+            filters.append(where)
+
+        totals = {"matches": 0, "deleted": 0, "failed": 0}
+        for where_filter in filters:
+            first = True
+            while True:
+                res = self.client.batch.delete_objects(class_name, where=where_filter, output="minimal", dry_run=dry_run)
+                results = res.get("results", {})
+                if first:
+                    totals["matches"] += results.get("matches", 0)
+                    first = False
+                totals["deleted"] += results.get("successful", 0)
+                totals["failed"] += results.get("failed", 0)
+                # Fewer matches than the per-request limit means everything matching is gone.
+                if dry_run or not results.get("successful") or results.get("matches", 0) < results.get("limit", 0):
+                    break
+
+        if totals["deleted"]:
+            self._notify_change(class_name)
+        if totals["failed"]:
+            print(f"Failed to delete {totals['failed']} object(s) from '{class_name}'.")
+        return totals
+
+    @traced("weaviate.replace_class_contents")
+    def replace_class_contents(self, class_name: str, docs: List[Dict], chunker: Optional[Chunker] = None) -> Dict[str, int]:
+        """
+        Replace everything in a class with `docs`, building the new contents off to the side first.
+
+        The documents are uploaded and vectorized into a staging class. Only if that fully
+        succeeds is the original class dropped, recreated with the same schema and filled by
+        copying the staged objects together with their vectors (no second vectorization).
+        Readers see the old contents until the swap and a partially filled class only while
+        vectors are copied. On an upload failure the original class is left untouched.
+
+        The staging class is deleted only once every staged object has been copied back. If
+        the copy fails, it is kept so the data can be recovered, and a RuntimeError names it.
+
+        Returns:
+          {"objects": number of objects in the replaced class}
+        """
+        schema = self.client.schema.get(class_name)
+        staging = f"{schema['class']}_staging_{int(time.time())}"
+        self.client.schema.create_class(dict(schema, **{"class": staging}))
+        try:
+            objects = chunker.chunk_documents(docs) if chunker else [dict(doc) for doc in docs]
+            for obj in objects:
+                obj.setdefault("content_hash", content_hash(obj["content"]))
+            report = self.upload_documents(staging, objects, skip_existing=False)
+            if report["failed"]:
+                raise RuntimeError(f"Failed to stage {len(report['failed'])} document(s); '{class_name}' was not modified.")
+            staged = self.count_documents(staging)
+        except Exception:
+            self.client.schema.delete_class(staging)
+            raise
+
+        properties = [p["name"] for p in schema.get("properties", [])]
+        try:
+            self.client.schema.delete_class(class_name)
+            self._drop_manifest(class_name)
+            self.client.schema.create_class(schema)
+            count, errors = self._copy_objects(staging, class_name, properties)
+            if errors or count != staged:
+                raise RuntimeError(f"copied {count} of {staged} object(s), {len(errors)} error(s): {'; '.join(errors[:3])}")
+        except Exception as e:
+            self._notify_change(class_name)
+            raise RuntimeError(f"Failed to copy the new contents into '{class_name}' ({e}); they are kept in '{staging}'.") from e
+
+        self.client.schema.delete_class(staging)
+        self._notify_change(class_name)
+        print(f"Replaced contents of '{class_name}' with {count} object(s).")
+        return {"objects": count}
+
+    def _copy_objects(self, source: str, target: str, properties: List[str]):
+        # Returns (objects the server accepted, error messages for the rest).
+        sent, errors = 0, []
+        lock = threading.Lock()
+
+        def collect_errors(results):
+            for result in results or []:
+                messages = result.get("result", {}).get("errors", {}).get("error", [])
+                if messages:
+                    with lock:
+                        errors.append("; ".join(m.get("message", "") for m in messages))
+
+        with self.client.batch(batch_size=BATCH_SIZE, num_workers=BATCH_NUM_WORKERS, dynamic=BATCH_DYNAMIC, callback=collect_errors) as batch:
+            for obj in self.iter_objects(source, properties, additional=["vector"]):
+                vector = obj.pop("_additional")["vector"]
+                obj = {k: v for k, v in obj.items() if v is not None}
+                # Ids are derived from the class name, so re-derive them for the target class.
+                batch.add_data_object(obj, target, uuid=generate_uuid5(self._object_key(obj), target), vector=vector)
+                sent += 1
+        return sent - len(errors), errors
+
+    @traced("weaviate.delete_class")
+    def delete_class(self, class_name: str):
+        self.client.schema.delete_class(class_name)
+        self._drop_manifest(class_name)
+        self._notify_change(class_name)
+
+    def _drop_manifest(self, class_name: str):
+        # The manifest would otherwise report the documents of a dropped class as unchanged.
+        if self.manifest is not None:
+            self.manifest.drop_class(class_name)
+
+    def generation(self, class_name: str) -> int:
+        with self._generation_lock:
+            return self._generations.get(class_name.lower(), 0)
+
+    def _notify_change(self, class_name: str):
+        with self._generation_lock:
+            key = class_name.lower()
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._properties.pop(key, None)
+        for listener in self.change_listeners:
+            listener(class_name)
+
+    @staticmethod
+    def _object_key(doc: Dict) -> str:
+        # Chunks share their parent's title, so the chunk index is part of the identity.
+        if "chunk_index" in doc:
+            return f"{doc['title']}#{doc['chunk_index']}"
+        return doc["title"]
+
+    def _send_batch(self, class_name: str, objects: Dict[str, Dict], batch_size: int, num_workers: int, dynamic: bool, vectors: Optional[Dict] = None) -> Dict[str, str]:
+        # Returns {uuid: error message} for every object the server rejected.
+        errors = {}
+        lock = threading.Lock()
+
+        def collect_errors(results):
+            for result in results or []:
+                messages = result.get("result", {}).get("errors", {}).get("error", [])
+                if messages:
+                    with lock:
+                        errors[result["id"]] = "; ".join(m.get("message", "") for m in messages)
+
+        self.client.batch.configure(
+            batch_size=batch_size,
+            dynamic=dynamic,
+            num_workers=num_workers,
+            callback=collect_errors,
+        )
+        try:
+            with self.client.batch as batch:
+                for obj_id, doc in objects.items():
+                    vector = vectors.get(obj_id) if vectors else None
+                    batch.add_data_object(doc, class_name, uuid=obj_id, vector=vector)
         except Exception as e:
-            print(f"Failed to query documents: {e}")
+            # The whole request failed (e.g. connection lost); retry everything not confirmed.
+            for obj_id in objects:
+                errors.setdefault(obj_id, str(e))
+        return errors
+
+    def get_properties(self, class_name: str) -> List[str]:
+        key = class_name.lower()
+        if key not in self._properties:
+            schema = self._query_client.schema.get(class_name)
+            self._properties[key] = [prop["name"] for prop in schema.get("properties", [])]
+        return self._properties[key]
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.split())
+
+    @traced("weaviate.embed_query")
+    def embed_query(self, query: str) -> List[float]:
+        """Vectorize a query with the client-side embedder or the t2v-transformers inference API, caching vectors per query string."""
+        query = self.normalize_query(query)
+        if self.embedder is not None:
+            return self.embedder.embed_query(query)
+        vector = self.query_embedding_cache.get(query)
+        if vector is None:
+            http = get_http_client()
+            timeout = getattr(self._thread_state, "timeout", (http.connect_timeout, http.read_timeout))
+            response = http.post(f"{self.t2v_url}/vectors", json={"text": query}, timeout=timeout)
+            response.raise_for_status()
+            vector = response.json()["vector"]
+            self.query_embedding_cache.set(query, vector)
+        return vector
+
+    @traced("weaviate.query_documents")
+    def query_documents(
+        self,
+        query: str,
+        class_name: str,
+        top_k: int = 3,
+        group_by_parent: bool = False,
+        certainty: float = 0.6,
+        mode: str = RETRIEVAL_MODE,
+        alpha: float = HYBRID_ALPHA,
+        fusion_type: str = HYBRID_FUSION,
+        mmr_lambda: Optional[float] = MMR_LAMBDA,
+        fetch_k: int = MMR_FETCH_K,
+    ) -> List[Dict]:
+        """
+        Retrieve the objects most relevant to `query`.
+
+        Args:
+          query: Question text.
+          class_name: Class to search.
+          top_k: Number of results.
+          group_by_parent: Merge chunks of the same document.
+          certainty: Minimum certainty in "vector" mode.
+          mode: "vector" (nearText, or nearVector with an embedder or t2v endpoint) or "hybrid" (BM25 + vector).
+          alpha: Hybrid weighting, 0 is BM25 only and 1 is vector only.
+          fusion_type: Hybrid fusion, "relativeScoreFusion" or "rankedFusion".
+          mmr_lambda: When set, fetch `fetch_k` candidates with their vectors and keep `top_k`
+            by maximal marginal relevance, trading relevance (1.0) against diversity.
+          fetch_k: Candidates fetched for MMR.
+
+        Returns:
+          Objects with "certainty" ("vector") or "score" ("hybrid") and "id" under `_additional`.
+
+        Raises:
+          RuntimeError: Weaviate reported query errors. Connection errors propagate as well.
+        """
+        if mode not in self.RETRIEVAL_MODES:
+            raise ValueError(f"Unsupported retrieval mode: {mode}")
+        use_mmr = mmr_lambda is not None and fetch_k > top_k
+        cache_key = (
+            class_name.lower(), self.generation(class_name), self.normalize_query(query), certainty, top_k, group_by_parent,
+            mode, alpha if mode == "hybrid" else None, fusion_type if mode == "hybrid" else None, mmr_lambda if use_mmr else None, fetch_k if use_mmr else None,
+        )
+        cached = self.retrieval_cache.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
+        properties = ["title", "content"]
+        chunked = "chunk_index" in self.get_properties(class_name)
+        if chunked:
+            properties += ["chunk_index", "offset"]
+
+        query_vector = self.embed_query(query) if self.t2v_url or self.embedder is not None else None
+        builder = self._query_client.query.get(class_name, properties)
+        if mode == "hybrid":
+            builder = builder.with_hybrid(query, alpha=alpha, vector=query_vector, fusion_type=HybridFusion(fusion_type))
+            additional = ["score", "id"]
+        elif query_vector is not None:
+            builder = builder.with_near_vector({"vector": query_vector, "certainty": certainty})
+            additional = ["certainty", "id"]
+        else:
+            builder = builder.with_near_text({"concepts": [query], "certainty": certainty})
+            additional = ["certainty", "id"]
+        if use_mmr:
+            additional.append("vector")
+        res = builder \
+                .with_additional(additional) \
+                .with_limit(fetch_k if use_mmr else top_k) \
+                .do()
+        if res.get("errors"):
+            raise RuntimeError(res["errors"])
+        
+        docs = res.get("data", {}).get("Get", {}).get(class_name, [])
+
+        if isinstance(docs, dict):
+            docs = [docs]
+
+        if use_mmr:
+            # In hybrid mode the fused BM25 + vector score is the relevance term, not cosine similarity alone.
+            docs = self.mmr_rerank(docs, top_k, mmr_lambda, query_vector if mode == "vector" else None)
+
+        if chunked and group_by_parent:
+            docs = self.group_chunks(docs)
+
+        self.retrieval_cache.set(cache_key, copy.deepcopy(docs))
+        return docs
+
+    @traced("weaviate.query_classes")
+    def query_classes(
+        self,
+        query: str,
+        class_names: List[str],
+        top_k: int = 3,
+        timeout: float = FEDERATED_TIMEOUT,
+        normalization: str = FEDERATED_NORMALIZATION,
+        **kwargs,
+    ) -> List[Dict]:
+        """
+        Federated retrieval: query several classes in parallel and merge a global top-k.
+
+        Each class is searched with query_documents (extra keyword arguments are passed on)
+        on a shared thread pool. Scores are normalized within each class so classes whose
+        scores are distributed differently can be ranked together. A class that has not
+        answered within `timeout` seconds is left out of this answer instead of delaying it;
+        its query is cancelled if it has not started, and otherwise gives up once the
+        FEDERATED_TIMEOUT read timeout of the pool's requests expires.
+
+        Returns:
+          The best `top_k` objects overall, with "class" and "normalized_score" added under `_additional`.
+        """
+        if normalization not in self.NORMALIZATIONS:
+            raise ValueError(f"Unsupported score normalization: {normalization}")
+        if not class_names:
             return []
+
+        executor = self._federation_pool()
+        futures = {executor.submit(self.query_documents, query, name, top_k, **kwargs): name for name in class_names}
+        done, pending = wait(futures, timeout=timeout)
+        for future in pending:
+            future.cancel()
+            print(f"Warning: Retrieval from '{futures[future]}' timed out after {timeout}s; answering without it.")
+
+        merged = []
+        for future in done:
+            name = futures[future]
+            try:
+                docs = future.result()
+            except Exception as e:
+                print(f"Warning: Retrieval from '{name}' failed: {e}")
+                continue
+            scores = self.normalize_scores([self.relevance(d) for d in docs], normalization)
+            for doc, score in zip(docs, scores):
+                doc.setdefault("_additional", {}).update({"class": name, "normalized_score": score})
+                merged.append(doc)
+
+        merged.sort(key=lambda d: (d["_additional"]["normalized_score"], self.relevance(d)), reverse=True)
+        return merged[:top_k]
+
+    @staticmethod
+    def normalize_scores(scores: List[float], normalization: str = FEDERATED_NORMALIZATION) -> List[float]:
+        """Map one class's scores to a common scale: min-max to [0, 1], z-scores, or unchanged."""
+        if not scores or normalization == "none":
+            return list(scores)
+        if normalization == "minmax":
+            low, high = min(scores), max(scores)
+            return [(s - low) / (high - low) if high > low else 1.0 for s in scores]
+        mean = sum(scores) / len(scores)
+        std = (sum((s - mean) ** 2 for s in scores) / len(scores)) ** 0.5
+        return [(s - mean) / std if std > 0 else 0.0 for s in scores]
+
+    def _federation_pool(self) -> ThreadPoolExecutor:
+        with self._generation_lock:
+            if self._federation_executor is None:
+                # Workers query with a read timeout of at most FEDERATED_TIMEOUT, so a slow class
+                # cannot hold a worker, and starve later queries, for the full WEAVIATE_TIMEOUT.
+                timeout = (WEAVIATE_TIMEOUT[0], min(WEAVIATE_TIMEOUT[1], FEDERATED_TIMEOUT))
+                client = self._connect(timeout)
+
+                def init_worker():
+                    self._thread_state.client = client
+                    self._thread_state.timeout = timeout
+
+                self._federation_executor = ThreadPoolExecutor(max_workers=FEDERATED_MAX_WORKERS, thread_name_prefix="federated-retrieval", initializer=init_worker)
+            return self._federation_executor
+
+    @staticmethod
+    def relevance(doc: Dict) -> float:
+        """Retrieval score of a result: certainty for vector search, fused score for hybrid search."""
+        additional = doc.get("_additional") or {}
+        value = additional.get("certainty")
+        if value is None:
+            value = additional.get("score")
+        return float(value) if value is not None else 0.0
+
+    @classmethod
+    def mmr_rerank(cls, docs: List[Dict], top_k: int, mmr_lambda: float, query_vector: Optional[List[float]] = None) -> List[Dict]:
+        """Keep `top_k` of `docs` by maximal marginal relevance over their `_additional.vector`, dropping the vectors."""
+        vectors = [(d.get("_additional") or {}).pop("vector", None) for d in docs]
+        if len(docs) <= top_k or any(v is None for v in vectors):
+            return docs[:top_k]
+        order = mmr_select(vectors, top_k, mmr_lambda, query_vector=query_vector, relevance=[cls.relevance(d) for d in docs])
+        return [docs[i] for i in order]
+
+    @staticmethod
+    def group_chunks(chunks: List[Dict]) -> List[Dict]:
+        """
+        Merge retrieved chunks of the same parent document into one entry.
+
+        Chunks are joined in document order; the group keeps the best certainty (or hybrid
+        score) of its chunks and groups are ordered by it.
+        """
+        groups = {}
+        for chunk in chunks:
+            groups.setdefault(chunk["title"], []).append(chunk)
+
+        merged = []
+        for title, members in groups.items():
+            members.sort(key=lambda c: c.get("offset") or 0)
+            score_key = "certainty" if any("certainty" in (c.get("_additional") or {}) for c in members) else "score"
+            ids = [c["_additional"]["id"] for c in members if (c.get("_additional") or {}).get("id")]
+            merged.append({
+                "title": title,
+                "content": "\n...\n".join(c["content"] for c in members),
+                "chunks": [c.get("chunk_index") for c in members],
+                "_additional": {score_key: max(WeaviateClient.relevance(c) for c in members), "id": ",".join(ids)},
+            })
+        merged.sort(key=WeaviateClient.relevance, reverse=True)
+        return merged
@@ -1,11 +1,21 @@
 import os
-import psutil
-import requests
 import streamlit as st
-import subprocess
-import signal
+import sys
 import time
-import weaviate
+import uuid
+
+from weaviate.exceptions import UnexpectedStatusCodeException
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "console"))
+from cache import ResponseCache
+from client_rag import build_prefix_stable_prompt
+from config import RESPONSE_CACHE_SAMPLED, SESSION_HEADER, VIEWER_PAGE_SIZE
+from http_client import get_http_client
+from manifest import IngestManifest
+from server_manager import ModelServerPool
+from streaming import chunk_text, iter_completion_stream
+from tracing import tracer
+from weaviate_store import WeaviateClient
 
 # -------------------------------
 # Constants & Utilities
@@ -19,119 +29,122 @@ MODELS = [
 API_PORT = 8000
 API_URL = f"http://localhost:{API_PORT}/v1/completions"
 TOP_K = 2
+# (connect, read) timeout for streamed generation; read applies between chunks
+STREAM_TIMEOUT = (5, 60)
 
-class VLLMServerManager:
-    def __init__(self, port=API_PORT):
-        self.port = port
-        self.process = None
-        self.current_model = None
-        self.log_file = f"logs/vllm_multi_{self.port}.log"
-        
-        if not os.path.exists("logs"):
-            os.makedirs("logs")
-
-    def start_server(self, model_name):
-        self.stop_server()  # kill old first
-
-        cmd = [
-            "vllm", "serve", model_name,
-            "--host", "0.0.0.0",
-            "--port", str(self.port),
-            "--tensor-parallel-size", "4",
-            "--max-model-len", "32768",
-            "--enforce-eager"
-        ]
-        log_f = open(self.log_file, "w")
-        self.process = subprocess.Popen(cmd, stdout=log_f, stderr=log_f)
-        log_f.close()
-        self.current_model = model_name
-
-        self._wait_for_ready()
-
-    def _wait_for_ready(self, timeout=300):
-        start = time.time()
-        while time.time() - start < timeout:
-            if not os.path.exists(self.log_file):
-                time.sleep(1)
-                continue
-            with open(self.log_file, "r") as f:
-                logs = f.read()
-            if "Application startup complete." in logs:
-                return
-            if self.process.poll() is not None:
-                raise RuntimeError("vLLM server exited unexpectedly")
-            time.sleep(1)
-        raise TimeoutError("vLLM server did not become ready in time")
-
-    def stop_server(self, notify_fn=None):
-        if self.process and self.process.poll() is None:
-            if notify_fn:
-                notify_fn("Stopping previous model server... Please wait.")
-            self._kill_process_tree(self.process.pid)
-            try:
-                self.process.wait(timeout=10)
-            except subprocess.TimeoutExpired:
-                if notify_fn:
-                    notify_fn("Process did not terminate in time, force killing...")
-                self._kill_process_tree(self.process.pid)
-            self.process = None
-            self.current_model = None   
-    
-    def _kill_process_tree(self, pid):
-        try:
-            parent = psutil.Process(pid)
-            children = parent.children(recursive=True)
-            for p in children:
-                p.terminate()
-            gone, alive = psutil.wait_procs(children, timeout=5)
-            for p in alive:
-                p.kill()
-            parent.terminate()
-            parent.wait(5)
-        except psutil.NoSuchProcess:
-            pass
-        except Exception as e:
-            print(f"Error killing process tree: {e}")
 
-def generate_text(model=None, query_text="", context="", temperature=0.7, top_p=0.9):
-    prompt = f"""You are an expert assistant. Based on the following documents, answer the question. (Note: If the documents are irrelevant, ignore mentioning them in the answer.)
+@st.cache_resource
+def get_server_pool():
+    # Shared across sessions: resident models are a property of the machine, not of a browser tab.
+    return ModelServerPool(base_port=API_PORT)
 
-    Documents:
-    {context}
 
-    Question:
-    {query_text}
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
 
-    Answer:"""
 
+def response_cache_key(data):
+    if data["temperature"] != 0 and not RESPONSE_CACHE_SAMPLED:
+        return None
+    params = {k: data[k] for k in ("max_tokens", "temperature", "top_p")}
+    return ResponseCache.make_key(data["model"], data["prompt"], params)
+
+
+def stream_text(model=None, query_text="", docs=None, temperature=0.7, top_p=0.9, stats=None, class_name="", session_id=None, api_url=API_URL):
+    """
+    Yield the answer token by token for st.write_stream.
+
+    Only the gap between chunks is bounded by the read timeout, so long answers are not
+    cut off. Time to first token is written to `stats["ttft"]` when a dict is passed.
+    The prompt uses the console client's prefix-stable layout, so both front ends share
+    the same cacheable prefix.
+    """
     data = {
         "model": model,
-        "prompt": prompt,
+        "prompt": build_prefix_stable_prompt(query_text, docs=docs),
         "max_tokens": 1000,
         "temperature": temperature,
         "top_p": top_p,
-        "stream": False,
+        "stream": True,
     }
+    start = time.perf_counter()
+    key = response_cache_key(data)
+    if key:
+        cached = get_response_cache().get(key)
+        if cached is not None:
+            if stats is not None:
+                stats["ttft"] = time.perf_counter() - start
+            yield cached
+            return
     try:
-        response = requests.post(API_URL, json=data, timeout=15)
-        response.raise_for_status()
-        return response.json()["choices"][0]["text"]
+        text = ""
+        headers = {SESSION_HEADER: session_id} if session_id else {}
+        with get_http_client().post(api_url, json=data, stream=True, timeout=STREAM_TIMEOUT, headers=headers) as response:
+            response.raise_for_status()
+            for chunk in iter_completion_stream(response):
+                delta = chunk_text(chunk)
+                if delta:
+                    if not text:
+                        tracer.observe("llm_time_to_first_token_seconds", time.perf_counter() - start, model)
+                    if stats is not None and "ttft" not in stats:
+                        stats["ttft"] = time.perf_counter() - start
+                    text += delta
+                    yield delta
+        if key:
+            get_response_cache().set(key, text, class_name)
     except Exception as e:
         st.error(f"Request failed: {e}")
-        return ""
 
 
-# Connect to Weaviate
-client = weaviate.Client("http://localhost:8080")
+@st.cache_resource
+def get_store():
+    store = WeaviateClient("http://localhost:8080", manifest=IngestManifest())
+    store.change_listeners.append(get_response_cache().invalidate_class)
+    store.change_listeners.append(lambda class_name: invalidate_viewer_cache())
+    return store
+
+
+@st.cache_data(show_spinner=False)
+def get_class_names():
+    return [cls["class"] for cls in get_store().client.schema.get().get("classes", [])]
+
+
+@st.cache_data(show_spinner=False)
+def get_class_count(class_name):
+    return get_store().count_documents(class_name)
+
+
+@st.cache_data(show_spinner=False)
+def get_class_page(class_name, after, page_size):
+    # Titles and ids only; a document's content is fetched by id when it is expanded.
+    return get_store().list_documents(class_name, limit=page_size, after=after, properties=["title"])
+
+
+@st.cache_data(show_spinner=False)
+def get_document_content(class_name, obj_id):
+    obj = get_store().get_object(class_name, obj_id)
+    return (obj or {}).get("content") or ""
+
+
+@st.cache_data(show_spinner=False)
+def get_class_titles(class_name):
+    # Distinct titles in first-seen order; chunks of one file share its title.
+    return list(dict.fromkeys(obj["title"] for obj in get_store().iter_objects(class_name, ["title"])))
+
+
+def invalidate_viewer_cache():
+    get_class_names.clear()
+    get_class_count.clear()
+    get_class_page.clear()
+    get_class_titles.clear()
+    get_document_content.clear()
+
 
+# Connect to Weaviate
 with st.spinner("Connecting to Weaviate..."):
-    while True:
-        try:
-            if client.is_ready():
-                break
-        except Exception:
-            pass
-        time.sleep(1)
+    store = get_store()
+client = store.client
 
 # Page Selection
 st.sidebar.title("Navigation")
@@ -144,23 +157,17 @@ if page == "📚 Document Viewer":
     st.title("Document Viewer & Manager")
 
     def get_document_list():
-        schema = client.schema.get()
-        return [cls["class"] for cls in schema.get("classes", [])]
+        return get_class_names()
 
     def create_class_if_missing(class_name):
-        classes = [c["class"].lower() for c in client.schema.get().get("classes", [])]
+        classes = [c.lower() for c in get_class_names()]
         if class_name.lower() in classes:
             st.info(f"Class '{class_name}' already exists.")
             return False
         try:
-            client.schema.create_class({
-                "class": class_name,
-                "vectorizer": "text2vec-transformers",
-                "properties": [
-                    {"name": "title", "dataType": ["string"]},
-                    {"name": "content", "dataType": ["text"]}
-                ]
-            })
+            # Through the store so the class gets the full schema and a fresh manifest entry.
+            get_store().create_class(class_name)
+            get_class_names.clear()
             st.success(f"Created new class '{class_name}'.")
             return True
         except UnexpectedStatusCodeException as e:
@@ -171,31 +178,56 @@ if page == "📚 Document Viewer":
                 raise e
 
     def upload_documents(class_name, docs):
-        existing_titles = set()
         try:
-            res = client.query.get(class_name, ["title"]).do()
-            objs = res.get("data", {}).get("Get", {}).get(class_name, [])
-            existing_titles = {obj["title"] for obj in objs}
+            report = store.upload_documents(class_name, docs)
         except Exception as e:
-            st.error(f"Failed to fetch existing documents in '{class_name}': {e}")
+            st.error(f"Failed to upload documents to '{class_name}': {e}")
             return
 
-        skipped, uploaded = 0, 0
-        for doc in docs:
-            if doc["title"] in existing_titles:
-                st.warning(f"Skipped: `{doc['title']}` already exists in `{class_name}`.")
-                skipped += 1
-            else:
+        for title in report["skipped"]:
+            st.warning(f"Skipped: `{title}` already exists in `{class_name}`.")
+        for failure in report["failed"]:
+            st.error(f"Failed to upload `{failure['title']}`: {failure['error']}")
+        if report["uploaded"]:
+            st.success(f"Uploaded {len(report['uploaded'])} new document(s) to '{class_name}'.")
+        if report["skipped"]:
+            st.info(f"Skipped {len(report['skipped'])} duplicate document(s).")
+
+    def render_class_documents(class_name):
+        try:
+            total = get_class_count(class_name)
+        except Exception as e:
+            st.error(f"Error reading '{class_name}': {e}")
+            return
+        if not total:
+            st.write("No documents in this class.")
+            return
+
+        # Cursor of each visited page's first object, so Previous needs no offset scan.
+        cursors = st.session_state.setdefault(f"cursors_{class_name}", [None])
+        try:
+            docs = get_class_page(class_name, cursors[-1], VIEWER_PAGE_SIZE)
+        except Exception as e:
+            st.error(f"Error reading '{class_name}': {e}")
+            return
+
+        first = (len(cursors) - 1) * VIEWER_PAGE_SIZE
+        st.caption(f"Showing {first + 1}-{first + len(docs)} of {total}")
+        prev_col, next_col = st.columns(2)
+        if prev_col.button("Previous", key=f"prev_{class_name}", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        if next_col.button("Next", key=f"next_{class_name}", disabled=len(docs) < VIEWER_PAGE_SIZE or first + len(docs) >= total):
+            cursors.append(docs[-1]["_additional"]["id"])
+            st.rerun()
+        for d in docs:
+            obj_id = d["_additional"]["id"]
+            st.markdown(f"**📄 {d.get('title', 'Untitled')}**")
+            if st.toggle("Show full content", key=f"full_{obj_id}"):
                 try:
-                    client.data_object.create(doc, class_name)
-                    uploaded += 1
+                    st.code(get_document_content(class_name, obj_id), language="text")
                 except Exception as e:
-                    st.error(f"Failed to upload `{doc['title']}`: {e}")
-        
-        if uploaded:
-            st.success(f"Uploaded {uploaded} new document(s) to '{class_name}'.")
-        if skipped:
-            st.info(f"Skipped {skipped} duplicate document(s).")
+                    st.error(f"Error reading document {obj_id}: {e}")
 
     # Sidebar: Upload documents
     st.sidebar.header("Upload Documents")
@@ -222,6 +254,11 @@ if page == "📚 Document Viewer":
         st.sidebar.info("No existing classes found.")
 
     uploaded_files = st.sidebar.file_uploader("Upload TXT files", type=["txt"], accept_multiple_files=True)
+    replace_contents = st.sidebar.checkbox(
+        "Replace existing contents",
+        help="Swap the selected class's documents for the uploaded files. The old contents stay queryable until the new ones are vectorized.",
+        disabled=bool(new_class_name.strip()) or not existing_class,
+    )
     upload_trigger = st.sidebar.button("Upload")
 
     target_class = None
@@ -251,6 +288,13 @@ if page == "📚 Document Viewer":
                         upload_documents(new_class_name.strip(), docs)
                         st.session_state.upload_success_msg = f"Uploaded to '{new_class_name.strip()}' successfully."
                         st.session_state.reset_fields = True
+                elif existing_class and replace_contents:
+                    try:
+                        result = store.replace_class_contents(existing_class, docs)
+                        st.success(f"Replaced contents of '{existing_class}' with {result['objects']} object(s).")
+                    except Exception as e:
+                        st.error(f"Failed to replace contents of '{existing_class}': {e}")
+                    st.session_state.reset_fields = True
                 elif existing_class:
                     upload_documents(existing_class, docs)
                     st.session_state.upload_success_msg = f"Uploaded to '{existing_class}' successfully."
@@ -262,17 +306,9 @@ if page == "📚 Document Viewer":
     if current_docs:
         for class_name in current_docs:
             with st.expander(class_name):
-                try:
-                    res = client.query.get(class_name, ["title", "content"]).do()
-                    docs = res.get("data", {}).get("Get", {}).get(class_name, [])
-                    if docs:
-                        for d in docs:
-                            st.markdown(f"**📄 {d.get('title', 'Untitled')}**")
-                            st.code(d.get("content", ""), language="text")
-                    else:
-                        st.write("No documents in this class.")
-                except Exception as e:
-                    st.error(f"Error reading '{class_name}': {e}")
+                # An expander's body runs on every rerun, open or not, so load on request only.
+                if st.toggle("Show documents", key=f"show_{class_name}"):
+                    render_class_documents(class_name)
     else:
         st.write("🕳️ No documents available.")
 
@@ -283,7 +319,7 @@ if page == "📚 Document Viewer":
             if docs_to_delete:
                 for doc in docs_to_delete:
                     try:
-                        client.schema.delete_class(doc)
+                        store.delete_class(doc)
                         st.success(f"Deleted class: `{doc}`")
                     except Exception as e:
                         st.error(f"Failed to delete `{doc}`: {e}")
@@ -301,20 +337,16 @@ if page == "📚 Document Viewer":
         selected_class = st.selectbox("Select class to manage files:", current_docs, key="file_delete_class")
         if selected_class:
             try:
-                res = client.query.get(selected_class, ["title", "_additional { id }"]).do()
-                objs = res.get("data", {}).get("Get", {}).get(selected_class, [])
-                if objs:
-                    options = [f"{obj['title']} ({obj['_additional']['id']})" for obj in objs]
-                    selected_files = st.multiselect("Select files to delete:", options, key="files_to_delete")
+                titles = get_class_titles(selected_class)
+                if titles:
+                    selected_files = st.multiselect("Select files to delete:", titles, key="files_to_delete")
                     if st.button(f"Delete selected files from `{selected_class}`", key="delete_files_button"):
                         if selected_files:
-                            for fstr in selected_files:
-                                obj_id = fstr.split("(")[-1].strip(")")
-                                try:
-                                    client.data_object.delete(obj_id, selected_class)
-                                    st.success(f"Deleted file with ID {obj_id} from `{selected_class}`")
-                                except Exception as e:
-                                    st.error(f"Failed to delete file {fstr}: {e}")
+                            try:
+                                result = store.delete_objects(selected_class, where=store.where_any("title", selected_files))
+                                st.success(f"Deleted {result['deleted']} object(s) of {len(selected_files)} file(s) from `{selected_class}`")
+                            except Exception as e:
+                                st.error(f"Failed to delete files: {e}")
                             st.rerun()
                         else:
                             st.warning("No files selected.")
@@ -332,21 +364,28 @@ if page == "📚 Document Viewer":
 elif page == "💬 Chat With Model":
     st.title("vLLM Model Chat")
 
-    if "server_manager" not in st.session_state:
-        st.session_state.server_manager = VLLMServerManager()
+    pool = get_server_pool()
+    if "current_model" not in st.session_state:
         st.session_state.current_model = None
         st.session_state.output = ""
+        st.session_state.session_id = uuid.uuid4().hex
 
     model = st.selectbox("Choose a model (select to start server):", ["-- Select model --"] + MODELS)
 
     if model != "-- Select model --" and model != st.session_state.current_model:
-        with st.spinner("Stopping previous model server... Please wait."):
-            if st.session_state.current_model:
-                st.session_state.server_manager.stop_server()
-        with st.spinner(f"Starting server for {model}..."):
-            st.session_state.server_manager.start_server(model)
+        if pool.is_resident(model):
+            pool.get(model)
+        else:
+            with st.spinner(f"Starting server for {model}..."):
+                server = pool.get(model)
+            st.caption(f"Server ready in {server.time_to_ready:.1f}s")
         st.session_state.current_model = model
         st.session_state.output = ""
+        # Use any free slot to load the model most likely to be picked next.
+        pool.preload_likely(m for m in MODELS if m != model)
+
+    if pool.models():
+        st.sidebar.caption("Resident models: " + ", ".join(pool.models()))
 
     question = st.text_area("Enter your question here:", height=150)
 
@@ -354,26 +393,33 @@ elif page == "💬 Chat With Model":
         if st.session_state.current_model is None:
             st.warning("Please select a model first!")
         else:
-            with st.spinner("Generating..."):
+            with st.spinner("Retrieving context..."):
                 try:
-                    all_classes = client.schema.get().get("classes", [])
+                    # Staging classes left by a failed replace duplicate their target's documents.
+                    all_classes = [c for c in get_class_names() if not WeaviateClient.is_staging_class(c)]
                     if not all_classes:
                         st.warning("No document classes available for context.")
-                        context = ""
+                        docs = []
                     else:
-                        # Select latest class
-                        latest_class = all_classes[-1]["class"]
-                        context = client.query.get(latest_class, ["title", "content"]) \
-                            .with_near_text({"concepts": [question]}) \
-                            .with_limit(TOP_K) \
-                            .do()
-                        if not context:
+                        # Search every class together; slow classes are skipped after FEDERATED_TIMEOUT.
+                        docs = get_store().query_classes(question, all_classes, top_k=TOP_K)
+                        if not docs:
                             st.warning("No context retrieved.")
-                    output = generate_text(model=st.session_state.current_model, query_text=question, context=context)
-                    st.session_state.output = output
                 except Exception as e:
-                    st.error(f"Error fetching context or generating response: {e}")
-
-    if st.session_state.output:
+                    st.error(f"Error fetching context: {e}")
+                    docs = []
+                    all_classes = []
+
+            st.subheader("Response:")
+            stats = {}
+            st.session_state.output = st.write_stream(
+                stream_text(model=st.session_state.current_model, query_text=question, docs=docs, stats=stats, class_name=all_classes, session_id=st.session_state.session_id,
+                            api_url=pool.completions_url(st.session_state.current_model))
+            )
+            if "ttft" in stats:
+                st.caption(f"Time to first token: {stats['ttft']:.2f}s")
+            st.session_state.streamed = True
+
+    if st.session_state.output and not st.session_state.pop("streamed", False):
         st.subheader("Response:")
         st.write(st.session_state.output)
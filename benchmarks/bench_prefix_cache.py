@@ -0,0 +1,113 @@
+"""
+Compare time-to-first-token of the "classic" and "prefix_stable" prompt layouts.
+
+Replays multi-turn RAG conversations through LLMClient.stream_response against the local
+stub server (stub_vllm.py), which charges prefill only for prompt blocks that are not in
+its prefix cache. Retrieval is simulated so each turn gets different documents.
+
+    python bench_prefix_cache.py --conversations 4 --turns 8
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "applications", "console"))
+from client_rag import LLMClient
+from tokens import TokenCounter
+
+import stub_vllm
+
+
+class FakeRetriever:
+    """Returns `top_k` documents picked deterministically from a synthetic corpus per query."""
+
+    def __init__(self, n_docs=50, doc_words=150, seed=0):
+        rng = random.Random(seed)
+        vocab = [f"term{i}" for i in range(2000)]
+        self.corpus = [
+            {"title": f"doc{i}.txt", "content": " ".join(rng.choice(vocab) for _ in range(doc_words)), "_additional": {"id": str(i)}}
+            for i in range(n_docs)
+        ]
+
+    def query_documents(self, query, class_name, top_k=3, group_by_parent=False):
+        rng = random.Random(query)
+        return rng.sample(self.corpus, top_k)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def run_layout(layout, args, port):
+    stub_args = stub_vllm.default_args(
+        port=port, model="stub-model", cache_blocks=65536,
+        prefill_ms_per_token=args.prefill_ms_per_token, decode_ms_per_token=args.decode_ms_per_token,
+        output_tokens=args.output_tokens,
+    )
+    server = stub_vllm.start_in_thread(stub_args)
+    base = f"http://127.0.0.1:{port}"
+    client = LLMClient(
+        FakeRetriever(),
+        api_url=f"{base}/v1/completions",
+        model_name="stub-model",
+        max_tokens=args.output_tokens,
+        prompt_layout=layout,
+        verbose=False,
+        token_counter=TokenCounter(model_name="stub-model", tokenize_url=f"{base}/tokenize"),
+    )
+
+    ttfts, prompt_tokens, cached_tokens = [], 0, 0
+    try:
+        for conv in range(args.conversations):
+            history = []
+            session_id = client.new_session_key()
+            for turn in range(args.turns):
+                question = f"Conversation {conv} turn {turn}: what do the documents say about term{turn * 7 + conv}?"
+                for _ in client.stream_response(question, class_name="Bench", history=history, enable_rag=True, session_id=session_id):
+                    pass
+                stats = client.last_stream_stats
+                ttfts.append(stats["ttft"])
+                usage = stats["usage"] or {}
+                prompt_tokens += usage.get("prompt_tokens", 0)
+                cached_tokens += (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+                history.append((question, client.last_answer))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return {
+        "layout": layout,
+        "requests": len(ttfts),
+        "ttft_mean_s": statistics.mean(ttfts),
+        "ttft_p50_s": percentile(ttfts, 50),
+        "ttft_p95_s": percentile(ttfts, 95),
+        "prompt_tokens": prompt_tokens,
+        "cached_prompt_tokens": cached_tokens,
+        "prefix_cache_hit_rate": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.5)
+    parser.add_argument("--decode-ms-per-token", type=float, default=1.0)
+    parser.add_argument("--output-tokens", type=int, default=32)
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = [run_layout(layout, args, args.port + i) for i, layout in enumerate(["classic", "prefix_stable"])]
+
+    print(f"{'layout':<15}{'requests':>10}{'ttft mean':>12}{'ttft p50':>12}{'ttft p95':>12}{'cache hit':>12}")
+    for r in results:
+        print(f"{r['layout']:<15}{r['requests']:>10}{r['ttft_mean_s']:>11.3f}s{r['ttft_p50_s']:>11.3f}s{r['ttft_p95_s']:>11.3f}s{r['prefix_cache_hit_rate']:>11.1%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,265 @@
+"""
+Replay a JSONL workload through the RAG pipeline and report latency and throughput.
+
+Each workload line is a JSON object whose question is taken from "query", "prompt",
+"body" or "title" (in that order). Every request runs WeaviateClient.query_documents
+and then LLMClient.stream_response, either at a fixed arrival rate (--qps, open loop)
+or with a fixed number of concurrent clients (--concurrency, closed loop).
+
+With --start-stubs the local stub vLLM and Weaviate servers are started in-process, so
+the harness runs without a GPU or containers:
+
+    python load_test.py --workload ../requests.jsonl --concurrency 8 --start-stubs --output results.json
+    python load_test.py --workload ../requests.jsonl --qps 4 --duration 60 --compare results.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "applications", "console"))
+from cache import LRUCache
+from client_rag import LLMClient
+from config import API_URL, WEAVIATE_URL
+from tokens import TokenCounter
+from weaviate_store import WeaviateClient
+
+import stub_vllm
+import stub_weaviate
+
+QUESTION_FIELDS = ("query", "prompt", "body", "title")
+
+
+def load_workload(path):
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            question = next((record[k] for k in QUESTION_FIELDS if record.get(k)), None)
+            if question:
+                items.append(question)
+    if not items:
+        raise ValueError(f"No questions found in {path}")
+    return items
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pick(q):
+        return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+    return {"mean": statistics.mean(values), "p50": pick(50), "p95": pick(95), "p99": pick(99), "max": values[-1]}
+
+
+class TimedRetriever:
+    """Wraps WeaviateClient and records the latency of each query_documents call per thread."""
+
+    def __init__(self, weaviate_client):
+        self.weaviate_client = weaviate_client
+        self.local = threading.local()
+
+    def query_documents(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.weaviate_client.query_documents(*args, **kwargs)
+        finally:
+            self.local.latency = time.perf_counter() - start
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.weaviate_client = WeaviateClient(args.weaviate_url)
+        if args.no_retrieval_cache:
+            self.weaviate_client.retrieval_cache = LRUCache(0)
+        self.retriever = TimedRetriever(self.weaviate_client)
+        # LLMClient keeps per-call stream stats on the instance, so each worker thread gets its own.
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.samples = []
+        self.errors = []
+
+    def client(self):
+        if not hasattr(self.local, "client"):
+            self.local.client = LLMClient(
+                self.retriever,
+                api_url=self.args.api_url,
+                model_name=self.args.model,
+                max_tokens=self.args.max_tokens,
+                token_counter=TokenCounter(model_name=self.args.model, tokenize_url=self.args.api_url.replace("/v1/completions", "/tokenize")),
+                verbose=False,
+            )
+        return self.local.client
+
+    def run_one(self, question, scheduled_at=None):
+        client = self.client()
+        start = time.perf_counter()
+        try:
+            for _ in client.stream_response(question, class_name=self.args.class_name, enable_rag=True):
+                pass
+            end = time.perf_counter()
+            stats = client.last_stream_stats
+            usage = stats["usage"] or {}
+            sample = {
+                "e2e": end - start,
+                # Includes time spent waiting for a worker when the harness falls behind the target QPS.
+                "e2e_from_schedule": end - scheduled_at if scheduled_at else end - start,
+                "ttft": stats["ttft"],
+                "retrieval": getattr(self.retriever.local, "latency", None),
+                "completion_tokens": usage.get("completion_tokens", 0),
+            }
+            with self.lock:
+                self.samples.append(sample)
+        except Exception as e:
+            with self.lock:
+                self.errors.append(str(e))
+
+    def run(self, questions):
+        args = self.args
+        start = time.perf_counter()
+        if args.qps:
+            total = int(args.duration * args.qps) if args.duration else len(questions)
+            with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+                for i in range(total):
+                    scheduled_at = start + i / args.qps
+                    delay = scheduled_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    executor.submit(self.run_one, questions[i % len(questions)], scheduled_at)
+        else:
+            total = args.requests or len(questions)
+            counter = iter(range(total))
+            counter_lock = threading.Lock()
+
+            def worker():
+                while True:
+                    with counter_lock:
+                        i = next(counter, None)
+                    if i is None:
+                        return
+                    self.run_one(questions[i % len(questions)])
+
+            threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        return time.perf_counter() - start
+
+    def report(self, wall_time):
+        samples = self.samples
+        completion_tokens = sum(s["completion_tokens"] for s in samples)
+        return {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "mode": f"qps={self.args.qps}" if self.args.qps else f"concurrency={self.args.concurrency}",
+                "args": {k: v for k, v in vars(self.args).items() if k not in ("compare", "output")},
+            },
+            "requests": len(samples),
+            "errors": len(self.errors),
+            "wall_time_s": wall_time,
+            "throughput_rps": len(samples) / wall_time if wall_time else 0.0,
+            "throughput_tokens_per_s": completion_tokens / wall_time if wall_time else 0.0,
+            "latency_s": {
+                "e2e": percentiles([s["e2e"] for s in samples]),
+                "e2e_from_schedule": percentiles([s["e2e_from_schedule"] for s in samples]),
+                "ttft": percentiles([s["ttft"] for s in samples if s["ttft"] is not None]),
+                "retrieval": percentiles([s["retrieval"] for s in samples if s["retrieval"] is not None]),
+            },
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_report(report, baseline=None):
+    print(f"{report['meta']['mode']}: {report['requests']} requests, {report['errors']} errors in {report['wall_time_s']:.2f}s")
+    print(f"throughput: {report['throughput_rps']:.2f} req/s, {report['throughput_tokens_per_s']:.1f} tokens/s")
+    print(f"{'latency (s)':<20}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, stats in report["latency_s"].items():
+        if not stats:
+            continue
+        line = f"{name:<20}" + "".join(f"{stats[q]:>9.3f}" for q in ("mean", "p50", "p95", "p99"))
+        base = (baseline or {}).get("latency_s", {}).get(name)
+        if base:
+            line += "   vs baseline: " + " ".join(f"{q} {100 * (stats[q] - base[q]) / base[q]:+.1f}%" for q in ("p50", "p95", "p99") if base.get(q))
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", required=True, help="JSONL file of requests")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--qps", type=float, help="Fixed arrival rate (open loop)")
+    mode.add_argument("--concurrency", type=int, default=4, help="Number of concurrent clients (closed loop)")
+    parser.add_argument("--duration", type=float, help="With --qps, run for this many seconds (default: one pass over the workload)")
+    parser.add_argument("--requests", type=int, help="With --concurrency, total requests (default: one pass over the workload)")
+    parser.add_argument("--max-workers", type=int, default=256, help="Thread pool size for --qps")
+    parser.add_argument("--api-url", default=API_URL)
+    parser.add_argument("--weaviate-url", default=WEAVIATE_URL)
+    parser.add_argument("--class-name", default="Bench")
+    parser.add_argument("--model", default="stub-model")
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--no-retrieval-cache", action="store_true", help="Disable WeaviateClient's retrieval cache")
+    parser.add_argument("--start-stubs", action="store_true", help="Start stub vLLM and Weaviate servers in-process")
+    parser.add_argument("--stub-vllm-port", type=int, default=18000)
+    parser.add_argument("--stub-weaviate-port", type=int, default=18080)
+    parser.add_argument("--stub-ttft-ms", type=float, default=20.0)
+    parser.add_argument("--stub-decode-ms-per-token", type=float, default=5.0)
+    parser.add_argument("--stub-max-concurrency", type=int, default=16)
+    parser.add_argument("--stub-retrieval-latency-ms", type=float, default=10.0)
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    parser.add_argument("--compare", help="Baseline report JSON to compare latencies against")
+    args = parser.parse_args()
+    if args.qps:
+        args.concurrency = None
+
+    servers = []
+    if args.start_stubs:
+        servers.append(stub_vllm.start_in_thread(stub_vllm.default_args(
+            port=args.stub_vllm_port, model=args.model, ttft_ms=args.stub_ttft_ms,
+            decode_ms_per_token=args.stub_decode_ms_per_token, max_concurrency=args.stub_max_concurrency,
+            output_tokens=args.max_tokens,
+        )))
+        servers.append(stub_weaviate.start_in_thread(stub_weaviate.default_args(
+            port=args.stub_weaviate_port, class_name=args.class_name, latency_ms=args.stub_retrieval_latency_ms,
+        )))
+        args.api_url = f"http://127.0.0.1:{args.stub_vllm_port}/v1/completions"
+        args.weaviate_url = f"http://127.0.0.1:{args.stub_weaviate_port}"
+
+    try:
+        load_test = LoadTest(args)
+        wall_time = load_test.run(load_workload(args.workload))
+        report = load_test.report(wall_time)
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if load_test.errors:
+        print(f"First error: {load_test.errors[0]}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,235 @@
+"""
+Local stand-in for a vLLM OpenAI-compatible server, for benchmarks without a GPU.
+
+Simulates scheduling delay, prefill and decode time, a limit on concurrently running
+requests (excess requests queue), and vLLM's automatic prefix caching: prompts are split
+into blocks of whitespace tokens, and prefill is only charged for blocks after the longest
+cached prefix. Serves /v1/completions (streamed and non-streamed), /tokenize, /health,
+/v1/models and /metrics (running and waiting request gauges).
+
+    python stub_vllm.py --port 8000 --ttft-ms 20 --prefill-ms-per-token 0.2 --decode-ms-per-token 5 --max-concurrency 16
+"""
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping pooled or cancelled connections is expected, not an error.
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class PrefixCache:
+    """LRU set of prompt-prefix block hashes, chained like vLLM's block hashes."""
+
+    def __init__(self, block_size: int, max_blocks: int):
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup_and_insert(self, tokens):
+        """Return the number of prompt tokens served from cache, then cache all full blocks."""
+        hashes, digest = [], b""
+        for i in range(0, len(tokens) - len(tokens) % self.block_size, self.block_size):
+            digest = hashlib.sha1(digest + " ".join(tokens[i:i + self.block_size]).encode("utf-8")).digest()
+            hashes.append(digest)
+
+        with self.lock:
+            cached = 0
+            for h in hashes:
+                if h not in self.blocks:
+                    break
+                cached += 1
+            for h in hashes:
+                self.blocks[h] = True
+                self.blocks.move_to_end(h)
+            while len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+        return cached * self.block_size
+
+
+class StubConfig:
+    def __init__(self, args):
+        self.model = args.model
+        self.ttft_s = args.ttft_ms / 1000
+        self.slots = threading.BoundedSemaphore(args.max_concurrency) if args.max_concurrency else None
+        self.prefill_s_per_token = args.prefill_ms_per_token / 1000
+        self.decode_s_per_token = args.decode_ms_per_token / 1000
+        self.output_tokens = args.output_tokens
+        self.prefix_cache = PrefixCache(args.block_size, args.cache_blocks) if args.cache_blocks else None
+        # Gauges for /metrics, named like vLLM's.
+        self.running = 0
+        self.waiting = 0
+        self.lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json({})
+        elif self.path == "/v1/models":
+            self._send_json({"object": "list", "data": [{"id": self.config.model, "object": "model"}]})
+        elif self.path == "/metrics":
+            with self.config.lock:
+                running, waiting = self.config.running, self.config.waiting
+            label = f'{{model_name="{self.config.model}"}}'
+            body = f"vllm:num_requests_running{label} {running}\nvllm:num_requests_waiting{label} {waiting}\n".encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        if self.path == "/tokenize":
+            data = self._read_json()
+            tokens = data.get("prompt", "").split()
+            self._send_json({"count": len(tokens), "tokens": list(range(len(tokens)))})
+        elif self.path == "/v1/completions":
+            data = self._read_json()
+            self._track(waiting=1)
+            if self.config.slots is not None:
+                self.config.slots.acquire()
+            self._track(waiting=-1, running=1)
+            try:
+                self._completions(data)
+            finally:
+                self._track(running=-1)
+                if self.config.slots is not None:
+                    self.config.slots.release()
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _track(self, waiting=0, running=0):
+        with self.config.lock:
+            self.config.waiting += waiting
+            self.config.running += running
+
+    def _prefill(self, prompt_tokens):
+        time.sleep(self.config.ttft_s)
+        cached = self.config.prefix_cache.lookup_and_insert(prompt_tokens) if self.config.prefix_cache else 0
+        time.sleep((len(prompt_tokens) - cached) * self.config.prefill_s_per_token)
+        return cached
+
+    def _completions(self, data):
+        prompt_tokens = data.get("prompt", "").split()
+        max_tokens = int(data.get("max_tokens") or 16)
+        n_out = min(max_tokens, self.config.output_tokens)
+        finish_reason = "length" if n_out == max_tokens else "stop"
+        words = [f"tok{i}" for i in range(n_out)]
+        cached = self._prefill(prompt_tokens)
+        usage = {
+            "prompt_tokens": len(prompt_tokens),
+            "completion_tokens": n_out,
+            "total_tokens": len(prompt_tokens) + n_out,
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+        if not data.get("stream"):
+            time.sleep(n_out * self.config.decode_s_per_token)
+            self._send_json({
+                "id": "cmpl-stub",
+                "object": "text_completion",
+                "model": data.get("model"),
+                "choices": [{"index": 0, "text": " " + " ".join(words), "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            time.sleep(self.config.decode_s_per_token)
+            finish = finish_reason if i == n_out - 1 else None
+            self._send_event({"choices": [{"index": 0, "text": " " + word, "finish_reason": finish}], "usage": None})
+        if (data.get("stream_options") or {}).get("include_usage"):
+            self._send_event({"choices": [], "usage": usage})
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+    def _send_event(self, payload):
+        self._send_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def add_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default="stub-model")
+    parser.add_argument("--ttft-ms", type=float, default=0.0, help="Fixed scheduling delay before prefill")
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.2)
+    parser.add_argument("--decode-ms-per-token", type=float, default=5.0)
+    parser.add_argument("--output-tokens", type=int, default=32, help="Upper bound on generated tokens per request")
+    parser.add_argument("--block-size", type=int, default=16)
+    parser.add_argument("--cache-blocks", type=int, default=4096, help="Prefix cache capacity in blocks (0 disables it)")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Requests processed at once; others queue (0 = unlimited)")
+    parser.add_argument("--startup-delay-s", type=float, default=0.0, help="Simulated weight loading time before the server listens")
+
+
+def default_args(**overrides) -> argparse.Namespace:
+    """Parsed default arguments with `overrides` applied, for starting the stub from Python."""
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args([])
+    for key, value in overrides.items():
+        setattr(args, key, value)
+    return args
+
+
+def make_server(args) -> StubServer:
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": StubConfig(args)})
+    return StubServer((args.host, args.port), handler)
+
+
+def start_in_thread(args) -> StubServer:
+    server = make_server(args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+    time.sleep(args.startup_delay_s)
+    server = make_server(args)
+    print(f"Stub vLLM server listening on http://{args.host}:{args.port}")
+    print("Application startup complete.", flush=True)
+    server.serve_forever()
@@ -0,0 +1,206 @@
+"""
+Local stand-in for Weaviate, for benchmarks without the Weaviate and t2v containers.
+
+Holds an in-memory corpus per class and answers the REST and GraphQL calls WeaviateClient
+makes for retrieval: readiness, meta, schema and `Get` queries with nearText/nearVector,
+hybrid or the `after` cursor. Relevance is word overlap between query and document, and every query
+costs a configurable latency to stand in for vectorization and search.
+
+    python stub_weaviate.py --port 8080 --class-name Bench --docs 1000 --latency-ms 15
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+from http.server import BaseHTTPRequestHandler
+
+from stub_vllm import StubServer
+
+# {Get{Class(arguments){selection}}}; the selection set never contains parentheses.
+_GET_RE = re.compile(r"Get\s*\{\s*(\w+)\s*(?:\((.*)\))?\s*\{(.*)\}\s*\}\s*\}\s*$", re.DOTALL)
+_CONCEPTS_RE = re.compile(r'concepts:\s*\[\s*"((?:[^"\\]|\\.)*)"')
+_HYBRID_RE = re.compile(r'hybrid:\s*\{\s*query:\s*"((?:[^"\\]|\\.)*)"')
+_LIMIT_RE = re.compile(r"limit:\s*(\d+)")
+_AFTER_RE = re.compile(r'after:\s*"([^"]*)"')
+_ADDITIONAL_RE = re.compile(r"_additional\s*\{([^}]*)\}")
+
+
+VECTOR_DIM = 64
+
+
+def bag_of_words_vector(words):
+    """Hashed bag-of-words embedding, so documents sharing words have similar vectors."""
+    vector = [0.0] * VECTOR_DIM
+    for word in words:
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        vector[digest[0] % VECTOR_DIM] += 1.0 if digest[1] % 2 else -1.0
+    return vector
+
+
+class Corpus:
+    def __init__(self):
+        self.classes = {}  # class name -> list of objects
+        self.lock = threading.Lock()
+
+    def add_synthetic(self, class_name, n_docs, doc_words, seed=0):
+        rng = random.Random(seed)
+        vocab = [f"term{i}" for i in range(5000)]
+        objects = []
+        for i in range(n_docs):
+            content = " ".join(rng.choice(vocab) for _ in range(doc_words))
+            objects.append({"id": str(uuid.UUID(int=rng.getrandbits(128))), "title": f"doc{i}.txt", "content": content})
+        self.add(class_name, objects)
+
+    def add(self, class_name, objects):
+        for obj in objects:
+            obj["_words"] = set(obj["content"].lower().split()) | set(obj["title"].lower().split())
+        with self.lock:
+            self.classes.setdefault(class_name, []).extend(objects)
+
+    def page(self, class_name, after, limit):
+        """Objects in id order after the id `after`, like Weaviate's cursor API."""
+        with self.lock:
+            objects = sorted(self.classes.get(class_name, []), key=lambda obj: obj["id"])
+        if after:
+            objects = [obj for obj in objects if obj["id"] > after]
+        return [(0.0, obj) for obj in objects[:limit]]
+
+    def search(self, class_name, query, limit):
+        words = set(query.lower().split())
+        with self.lock:
+            objects = list(self.classes.get(class_name, []))
+        scored = [(len(words & obj["_words"]) / (len(words) or 1), obj) for obj in objects]
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return scored[:limit]
+
+
+class StubWeaviateHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    corpus = None
+    latency_s = 0.0
+    # Per-class overrides of latency_s, e.g. to make one class slow.
+    class_latency_s = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _class_schema(self, name):
+        return {
+            "class": name,
+            "vectorizer": "none",
+            "properties": [
+                {"name": "title", "dataType": ["string"]},
+                {"name": "content", "dataType": ["text"]},
+            ],
+        }
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path in ("/v1/.well-known/ready", "/v1/.well-known/live"):
+            self._send_json({})
+        elif path == "/v1/meta":
+            self._send_json({"hostname": "http://[::]:8080", "version": "1.24.0", "modules": {}})
+        elif path == "/v1/schema":
+            self._send_json({"classes": [self._class_schema(name) for name in self.corpus.classes]})
+        elif path.startswith("/v1/schema/"):
+            name = path[len("/v1/schema/"):]
+            if name in self.corpus.classes:
+                self._send_json(self._class_schema(name))
+            else:
+                self._send_json({"error": [{"message": "class not found"}]}, status=404)
+        else:
+            self._send_json({"error": [{"message": "not found"}]}, status=404)
+
+    def do_POST(self):
+        if self.path.rstrip("/") == "/v1/graphql":
+            self._graphql(self._read_json().get("query", ""))
+        else:
+            self._send_json({"error": [{"message": "not found"}]}, status=404)
+
+    def _graphql(self, query):
+        match = _GET_RE.search(query.strip())
+        if not match:
+            self._send_json({"errors": [{"message": "unsupported query"}]})
+            return
+        class_name, arguments, selection = match.group(1), match.group(2) or "", match.group(3)
+
+        concepts = _CONCEPTS_RE.search(arguments) or _HYBRID_RE.search(arguments)
+        limit = _LIMIT_RE.search(arguments)
+        after = _AFTER_RE.search(arguments)
+        query_text = json.loads(f'"{concepts.group(1)}"') if concepts else ""
+        additional = _ADDITIONAL_RE.search(selection)
+        wanted_additional = additional.group(1).split() if additional else []
+        properties = _ADDITIONAL_RE.sub("", selection).split()
+
+        time.sleep(self.class_latency_s.get(class_name, self.latency_s))
+        results = []
+        limit = int(limit.group(1)) if limit else 20
+        if concepts:
+            matches = self.corpus.search(class_name, query_text, limit)
+        else:
+            matches = self.corpus.page(class_name, after.group(1) if after else None, limit)
+        for score, obj in matches:
+            item = {prop: obj.get(prop) for prop in properties}
+            if wanted_additional:
+                values = {"id": obj["id"], "certainty": 0.5 + score / 2, "distance": 1 - score, "score": str(score)}
+                if "vector" in wanted_additional:
+                    values["vector"] = bag_of_words_vector(obj["content"].lower().split())
+                item["_additional"] = {key: values.get(key) for key in wanted_additional}
+            results.append(item)
+        self._send_json({"data": {"Get": {class_name: results}}})
+
+
+def add_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--class-name", default="Bench")
+    parser.add_argument("--docs", type=int, default=1000, help="Number of synthetic documents")
+    parser.add_argument("--doc-words", type=int, default=120)
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="Simulated vectorization + search time per query")
+
+
+def default_args(**overrides) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args([])
+    for key, value in overrides.items():
+        setattr(args, key, value)
+    return args
+
+
+def make_server(args) -> StubServer:
+    corpus = Corpus()
+    corpus.add_synthetic(args.class_name, args.docs, args.doc_words)
+    handler = type("ConfiguredStubWeaviateHandler", (StubWeaviateHandler,), {"corpus": corpus, "latency_s": args.latency_ms / 1000, "class_latency_s": {}})
+    return StubServer((args.host, args.port), handler)
+
+
+def start_in_thread(args) -> StubServer:
+    server = make_server(args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(f"Stub Weaviate listening on http://{args.host}:{args.port} with {args.docs} documents in '{args.class_name}'")
+    make_server(args).serve_forever()
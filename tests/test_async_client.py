@@ -0,0 +1,109 @@
+import asyncio
+import warnings
+
+import pytest
+
+import stub_vllm
+import stub_weaviate
+
+from async_client import AsyncLLMClient, AsyncWeaviateClient
+from tokens import TokenCounter
+
+
+@pytest.fixture(scope="module")
+def vllm_url():
+    server = stub_vllm.start_in_thread(stub_vllm.default_args(port=0, decode_ms_per_token=0, output_tokens=8))
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture(scope="module")
+def weaviate_url():
+    server = stub_weaviate.start_in_thread(stub_weaviate.default_args(port=0, class_name="Alpha", docs=50, latency_ms=0))
+    server.RequestHandlerClass.corpus.add_synthetic("Beta", 50, 120, seed=1)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_async_retrieval_across_classes(weaviate_url):
+    async def run():
+        client = AsyncWeaviateClient(weaviate_url)
+        try:
+            single = await client.query_documents("term1 term2", "Alpha", top_k=2, certainty=0.0)
+            merged = await client.query_classes("term1 term2", ["Alpha", "Beta"], top_k=4, certainty=0.0)
+            return single, merged
+        finally:
+            await client.aclose()
+
+    single, merged = asyncio.run(run())
+    assert len(single) == 2
+    assert len(merged) == 4
+    assert {d["_additional"]["class"] for d in merged} <= {"Alpha", "Beta"}
+
+
+def test_summarize_history_in_async_client(vllm_url):
+    client = AsyncLLMClient(
+        None,
+        api_url=f"{vllm_url}/v1/completions",
+        model_name="stub-model",
+        history_policy="summarize",
+        prompt_token_budget=600,
+        token_counter=TokenCounter(model_name="stub-model", tokenize_url=f"{vllm_url}/tokenize"),
+        verbose=False,
+    )
+    history = [(f"question {i} " + "word " * 60, f"answer {i} " + "word " * 60) for i in range(6)]
+
+    async def run():
+        try:
+            return await client.prepare_prompt("What did we discuss?", history=history)
+        finally:
+            await client.aclose()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        prompt, _, _ = asyncio.run(run())
+
+    # The stub answers every completion with "tok0 tok1 ...", so that is the summary.
+    assert "Summary of earlier conversation:\ntok0" in prompt
+    assert "question 5" in prompt
+    assert "question 0" not in prompt
+
+
+def test_async_stream_uses_response_cache(vllm_url):
+    client = AsyncLLMClient(
+        None,
+        api_url=f"{vllm_url}/v1/completions",
+        model_name="stub-model",
+        temperature=0,
+        token_counter=TokenCounter(model_name="stub-model", tokenize_url=f"{vllm_url}/tokenize"),
+        verbose=False,
+    )
+
+    async def run():
+        answers = []
+        try:
+            for _ in range(2):
+                answers.append("".join([delta async for delta in client.stream_response("What is a stub?")]))
+                answers.append(client.last_stream_stats["cached"])
+        finally:
+            await client.aclose()
+        return answers
+
+    first, first_cached, second, second_cached = asyncio.run(run())
+    assert (first_cached, second_cached) == (False, True)
+    assert first == second
+
+
+def test_sync_client_inside_async_client_stays_blocking(vllm_url):
+    client = AsyncLLMClient(
+        None,
+        api_url=f"{vllm_url}/v1/completions",
+        model_name="stub-model",
+        token_counter=TokenCounter(model_name="stub-model", tokenize_url=f"{vllm_url}/tokenize"),
+        verbose=False,
+    )
+    try:
+        # The wrapped LLMClient never sees the async transport, so its sync paths keep working.
+        assert "tok0" in client.llm_client.generate_response("What is a stub?")
+    finally:
+        asyncio.run(client.aclose())
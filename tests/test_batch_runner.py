@@ -0,0 +1,131 @@
+import json
+import os
+
+import pytest
+
+import stub_vllm
+
+from batch_runner import BatchRunner
+from client_rag import LLMClient
+from tokens import TokenCounter
+
+
+class Interrupted(BaseException):
+    """Stands in for the process being killed mid-run."""
+
+
+class ScriptedRunner(BatchRunner):
+    """BatchRunner that fails or interrupts chosen items and records which items ran."""
+
+    def __init__(self, llm_client, fail=(), interrupt_at=None, **kwargs):
+        super().__init__(llm_client, retries=0, progress_every=0, **kwargs)
+        self.fail = set(fail)
+        self.interrupt_at = interrupt_at
+        self.ran = []
+
+    def run_item(self, item_id, record):
+        self.ran.append(item_id)
+        if item_id == self.interrupt_at:
+            raise Interrupted()
+        if item_id in self.fail:
+            return {"id": item_id, "error": "scripted failure"}
+        return super().run_item(item_id, record)
+
+
+@pytest.fixture(scope="module")
+def llm_client():
+    server = stub_vllm.start_in_thread(stub_vllm.default_args(port=0, decode_ms_per_token=0, output_tokens=4))
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield LLMClient(
+        None, api_url=f"{url}/v1/completions", model_name="stub-model", temperature=0,
+        token_counter=TokenCounter(model_name="stub-model", tokenize_url=f"{url}/tokenize"), verbose=False,
+    )
+    server.shutdown()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    input_path = tmp_path / "input.jsonl"
+    input_path.write_text("".join(json.dumps({"id": f"q{i}", "prompt": f"question {i}"}) + "\n" for i in range(1, 21)))
+    return str(input_path), str(tmp_path / "results.jsonl")
+
+
+def read_rows(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def ids(rows):
+    return [row["id"] for row in rows]
+
+
+EXPECTED = [f"q{i}" for i in range(1, 21)]
+
+
+def test_rows_are_written_in_input_order_as_they_complete(llm_client, paths):
+    input_path, output_path = paths
+    seen = {}
+
+    class ObservingRunner(BatchRunner):
+        def run_item(self, item_id, record):
+            if item_id == "q11":
+                seen["rows"] = ids(read_rows(output_path))
+            return super().run_item(item_id, record)
+
+    summary = ObservingRunner(llm_client, concurrency=1, reorder_window=1, progress_every=0).run(input_path, output_path)
+    assert seen["rows"] == EXPECTED[:10]  # Earlier rows were on disk while the run was going.
+    assert ids(read_rows(output_path)) == EXPECTED
+    assert summary["completed"] == 20
+
+    summary = BatchRunner(llm_client, concurrency=8, progress_every=0).run(input_path, output_path)
+    assert summary["skipped"] == 20 and summary["completed"] == 0
+    assert ids(read_rows(output_path)) == EXPECTED
+
+
+def test_concurrent_run_keeps_input_order(llm_client, paths):
+    input_path, output_path = paths
+    BatchRunner(llm_client, concurrency=8, reorder_window=8, progress_every=0).run(input_path, output_path)
+    rows = read_rows(output_path)
+    assert ids(rows) == EXPECTED
+    assert all("output" in row for row in rows)
+
+
+def test_resume_after_interruption_appends_without_rewriting(llm_client, paths):
+    input_path, output_path = paths
+    with pytest.raises(Interrupted):
+        ScriptedRunner(llm_client, interrupt_at="q8", concurrency=1, reorder_window=1).run(input_path, output_path)
+    assert ids(read_rows(output_path)) == EXPECTED[:7]
+    # A row cut short by the interruption.
+    with open(output_path, "a") as f:
+        f.write('{"id": "q8", "outp')
+    inode = os.stat(output_path).st_ino
+
+    runner = ScriptedRunner(llm_client, concurrency=4)
+    runner.run(input_path, output_path)
+    assert sorted(runner.ran) == sorted(EXPECTED[7:])
+    assert ids(read_rows(output_path)) == EXPECTED
+    assert os.stat(output_path).st_ino == inode  # Nothing to compact, so the file was only appended to.
+
+
+def test_resume_retries_failures_and_compacts(llm_client, paths):
+    input_path, output_path = paths
+    first = ScriptedRunner(llm_client, fail={"q3", "q15"}, concurrency=4)
+    summary = first.run(input_path, output_path)
+    assert summary["failed"] == 2
+    rows = read_rows(output_path)
+    assert ids(rows) == EXPECTED
+    assert [row["id"] for row in rows if "error" in row] == ["q3", "q15"]
+
+    second = ScriptedRunner(llm_client, fail={"q15"}, concurrency=4)
+    second.run(input_path, output_path)
+    assert sorted(second.ran) == ["q15", "q3"]
+    rows = read_rows(output_path)
+    assert ids(rows) == EXPECTED
+    assert [row["id"] for row in rows if "error" in row] == ["q15"]
+
+    third = ScriptedRunner(llm_client, concurrency=4)
+    third.run(input_path, output_path)
+    assert third.ran == ["q15"]
+    rows = read_rows(output_path)
+    assert ids(rows) == EXPECTED
+    assert not any("error" in row for row in rows)
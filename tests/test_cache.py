@@ -0,0 +1,44 @@
+import time
+
+from cache import LRUCache, ResponseCache
+
+
+def indexed_keys(cache):
+    return {tag: set(keys) for tag, keys in cache._class_keys.items()}
+
+
+def test_lru_cache_reports_evictions():
+    evicted = []
+    cache = LRUCache(2, on_evict=lambda key, value: evicted.append(key))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert evicted == ["b"]
+    cache.pop("a")
+    assert evicted == ["b", "a"]
+    assert cache.get("c") == 3 and len(cache) == 1
+
+
+def test_class_index_follows_lru_eviction():
+    cache = ResponseCache(max_entries=3, cache_dir=None)
+    for i in range(50):
+        cache.set(f"key{i}", f"answer {i}", "Docs")
+    assert indexed_keys(cache) == {"docs": {"key47", "key48", "key49"}}
+
+
+def test_class_index_follows_ttl_expiry():
+    cache = ResponseCache(max_entries=10, ttl=0.05, cache_dir=None)
+    cache.set("old", "answer", "Rarely")
+    time.sleep(0.1)
+    assert cache.get("old") is None
+    assert indexed_keys(cache) == {}
+
+
+def test_invalidation_drops_multi_class_entries_from_every_class():
+    cache = ResponseCache(max_entries=10, cache_dir=None)
+    cache.set("both", "answer", ["A", "B"])
+    cache.set("only_b", "answer", "B")
+    cache.invalidate_class("a")
+    assert cache.get("both") is None and cache.get("only_b") == "answer"
+    assert indexed_keys(cache) == {"b": {"only_b"}}
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+import stub_weaviate
+
+from embedder import CachedEmbedder, HashingEmbedder
+from weaviate_store import WeaviateClient
+
+
+class CountingEmbedder(HashingEmbedder):
+    """HashingEmbedder recording every text it is asked to embed."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen = []
+
+    def _embed(self, texts):
+        self.seen.extend(texts)
+        return super()._embed(texts)
+
+
+class RecordingBatch:
+    """Stands in for weaviate's Batch and keeps the objects added to it."""
+
+    def __init__(self):
+        self.objects = []
+
+    def configure(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add_data_object(self, data_object, class_name, uuid=None, vector=None):
+        self.objects.append({"object": data_object, "class": class_name, "uuid": uuid, "vector": vector})
+
+
+def test_hashing_embedder_is_deterministic_and_normalized():
+    embedder = HashingEmbedder(dimension=64)
+    vectors = embedder.embed(["apple banana", "apple banana", "engine piston"])
+    assert vectors.shape == (3, 64) and vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    assert np.array_equal(vectors[0], vectors[1])
+    assert np.array_equal(vectors[0], HashingEmbedder(dimension=64).embed(["apple banana"])[0])
+
+
+def test_cached_embedder_embeds_each_distinct_text_once():
+    inner = CountingEmbedder(dimension=64)
+    embedder = CachedEmbedder(inner, cache_dir=None)
+
+    first = embedder.embed(["a b", "c d", "a b"])
+    assert inner.seen == ["a b", "c d"]  # Duplicates within a batch are embedded once.
+    assert embedder.stats() == {"hits": 1, "misses": 2, "hit_rate": pytest.approx(1 / 3)}
+    assert np.array_equal(first, HashingEmbedder(dimension=64).embed(["a b", "c d", "a b"]))
+
+    embedder.embed(["c d", "e f"])
+    assert inner.seen == ["a b", "c d", "e f"]
+    assert (embedder.hits, embedder.misses) == (2, 3)
+
+
+def test_disk_cache_survives_a_new_instance(tmp_path):
+    texts = ["alpha beta", "gamma delta"]
+    expected = CachedEmbedder(CountingEmbedder(dimension=64), cache_dir=str(tmp_path)).embed(texts)
+
+    inner = CountingEmbedder(dimension=64)
+    embedder = CachedEmbedder(inner, cache_dir=str(tmp_path))
+    assert np.array_equal(embedder.embed(texts), expected)
+    assert inner.seen == []
+    assert (embedder.hits, embedder.misses) == (2, 0)
+
+    # Vectors are keyed by model, so another model does not reuse them.
+    other = CountingEmbedder(dimension=32)
+    CachedEmbedder(other, cache_dir=str(tmp_path)).embed(texts)
+    assert other.seen == texts
+
+
+@pytest.fixture(scope="module")
+def weaviate_url():
+    server = stub_weaviate.start_in_thread(stub_weaviate.default_args(port=0, class_name="Alpha", docs=10, latency_ms=0))
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_upload_documents_sends_precomputed_vectors(weaviate_url, monkeypatch):
+    inner = CountingEmbedder(dimension=64)
+    store = WeaviateClient(weaviate_url, embedder=CachedEmbedder(inner, cache_dir=None))
+    batch = RecordingBatch()
+    monkeypatch.setattr(store.client, "batch", batch)
+    docs = [{"title": "one", "content": "apple banana"}, {"title": "two", "content": "engine piston"}]
+
+    report = store.upload_documents("Alpha", docs, skip_existing=False)
+    assert report["uploaded"] == ["one", "two"]
+    assert store.vectorizer == "none"
+    sent = {obj["object"]["title"]: obj["vector"] for obj in batch.objects}
+    for doc in docs:
+        assert np.array_equal(sent[doc["title"]], HashingEmbedder(dimension=64).embed([doc["content"]])[0])
+
+    # Re-ingesting the same contents reuses the cached vectors.
+    store.upload_documents("Alpha", docs, skip_existing=False)
+    assert inner.seen == ["apple banana", "engine piston"]
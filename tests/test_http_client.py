@@ -0,0 +1,74 @@
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from http_client import HTTPClient
+
+
+class DelayedHandler(BaseHTTPRequestHandler):
+    """Sends nothing, not even headers, for `delay` seconds, like a non-streamed completion."""
+
+    delay = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.delay)
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server_url():
+    servers = []
+
+    def start(delay):
+        handler = type("Handler", (DelayedHandler,), {"delay": delay})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1/completions"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def test_total_timeout_bounds_the_wait_for_headers(server_url):
+    url = server_url(delay=3)
+    client = HTTPClient(read_timeout=120, total_timeout=0.5)
+    start = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        client.post(url, json={})
+    assert time.monotonic() - start < 2
+    assert client.stats()["errors"] == 1
+
+
+def test_per_call_total_timeout_overrides_the_default(server_url):
+    url = server_url(delay=1)
+    client = HTTPClient(read_timeout=120)
+    with pytest.raises(requests.Timeout):
+        client.post(url, json={}, total_timeout=0.3)
+    assert client.post(url, json={}).json() == {"ok": True}
+
+
+def test_fast_response_within_total_timeout(server_url):
+    url = server_url(delay=0)
+    client = HTTPClient(total_timeout=5)
+    for _ in range(3):
+        assert client.post(url, json={}, timeout=(1, 2)).json() == {"ok": True}
+    stats = client.stats()
+    assert stats["requests"] == 3 and stats["errors"] == 0
+    # Keep-alive: one connection served every request.
+    assert [pool["connections_opened"] for pool in stats["pools"].values()] == [1]
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from embedder import HashingEmbedder
+from local_store import LocalVectorStore
+
+TOPICS = ["apple banana cherry", "engine piston gearbox", "violin cello orchestra", "glacier tundra iceberg"]
+
+
+def make_store(path, dimension=64, **kwargs):
+    kwargs.setdefault("ivf_threshold", None)
+    return LocalVectorStore(str(path), embedder=HashingEmbedder(dimension=dimension), **kwargs)
+
+
+def titles(docs):
+    return [d["title"] for d in docs]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = make_store(tmp_path)
+    store.upload_documents("Docs", [{"title": f"doc{i}", "content": topic} for i, topic in enumerate(TOPICS)])
+    return store
+
+
+def test_upload_then_query(store):
+    docs = store.query_documents("engine piston gearbox", "Docs", top_k=2, certainty=0.0, mmr_lambda=None)
+    assert titles(docs)[0] == "doc1"
+    assert docs[0]["content"] == TOPICS[1]
+    assert docs[0]["_additional"]["certainty"] == pytest.approx(1.0, abs=1e-3)
+    assert store.count_documents("Docs") == len(TOPICS)
+
+
+def test_uploading_existing_titles_is_skipped(store):
+    report = store.upload_documents("Docs", [{"title": "doc0", "content": "something else"}])
+    assert report == {"uploaded": [], "skipped": ["doc0"], "failed": []}
+
+
+def test_delete_then_query(store):
+    result = store.delete_objects("Docs", titles=["doc1"])
+    assert result["deleted"] == 1
+    assert "doc1" not in store.get_documents("Docs")
+    assert "doc1" not in titles(store.query_documents("piston gearbox", "Docs", top_k=4, certainty=0.0, mmr_lambda=None))
+
+
+def test_reupload_replaces_the_old_row(store):
+    store.upload_documents("Docs", [{"title": "doc0", "content": "volcano magma lava"}], skip_existing=False)
+    assert store.count_documents("Docs") == len(TOPICS)
+    assert store.get_documents("Docs").count("doc0") == 1
+    docs = store.query_documents("volcano magma", "Docs", top_k=1, certainty=0.0, mmr_lambda=None)
+    assert docs[0]["title"] == "doc0" and docs[0]["content"] == "volcano magma lava"
+    assert "doc0" not in titles(store.query_documents("apple banana", "Docs", top_k=4, certainty=0.9, mmr_lambda=None))
+
+
+def test_reopen_from_the_same_path(tmp_path):
+    store = make_store(tmp_path, dimension=1024)
+    # More rows than the initial capacity of the vector file, so it has to grow.
+    store.upload_documents("Docs", [{"title": f"doc{i}", "content": f"word{i} common"} for i in range(1500)])
+    store.delete_objects("Docs", titles=["doc7"])
+
+    reopened = make_store(tmp_path, dimension=1024)
+    assert reopened.get_classes() == ["docs"]
+    assert reopened.count_documents("Docs") == 1499
+    assert "doc7" not in reopened.get_documents("Docs")
+    assert titles(reopened.query_documents("word1234", "Docs", top_k=1, certainty=0.0, mmr_lambda=None)) == ["doc1234"]
+
+
+def test_ivf_search(tmp_path):
+    store = make_store(tmp_path, ivf_threshold=50, ivf_lists=4, nprobe=4)
+    exact = make_store(tmp_path / "exact")
+    docs = [{"title": f"doc{i}", "content": f"{TOPICS[i % 4]} word{i}"} for i in range(120)]
+    store.upload_documents("Docs", docs)
+    exact.upload_documents("Docs", docs)
+
+    assert os.path.exists(tmp_path / "docs" / "ivf_centroids.npy")
+    assert store._class("Docs").meta["indexed"] >= 50
+    # Probing every list visits every row, so the result matches exact search.
+    for query in ("violin word42", "glacier tundra", "word7"):
+        assert titles(store.query_documents(query, "Docs", top_k=5, certainty=0.0, mmr_lambda=None)) == \
+            titles(exact.query_documents(query, "Docs", top_k=5, certainty=0.0, mmr_lambda=None))
+
+
+def test_query_missing_class_raises(store):
+    with pytest.raises(ValueError):
+        store.query_documents("anything", "Missing")
+    # Federated retrieval reports the failing class and answers from the others.
+    assert titles(store.query_classes("piston gearbox", ["Missing", "Docs"], top_k=1, certainty=0.0, mmr_lambda=None)) == ["doc1"]
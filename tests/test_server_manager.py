@@ -0,0 +1,123 @@
+import os
+import socket
+import sys
+
+import pytest
+
+from http_client import get_http_client
+from server_manager import ModelServerPool, VLLMServerManager
+
+STUB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "stub_vllm.py")
+
+
+def stub_command(*extra):
+    return [sys.executable, STUB, "--model", "{model}", "--port", "{port}", "--decode-ms-per-token", "0", *extra]
+
+
+def free_ports(count):
+    """First port of `count` consecutive free ports."""
+    for _ in range(50):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            base = s.getsockname()[1]
+        if base + count > 65535:
+            continue
+        try:
+            for port in range(base, base + count):
+                with socket.socket() as s:
+                    s.bind(("127.0.0.1", port))
+            return base
+        except OSError:
+            continue
+    raise RuntimeError("No free port range found.")
+
+
+def served_model(server):
+    return get_http_client().get(f"{server.base_url}/v1/models", timeout=(1, 2)).json()["data"][0]["id"]
+
+
+@pytest.fixture
+def make_pool(tmp_path, monkeypatch):
+    # Server logs go to ./logs.
+    monkeypatch.chdir(tmp_path)
+    pools = []
+
+    def make(size, command=None, ready_timeout=30):
+        pool = ModelServerPool(size=size, base_port=free_ports(size), host="127.0.0.1", command=command or stub_command(), warmup_prompts=[])
+        for slot in pool.slots:
+            slot.ready_timeout = ready_timeout
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.stop_all()
+
+
+def test_get_routes_by_model_and_evicts_least_recently_used(make_pool):
+    pool = make_pool(2)
+    a = pool.get("model-a")
+    b = pool.get("model-b")
+    assert a.port != b.port
+    assert served_model(a) == "model-a" and served_model(b) == "model-b"
+
+    assert pool.get("model-a") is a  # Already resident: no restart, and now most recently used.
+    c = pool.get("model-c")
+    assert c is b  # model-b was the least recently used.
+    assert served_model(c) == "model-c"
+    assert pool.models() == ["model-c", "model-a"]
+    assert pool.completions_url("model-a") == f"{a.base_url}/v1/completions"
+
+
+def test_preload_never_evicts_the_most_recently_used_model(make_pool):
+    pool = make_pool(1)
+    pool.get("model-a")
+    assert pool.preload("model-b") is None
+    assert pool.models() == ["model-a"]
+
+    pool = make_pool(2)
+    pool.get("model-a")
+    pool.get("model-b")
+    pool.preload("model-c").result()
+    assert set(pool.models()) == {"model-b", "model-c"}
+
+
+def test_preload_likely_uses_free_slots_only(make_pool):
+    pool = make_pool(2)
+    pool.get("model-a")
+    pool.requests.update({"model-c": 3, "model-b": 1})
+    pool.preload_likely(["model-b", "model-c"]).result()
+    assert set(pool.models()) == {"model-a", "model-c"}
+    assert pool.preload_likely(["model-b"]) is None
+
+
+def test_get_fails_when_all_slots_are_busy_loading(make_pool):
+    pool = make_pool(1, command=stub_command("--startup-delay-s", "1"))
+    loading = pool.preload("model-a")
+    with pytest.raises(RuntimeError, match="busy loading"):
+        pool.get("model-b")
+    assert loading.result() is pool.slots[0]
+    assert pool.models() == ["model-a"]
+
+
+def test_failed_load_releases_the_slot(make_pool):
+    # The stub serves a different model name, so "model-a" never becomes ready.
+    pool = make_pool(1, command=stub_command()[:3] + ["other-model"] + stub_command()[4:], ready_timeout=2)
+    slot = pool.slots[0]
+    with pytest.raises(TimeoutError):
+        pool.get("model-a")
+    assert slot.process is None
+    assert pool.models() == [] and not pool.loading
+    with pytest.raises(Exception):
+        served_model(slot)  # The server process was stopped.
+
+
+def test_start_server_stops_a_server_that_never_becomes_ready(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    command = stub_command()[:3] + ["other-model"] + stub_command()[4:]
+    server = VLLMServerManager(port=free_ports(1), host="127.0.0.1", command=command, warmup_prompts=[], ready_timeout=2)
+    with pytest.raises(TimeoutError):
+        server.start_server("model-a")
+    assert server.process is None and server.current_model is None
+    with pytest.raises(Exception):
+        served_model(server)
@@ -0,0 +1,56 @@
+import pytest
+import requests
+
+import stub_vllm
+import tokens
+
+from client_rag import LLMClient
+from tokens import TokenCounter, tokenize_url_for
+
+
+class FailingHTTPClient:
+    def __init__(self):
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        raise requests.ConnectionError("connection refused")
+
+
+@pytest.fixture
+def failing_http(monkeypatch):
+    http = FailingHTTPClient()
+    monkeypatch.setattr(tokens, "get_http_client", lambda: http)
+    return http
+
+
+def test_unreachable_tokenizer_is_not_retried_for_every_text(failing_http):
+    counter = TokenCounter(model_name="stub-model", tokenize_url="http://127.0.0.1:9/tokenize", retry_after=60)
+    counter._local_loaded = True  # Use the character estimate rather than loading a tokenizer.
+    assert [counter.count(f"text number {i}") for i in range(20)] == [4] * 20
+    assert failing_http.calls == 1
+
+
+def test_tokenizer_is_retried_after_the_backoff(failing_http):
+    counter = TokenCounter(model_name="stub-model", tokenize_url="http://127.0.0.1:9/tokenize", retry_after=0)
+    counter._local_loaded = True
+    counter.count("first text")
+    counter.count("second text")
+    assert failing_http.calls == 2
+
+
+def test_tokenize_url_follows_the_completions_url():
+    assert tokenize_url_for("http://gpu-2:8001/v1/completions") == "http://gpu-2:8001/tokenize"
+    client = LLMClient(None, api_url="http://127.0.0.1:8001/v1/completions", model_name="stub-model", verbose=False)
+    assert client.token_counter.tokenize_url == "http://127.0.0.1:8001/tokenize"
+    assert TokenCounter(tokenize_url="http://other/tokenize", api_url="http://127.0.0.1:8001/v1/completions").tokenize_url == "http://other/tokenize"
+
+
+def test_counts_come_from_the_server():
+    server = stub_vllm.start_in_thread(stub_vllm.default_args(port=0))
+    try:
+        counter = TokenCounter(model_name="stub-model", api_url=f"http://127.0.0.1:{server.server_address[1]}/v1/completions")
+        # The stub counts whitespace tokens; the local estimate would give 2.
+        assert counter.count("a b c d e") == 5
+    finally:
+        server.shutdown()
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+import stub_weaviate
+import weaviate_store
+
+from weaviate_store import WeaviateClient
+
+SLOW = ["Slow1", "Slow2", "Slow3"]
+
+
+@pytest.fixture(scope="module")
+def weaviate_url():
+    server = stub_weaviate.start_in_thread(stub_weaviate.default_args(port=0, class_name="Fast", docs=20, latency_ms=0))
+    for i, name in enumerate(SLOW):
+        server.RequestHandlerClass.corpus.add_synthetic(name, 20, 120, seed=i + 1)
+    server.RequestHandlerClass.class_latency_s.update({name: 5.0 for name in SLOW})
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture
+def store(weaviate_url, monkeypatch):
+    monkeypatch.setattr(weaviate_store, "FEDERATED_TIMEOUT", 0.5)
+    monkeypatch.setattr(weaviate_store, "FEDERATED_MAX_WORKERS", 2)
+    return WeaviateClient(weaviate_url, t2v_url=None)
+
+
+def test_slow_classes_do_not_hold_federation_workers(store):
+    # Two workers start on slow classes; their requests must give up after FEDERATED_TIMEOUT
+    # so the fast class still gets a worker within the 1.5s budget.
+    start = time.monotonic()
+    docs = store.query_classes("term1 term2", SLOW[:2] + ["Fast"], top_k=3, timeout=1.5, certainty=0.0)
+    assert time.monotonic() - start < 2.5
+    assert docs and {d["_additional"]["class"] for d in docs} == {"Fast"}
+
+
+def test_timed_out_queries_are_cancelled(store):
+    store.query_classes("term3", SLOW, top_k=3, timeout=0.1, certainty=0.0)
+    # Only the query already running is left; the queued ones were cancelled.
+    docs = store.query_classes("term4", ["Fast"], top_k=3, timeout=1.5, certainty=0.0)
+    assert docs and {d["_additional"]["class"] for d in docs} == {"Fast"}
+
+
+def test_single_class_queries_keep_the_default_timeout(store):
+    assert store._query_client is store.client
+
+
+def test_staging_classes_are_recognized():
+    assert WeaviateClient.is_staging_class("Docs_staging_1760000000")
+    assert not WeaviateClient.is_staging_class("Docs")
+    assert not WeaviateClient.is_staging_class("Release_staging_notes")
@@ -1,4 +1,8 @@
-import requests
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "applications", "console"))
+from load_balancer import get_load_balancer
 
 url = "http://localhost:8000/v1/completions"
 
@@ -8,7 +12,7 @@ data = {
     "max_tokens": 200,
 }
 
-response = requests.post(url, json=data)
+response = get_load_balancer().post(url, json=data)
 
 if response.status_code == 200:
     completion = response.json()
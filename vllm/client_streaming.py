@@ -1,67 +1,129 @@
 # Requires vllm serve
 #  
 
-import requests
+import os
+import sys
+
+from typing import Iterator, Optional
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "applications", "console"))
+from load_balancer import get_load_balancer
+from streaming import iter_completion_stream
 
 API_URL = "http://localhost:8000/v1/completions"
 MODELS = ["deepseek-ai/DeepSeek-R1-Distill-Qwen-32B"]
 OPTION = 0
 
-def generate_in_chunks(
+def generate_incremental(
     prompt: str,
     model: str,
-    max_tokens_per_call: int = 100,
+    max_tokens_per_call: Optional[int] = None,
     max_total_tokens: int = 500,
     temperature: float = 0.7,
     top_p: float = 0.9,
-    stop_condition=None  # Optional: function that accepts generated_text and returns True to stop
-) -> str:
+    stop_condition=None,  # Optional: function that accepts generated_text and returns True to stop
+    stats: Optional[dict] = None,
+) -> Iterator[str]:
     """
-    Generate text from the model in multiple calls, appending previous output to prompt.
+    Stream generated text as it is produced, yielding each new piece.
+
+    Generation is a single streamed request for up to `max_total_tokens`. A continuation
+    request (prompt + text so far) is only made when a request ends with
+    finish_reason "length" because of `max_tokens_per_call`. `stop_condition` is checked
+    after every streamed chunk; when it fires the connection is closed, which makes vLLM
+    abort the request instead of generating the rest.
 
     Args:
       prompt: Initial prompt string.
       model: Model name string.
-      max_tokens_per_call: Tokens to generate per request.
+      max_tokens_per_call: Optional cap on tokens per request (defaults to max_total_tokens).
       max_total_tokens: Max tokens to generate overall.
       temperature: Sampling temperature.
       top_p: Nucleus sampling parameter.
       stop_condition: Optional function(generated_text) -> bool to stop early.
+      stats: Optional dict filled with "requests", "prompt_tokens", "completion_tokens" and "finish_reason".
 
-    Returns:
-      The full generated text.
+    Yields:
+      Pieces of generated text, in order.
     """
+    stats = stats if stats is not None else {}
+    stats.update({"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "finish_reason": None})
     generated_text = ""
-    current_prompt = prompt
-    tokens_generated = 0
 
-    while tokens_generated < max_total_tokens:
+    while stats["completion_tokens"] < max_total_tokens:
+        remaining = max_total_tokens - stats["completion_tokens"]
         data = {
             "model": model,
-            "prompt": current_prompt,
-            "max_tokens": max_tokens_per_call,
+            "prompt": prompt + generated_text,
+            "max_tokens": min(max_tokens_per_call or remaining, remaining),
             "temperature": temperature,
             "top_p": top_p,
-            "stream": False
+            "stream": True,
+            "stream_options": {"include_usage": True},
         }
 
-        response = requests.post(API_URL, json=data)
-        if response.status_code != 200:
-            raise RuntimeError(f"Request failed: {response.status_code} {response.text}")
+        usage, finish_reason, chunks, stopped = None, None, 0, False
+        with get_load_balancer().post(API_URL, json=data, stream=True) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Request failed: {response.status_code} {response.text}")
+            stats["requests"] += 1
+
+            for chunk in iter_completion_stream(response):
+                usage = chunk.get("usage") or usage
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                finish_reason = choices[0].get("finish_reason") or finish_reason
+                new_text = choices[0].get("text") or ""
+                if not new_text:
+                    continue
 
-        result = response.json()
-        new_text = result['choices'][0]['text']
+                chunks += 1
+                generated_text += new_text
+                yield new_text
 
-        generated_text += new_text
-        tokens_generated += max_tokens_per_call  # Rough estimate
+                if stop_condition and stop_condition(generated_text):
+                    # Leaving the block closes the connection; vLLM aborts the request.
+                    stopped = True
+                    break
 
-        # Update prompt to include all generated text so far
-        current_prompt = prompt + generated_text
+        if usage:
+            stats["prompt_tokens"] += usage["prompt_tokens"]
+            stats["completion_tokens"] += usage["completion_tokens"]
+        else:
+            # No usage when the stream was cut short; vLLM sends one token per chunk.
+            stats["completion_tokens"] += chunks
+        stats["finish_reason"] = "stop_condition" if stopped else finish_reason
 
-        if stop_condition and stop_condition(generated_text):
+        if stopped or finish_reason != "length":
             break
 
-    return generated_text
+
+def generate_in_chunks(
+    prompt: str,
+    model: str,
+    max_tokens_per_call: Optional[int] = None,
+    max_total_tokens: int = 500,
+    temperature: float = 0.7,
+    top_p: float = 0.9,
+    stop_condition=None,  # Optional: function that accepts generated_text and returns True to stop
+    stats: Optional[dict] = None,
+) -> str:
+    """
+    Generate text incrementally and return it in full. See generate_incremental for the arguments.
+
+    Returns:
+      The full generated text.
+    """
+    return "".join(generate_incremental(
+        prompt, model,
+        max_tokens_per_call=max_tokens_per_call,
+        max_total_tokens=max_total_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        stop_condition=stop_condition,
+        stats=stats,
+    ))
 
 
 # Stop condition - stop if last char is a period.
@@ -70,5 +132,9 @@ def stop_on_period(text):
 
 if __name__ == "__main__":
     prompt = "Once upon a time, in a faraway kingdom,"
-    story = generate_in_chunks(prompt, MODELS[OPTION], max_tokens_per_call=150, max_total_tokens=600, temperature=0.3, top_p=0.95, stop_condition=stop_on_period)
-    print("Generated text:\n", story)
+    stats = {}
+    print("Generated text:")
+    for piece in generate_incremental(prompt, MODELS[OPTION], max_total_tokens=600, temperature=0.3, top_p=0.95, stop_condition=stop_on_period, stats=stats):
+        print(piece, end="", flush=True)
+    print()
+    print(f"Requests: {stats['requests']}, tokens generated: {stats['completion_tokens']}, finish reason: {stats['finish_reason']}")